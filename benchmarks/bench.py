@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+CIS Module Benchmarks
+Times every module, and the l1-server and l2-server profiles, against a
+synthetic root instead of a real OEL9 host:
+
+  - /etc, /var and /boot are overlaid with a generated tree (sshd_config,
+    pam.d, journald.conf, rsyslog, audit, grub, an rpmdb.sqlite, thousands of
+    journal files under /var/log/journal, ...); writes land in a scratch
+    upper directory, never on the host
+  - a fake /proc/sys is bind-mounted, with per-interface conf trees
+  - systemctl, dnf, rpm, sysctl, augenrules, auditctl, firewall-cmd, aide,
+    authselect and the other binaries the modules call are stubs/stub.sh with
+    a configurable latency
+
+Each case runs in its own mount namespace (unshare(1); unprivileged runs use a
+user namespace and need a kernel with overlayfs in user namespaces, 5.11+).
+"cold" is a fresh process on the unhardened tree; "warm" is a second fresh
+process on the tree the cold pass hardened.
+
+    python3 benchmarks/bench.py run -o results.json
+    python3 benchmarks/bench.py run --module ssh --module auth --repeat 5 --latency 0.02
+    python3 benchmarks/bench.py compare baseline.json results.json
+"""
+import argparse, json, os, platform, shutil, sqlite3, statistics, subprocess, sys, tempfile, time
+from datetime import datetime
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.dirname(HERE)
+sys.path.insert(0, REPO)
+
+FORMAT = 1
+PROFILES = ["l1-server", "l2-server"]
+PASSES = ("cold", "warm")
+OVERLAID = ("etc", "var", "boot")
+STUBS = ["systemctl", "dnf", "rpm", "sysctl", "augenrules", "auditctl", "firewall-cmd", "aide", "authselect",
+         "grub2-mkconfig", "update-crypto-policies", "getenforce", "setenforce", "modprobe", "sshd", "ldd"]
+
+# Overrides on top of the repo's cis_config.yaml so every code path runs
+CONFIG_OVERRIDES = {
+    "sysctl": {"per_interface": True},
+    "aide": {"initialize_if_missing": True},
+}
+
+# Fixture host: installed packages and unit states before hardening
+INSTALLED = ["audit", "audit-libs", "authselect", "libpwquality", "pam", "firewalld", "rsyslog", "openssh-server",
+             "sudo", "chrony", "cronie", "systemd", "bash", "avahi", "cups", "rpcbind", "telnet", "tftp", "xinetd"]
+UNITS = {
+    "auditd.service": ("loaded", "enabled", "active"),
+    "firewalld.service": ("loaded", "disabled", "inactive"),
+    "rsyslog.service": ("loaded", "enabled", "active"),
+    "sshd.service": ("loaded", "enabled", "active"),
+    "crond.service": ("loaded", "enabled", "active"),
+    "systemd-journald.service": ("loaded", "static", "active"),
+    "avahi-daemon.service": ("loaded", "enabled", "active"),
+    "cups.service": ("loaded", "enabled", "active"),
+    "rpcbind.service": ("loaded", "enabled", "active"),
+    "telnet.socket": ("loaded", "disabled", "inactive"),
+    "tftp.socket": ("loaded", "enabled", "active"),
+    "aidecheck.service": ("loaded", "disabled", "inactive"),
+    "aidecheck.timer": ("loaded", "disabled", "inactive"),
+    "tmp.mount": ("loaded", "static", "inactive"),
+    "var-tmp.mount": ("not-found", "", "inactive"),
+}
+
+FILES = {
+    "etc/passwd": ("root:x:0:0:root:/root:/bin/bash\nbin:x:1:1:bin:/bin:/sbin/nologin\n"
+                   "sshd:x:74:74:Privilege-separated SSH:/usr/share/empty.sshd:/sbin/nologin\n", 0o644),
+    "etc/group": ("root:x:0:\nbin:x:1:\nwheel:x:10:\nsshd:x:74:\n", 0o644),
+    "etc/shadow": ("root:!!:19000:0:99999:7:::\nbin:*:19000:0:99999:7:::\nsshd:!!:19000::::::\n", 0o644),
+    "etc/gshadow": ("root:::\nbin:::\nwheel:::\nsshd:!::\n", 0o644),
+    # Login shells (bash -lc) must keep the stub directory on PATH
+    "etc/profile": ("# /etc/profile (benchmark fixture)\numask 022\n", 0o644),
+    "etc/bashrc": ("# /etc/bashrc (benchmark fixture)\n[ -z \"$PS1\" ] && return\n", 0o644),
+    "etc/login.defs": ("MAIL_DIR\t/var/spool/mail\nUMASK\t\t022\nPASS_MAX_DAYS\t99999\nPASS_MIN_DAYS\t0\n"
+                       "PASS_WARN_AGE\t7\nUID_MIN\t\t1000\nUID_MAX\t\t60000\nENCRYPT_METHOD SHA512\n", 0o644),
+    "etc/ssh/sshd_config": ("Include /etc/ssh/sshd_config.d/*.conf\n#Port 22\n#PermitRootLogin prohibit-password\n"
+                            "AuthorizedKeysFile\t.ssh/authorized_keys\nPasswordAuthentication yes\n"
+                            "Subsystem\tsftp\t/usr/libexec/openssh/sftp-server\n", 0o644),
+    "etc/ssh/sshd_config.d/50-redhat.conf": ("Include /etc/crypto-policies/back-ends/opensshserver.config\n"
+                                             "SyslogFacility AUTHPRIV\nChallengeResponseAuthentication no\n"
+                                             "GSSAPIAuthentication yes\nUsePAM yes\nX11Forwarding yes\n", 0o600),
+    "etc/pam.d/system-auth": ("auth        required      pam_env.so\n"
+                              "auth        sufficient    pam_unix.so try_first_pass nullok\n"
+                              "auth        required      pam_deny.so\n"
+                              "account     required      pam_unix.so\n"
+                              "password    requisite     pam_pwquality.so local_users_only\n"
+                              "password    sufficient    pam_unix.so sha512 shadow nullok use_authtok\n"
+                              "password    required      pam_deny.so\n"
+                              "session     optional      pam_keyinit.so revoke\n"
+                              "session     required      pam_limits.so\n"
+                              "session     required      pam_unix.so\n", 0o644),
+    "etc/pam.d/login": ("auth       substack     system-auth\naccount    include      system-auth\n"
+                        "password   include      system-auth\nsession    include      system-auth\n", 0o644),
+    "etc/pam.d/sshd": ("auth       substack     password-auth\naccount    include      password-auth\n"
+                       "session    include      password-auth\n", 0o644),
+    "etc/pam.d/su": ("auth\t\tsufficient\tpam_rootok.so\n#auth\t\trequired\tpam_wheel.so use_uid\n"
+                     "auth\t\tsubstack\tsystem-auth\n", 0o644),
+    "etc/security/pwquality.conf": ("# minlen = 8\n# minclass = 0\n# dcredit = 0\n# ucredit = 0\n", 0o644),
+    "etc/security/pwhistory.conf": ("# remember = 10\n", 0o644),
+    "etc/security/faillock.conf": ("# deny = 3\n# unlock_time = 600\n", 0o644),
+    "etc/security/limits.conf": ("# /etc/security/limits.conf\n", 0o644),
+    "etc/systemd/journald.conf": ("[Journal]\n#Storage=auto\n#Compress=yes\n#SystemMaxUse=\n#ForwardToSyslog=no\n", 0o644),
+    "etc/rsyslog.conf": ("module(load=\"imjournal\" StateFile=\"imjournal.state\")\n"
+                         "*.info;mail.none;authpriv.none;cron.none  /var/log/messages\n"
+                         "authpriv.*  /var/log/secure\ncron.*  /var/log/cron\n", 0o644),
+    "etc/audit/auditd.conf": ("log_file = /var/log/audit/audit.log\nlog_format = ENRICHED\nmax_log_file = 8\n"
+                              "num_logs = 5\nmax_log_file_action = ROTATE\nspace_left_action = SYSLOG\n"
+                              "admin_space_left_action = SUSPEND\n", 0o640),
+    "etc/audit/rules.d/audit.rules": ("-D\n-b 8192\n-f 1\n--backlog_wait_time 60000\n", 0o600),
+    "etc/default/grub": ("GRUB_TIMEOUT=5\nGRUB_DISTRIBUTOR=\"$(sed 's, release .*$,,g' /etc/system-release)\"\n"
+                         "GRUB_DEFAULT=saved\nGRUB_CMDLINE_LINUX=\"crashkernel=1G-4G:192M rhgb quiet\"\n"
+                         "GRUB_ENABLE_BLSCFG=true\n", 0o644),
+    "etc/selinux/config": ("SELINUX=permissive\nSELINUXTYPE=targeted\n", 0o644),
+    "etc/crypto-policies/config": ("LEGACY\n", 0o644),
+    "etc/crypto-policies/state/current": ("LEGACY\n", 0o644),
+    "etc/sudoers": ("Defaults   !visiblepw\nroot\tALL=(ALL) \tALL\n%wheel\tALL=(ALL)\tALL\n"
+                    "#includedir /etc/sudoers.d\n", 0o440),
+    "etc/issue": ("\\S\nKernel \\r on an \\m\n", 0o644),
+    "etc/issue.net": ("\\S\nKernel \\r on an \\m\n", 0o644),
+    "etc/motd": ("", 0o644),
+    "etc/crontab": ("SHELL=/bin/bash\nPATH=/sbin:/bin:/usr/sbin:/usr/bin\nMAILTO=root\n", 0o644),
+    "etc/hosts.allow": ("# hosts.allow\n", 0o644),
+    "etc/hosts.deny": ("# hosts.deny\n", 0o644),
+    "etc/fstab": ("/dev/mapper/ol-root  /  xfs  defaults  0 0\nUUID=0000-0000  /boot  xfs  defaults  0 0\n", 0o644),
+    "boot/grub2/grub.cfg": ("# generated by grub2-mkconfig\n", 0o644),
+    "var/log/messages": ("", 0o644),
+    "var/log/secure": ("", 0o644),
+    "var/log/cron": ("", 0o644),
+    "var/log/wtmp": ("", 0o664),
+    "var/log/btmp": ("", 0o660),
+    "var/log/lastlog": ("", 0o644),
+    "var/log/audit/audit.log": ("", 0o644),
+}
+DIRS = ["etc/sysctl.d", "etc/modprobe.d", "etc/sudoers.d", "etc/profile.d", "etc/security/limits.d",
+        "etc/security/pwquality.conf.d", "etc/cron.d", "etc/cron.hourly", "etc/cron.daily", "etc/cron.weekly",
+        "etc/cron.monthly", "etc/systemd/system", "var/lib/aide", "var/lib/cis-bench", "var/tmp"]
+
+def _flip(v: str) -> str:
+    """A deviating starting value for a sysctl key"""
+    return "0" if v != "0" else "1"
+
+def sysctl_keys() -> dict:
+    from modules import sysctl
+    keys = dict(sysctl.L1)
+    keys.update(sysctl.L2)
+    keys.update({"fs.suid_dumpable": "0", "net.ipv6.conf.all.disable_ipv6": "1",
+                 "net.ipv6.conf.default.disable_ipv6": "1"})
+    return keys
+
+def build_root(root: str, psys: str, journal_files: int, interfaces: int):
+    """Write the unhardened fixture tree (root/{etc,var,boot}) and the fake /proc/sys"""
+    for d in DIRS:
+        os.makedirs(os.path.join(root, d), exist_ok=True)
+    for rel, (content, mode) in FILES.items():
+        path = os.path.join(root, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.chmod(path, mode)
+
+    # Persistent journal: a few machine IDs, rotated files with loose modes
+    jdir = os.path.join(root, "var/log/journal")
+    for i in range(journal_files):
+        mid = os.path.join(jdir, f"{(i % 3) + 1:032x}")
+        if i < 3:
+            os.makedirs(mid, exist_ok=True)
+        name = "system.journal" if i < 3 else f"system@{i:016x}-{i:016x}.journal~"
+        path = os.path.join(mid, name)
+        with open(path, "wb") as f:
+            f.write(b"LPKSHHRH" + bytes(56))
+        os.chmod(path, 0o644 if i % 2 else 0o640)
+
+    os.makedirs(os.path.join(root, "var/lib/rpm"), exist_ok=True)
+    db = sqlite3.connect(os.path.join(root, "var/lib/rpm/rpmdb.sqlite"))
+    db.execute("CREATE TABLE Name (key TEXT NOT NULL, hnum INTEGER NOT NULL, idx INTEGER NOT NULL)")
+    db.executemany("INSERT INTO Name VALUES (?, ?, 0)", [(p, i + 1) for i, p in enumerate(INSTALLED)])
+    db.commit()
+    db.close()
+
+    udir = os.path.join(root, "var/lib/cis-bench/units")
+    os.makedirs(udir, exist_ok=True)
+    for unit, (load, ufs, active) in UNITS.items():
+        if load != "not-found":
+            with open(os.path.join(udir, unit), "w") as f:
+                f.write(f"LoadState={load}\nUnitFileState={ufs}\nActiveState={active}\n")
+
+    from modules.sysctl import interface_params
+    keys = sysctl_keys()
+    values = {k: _flip(v) for k, v in keys.items()}
+    names = ["lo"] + [f"eth{i}" for i in range(max(interfaces - 1, 0))]
+    for family, params in interface_params(keys).items():
+        for ifname in names:
+            for param, want in params.items():
+                values[f"net.{family}.conf.{ifname}.{param}"] = _flip(want)
+    for k, v in values.items():
+        path = os.path.join(psys, *k.split("."))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(v + "\n")
+
+def make_bin(bindir: str):
+    os.makedirs(bindir, exist_ok=True)
+    for name in STUBS:
+        os.symlink(os.path.join(HERE, "stubs", "stub.sh"), os.path.join(bindir, name))
+
+# Inside the namespace
+
+def _mount(*args: str):
+    subprocess.run(["mount"] + list(args), check=True)
+
+def run_case(a) -> dict:
+    """Mount the synthetic root over this namespace, run one case and return its measurements"""
+    for top in OVERLAID:
+        for d in (os.path.join(a.upper, top), os.path.join(a.work, top)):
+            os.makedirs(d, exist_ok=True)
+        _mount("-t", "overlay", "overlay", "-o",
+               f"lowerdir={os.path.join(a.lower, top)}:/{top},upperdir={os.path.join(a.upper, top)},"
+               f"workdir={os.path.join(a.work, top)}", f"/{top}")
+    _mount("--bind", a.psys, "/proc/sys")
+    if not all(os.path.ismount(p) for p in ["/" + t for t in OVERLAID] + ["/proc/sys"]):
+        raise SystemExit("synthetic root is not mounted; refusing to run against the host")
+    os.environ["PATH"] = a.bin + os.pathsep + os.environ.get("PATH", "/usr/bin:/bin")
+    os.environ["CIS_LOG_LEVEL"] = "WARNING"
+    # bash -lc must not pick up the invoking user's login profile
+    os.environ["HOME"] = "/var/lib/cis-bench"
+
+    import cis_apply_enhanced as runner
+    from modules import executor
+    from modules.pkgplan import PackagePlan
+    kind, name = a.case.split(":", 1)
+    profile = name if kind == "profile" else "l2-server"
+    if kind == "module":
+        runner.PROFILES[profile] = [name]
+    cfg = runner.load_config(os.path.join(REPO, runner.DEFAULT_CONFIG))
+    for section, values in CONFIG_OVERRIDES.items():
+        cfg.setdefault(section, {}).update(values)
+    ex = executor.configure(dry_run=False)
+    timings: dict = {}
+
+    t0 = time.perf_counter()
+    facts = runner.collect_facts(profile)
+    t1 = time.perf_counter()
+    results, ok = runner.apply_modules(profile, cfg, dry_run=False, jobs=a.jobs, facts=facts,
+                                       plan=PackagePlan(), timings=timings)
+    t2 = time.perf_counter()
+    return {
+        "elapsed": t2 - t0,
+        "facts": t1 - t0,
+        "modules": {m: t["duration"] for m, t in timings.items()},
+        "controls": len(results),
+        "changed": sum(1 for r in results if r.changed),
+        "failed": sorted(r.id for r in results if not r.ok),
+        "commands": len(ex.history),
+        "subprocesses": sum(r.subprocesses for r in results),
+        "bytes_read": sum(r.bytes_read for r in results),
+        "bytes_written": sum(r.bytes_written for r in results),
+    }
+
+# Driver
+
+def _spawn(case: str, lower: str, scratch: str, bindir: str, jobs: int, env: dict) -> dict:
+    cmd = ["unshare", "--mount", "--propagation", "private"]
+    if os.geteuid() != 0:
+        cmd.append("--map-root-user")
+    cmd += [sys.executable, os.path.abspath(__file__), "_case", "--case", case, "--lower", lower,
+            "--upper", os.path.join(scratch, "upper"), "--work", os.path.join(scratch, "work"),
+            "--psys", os.path.join(scratch, "psys"), "--bin", bindir, "--jobs", str(jobs)]
+    cp = subprocess.run(cmd, capture_output=True, text=True, env=env)
+    if cp.returncode != 0:
+        raise RuntimeError(f"{case} failed (rc={cp.returncode}):\n{cp.stderr.strip()[-2000:]}")
+    return json.loads(cp.stdout.strip().splitlines()[-1])
+
+def _summary(runs: list) -> dict:
+    times = [r["elapsed"] for r in runs]
+    out = {"median": statistics.median(times), "min": min(times), "max": max(times), "runs": times}
+    first = runs[0]
+    out.update({k: first[k] for k in ("controls", "changed", "failed", "commands", "subprocesses",
+                                      "bytes_read", "bytes_written")})
+    out["facts"] = statistics.median(r["facts"] for r in runs)
+    out["modules"] = {m: statistics.median(r["modules"][m] for r in runs) for m in first["modules"]}
+    return out
+
+def _git_rev() -> str:
+    try:
+        return subprocess.run(["git", "-C", REPO, "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True).stdout.strip()
+    except OSError:
+        return ""
+
+def cmd_run(a) -> int:
+    import cis_apply_enhanced as runner
+    modules = a.module or sorted({m for p in PROFILES for m in runner.PROFILES[p]})
+    profiles = a.profile if a.profile is not None else PROFILES
+    cases = [f"module:{m}" for m in modules] + [f"profile:{p}" for p in profiles]
+
+    env = dict(os.environ, CIS_BENCH_LATENCY=str(a.latency))
+    for spec in a.latency_for:
+        name, _, secs = spec.partition("=")
+        env["CIS_BENCH_LATENCY_" + name.upper().replace("-", "_")] = secs
+
+    base = tempfile.mkdtemp(prefix="cis-bench-", dir=a.workdir)
+    try:
+        lower, template, bindir = (os.path.join(base, d) for d in ("root", "psys", "bin"))
+        t = time.perf_counter()
+        build_root(lower, template, a.journal_files, a.interfaces)
+        make_bin(bindir)
+        print(f"Synthetic root built in {time.perf_counter() - t:.2f}s ({a.journal_files} journal files, "
+              f"{a.interfaces} interfaces)", file=sys.stderr)
+
+        results = {}
+        for case in cases:
+            runs = {p: [] for p in PASSES}
+            for _ in range(a.repeat):
+                scratch = tempfile.mkdtemp(prefix="case-", dir=base)
+                shutil.copytree(template, os.path.join(scratch, "psys"))
+                for p in PASSES:
+                    runs[p].append(_spawn(case, lower, scratch, bindir, a.jobs, env))
+                shutil.rmtree(scratch)
+            results[case] = {p: _summary(runs[p]) for p in PASSES}
+            print(f"  {case:24} cold {results[case]['cold']['median']:8.3f}s  "
+                  f"warm {results[case]['warm']['median']:8.3f}s", file=sys.stderr)
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+    report = {
+        "format": FORMAT,
+        "created": datetime.now().isoformat(),
+        "commit": _git_rev(),
+        "host": {"kernel": platform.release(), "machine": platform.machine(), "python": platform.python_version(),
+                 "cpus": os.cpu_count()},
+        "settings": {"latency": a.latency, "latency_for": sorted(a.latency_for), "journal_files": a.journal_files,
+                     "interfaces": a.interfaces, "repeat": a.repeat, "jobs": a.jobs},
+        "cases": results,
+    }
+    with open(a.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f"Results written to {a.output}", file=sys.stderr)
+    return 0
+
+def cmd_compare(a) -> int:
+    with open(a.old) as f:
+        old = json.load(f)
+    with open(a.new) as f:
+        new = json.load(f)
+    if old.get("settings") != new.get("settings"):
+        print("warning: runs used different settings; timings are not directly comparable")
+    regressions = 0
+    print(f"{'Case':26} {'Pass':5} {'Old':>9} {'New':>9} {'Delta':>8}")
+    for case in sorted(set(old["cases"]) | set(new["cases"])):
+        for p in PASSES:
+            o = old["cases"].get(case, {}).get(p, {}).get("median")
+            n = new["cases"].get(case, {}).get(p, {}).get("median")
+            if o is None or n is None:
+                print(f"{case:26} {p:5} {'-' if o is None else f'{o:9.3f}':>9} {'-' if n is None else f'{n:9.3f}':>9}")
+                continue
+            delta = (n - o) / o if o else 0.0
+            flag = ""
+            if n - o > a.min_delta and delta > a.threshold:
+                flag = "  REGRESSION"
+                regressions += 1
+            print(f"{case:26} {p:5} {o:9.3f} {n:9.3f} {delta:+8.1%}{flag}")
+    print(f"\n{regressions} regression(s) above {a.threshold:.0%} and {a.min_delta * 1000:.0f} ms")
+    return 1 if regressions else 0
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Benchmark CIS modules against a synthetic root")
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    r = sub.add_parser("run", help="Run the benchmark suite")
+    r.add_argument("-o", "--output", default="bench-results.json", help="Results file (default: bench-results.json)")
+    r.add_argument("--module", action="append", default=[], help="Only this module (repeatable; default: all)")
+    r.add_argument("--profile", action="append", default=None, choices=PROFILES,
+                   help="Only this profile (repeatable; default: both)")
+    r.add_argument("--no-profiles", dest="profile", action="store_const", const=[], help="Skip the profile runs")
+    r.add_argument("--repeat", type=int, default=3, help="Runs per case and pass (default: 3)")
+    r.add_argument("--latency", type=float, default=0.005, help="Seconds each stub call takes (default: 0.005)")
+    r.add_argument("--latency-for", action="append", default=[], metavar="NAME=SECONDS",
+                   help="Per-binary stub latency, e.g. dnf=2 (repeatable)")
+    r.add_argument("--journal-files", type=int, default=3000, help="Files under /var/log/journal (default: 3000)")
+    r.add_argument("--interfaces", type=int, default=16, help="Network interfaces in the fake /proc/sys (default: 16)")
+    r.add_argument("--jobs", type=int, default=1, help="--jobs passed to the runner (default: 1)")
+    r.add_argument("--workdir", default=None, help="Scratch directory (must not be on overlayfs)")
+
+    c = sub.add_parser("compare", help="Compare two results files")
+    c.add_argument("old")
+    c.add_argument("new")
+    c.add_argument("--threshold", type=float, default=0.10, help="Relative slowdown to flag (default: 0.10)")
+    c.add_argument("--min-delta", type=float, default=0.005, help="Ignore slowdowns below this many seconds")
+
+    i = sub.add_parser("_case")
+    for opt in ("case", "lower", "upper", "work", "psys", "bin"):
+        i.add_argument("--" + opt, required=True)
+    i.add_argument("--jobs", type=int, default=1)
+
+    a = ap.parse_args()
+    if a.command == "_case":
+        print(json.dumps(run_case(a)))
+        return 0
+    return cmd_run(a) if a.command == "run" else cmd_compare(a)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+#!/bin/sh
+# Multi-call stand-in for the system binaries the CIS modules run. The
+# benchmark links it under each binary's name; it sleeps for the configured
+# latency, keeps whatever state later calls need under $CIS_BENCH_STATE and
+# prints output in the shape the modules parse.
+#
+#   CIS_BENCH_LATENCY=0.005            default seconds per call
+#   CIS_BENCH_LATENCY_FIREWALL_CMD=0.2 per binary (upper case, - becomes _)
+name=${0##*/}
+state=${CIS_BENCH_STATE:-/var/lib/cis-bench}
+var=$(printf '%s' "$name" | tr 'a-z0-9-' 'A-Z0-9_')
+eval "delay=\${CIS_BENCH_LATENCY_$var:-\${CIS_BENCH_LATENCY:-0}}"
+[ "$delay" = 0 ] || sleep "$delay"
+mkdir -p "$state"
+echo "$name $*" >> "$state/calls.log"
+
+# Non-option arguments after the first one
+operands() {
+    shift
+    for a in "$@"; do
+        case "$a" in -*) ;; *) echo "$a";; esac
+    done
+}
+
+unit_state() {
+    printf 'LoadState=%s\nUnitFileState=%s\nActiveState=%s\n' "$2" "$3" "$4" > "$state/units/$1"
+}
+
+case "$name" in
+systemctl)
+    mkdir -p "$state/units"
+    verb=$1
+    case "$verb" in
+    show)
+        shift
+        while [ $# -gt 0 ]; do
+            case "$1" in
+            -p) shift;;
+            -*) ;;
+            *) if [ -f "$state/units/$1" ]; then cat "$state/units/$1"
+               else printf 'LoadState=not-found\nUnitFileState=\nActiveState=inactive\n'; fi
+               echo;;
+            esac
+            shift
+        done;;
+    enable)
+        for u in $(operands "$@"); do
+            if [ ! -f "$state/units/$u" ]; then echo "Failed to enable unit: Unit file $u does not exist." >&2; exit 1; fi
+            unit_state "$u" loaded enabled active
+        done;;
+    disable)
+        for u in $(operands "$@"); do
+            [ -f "$state/units/$u" ] && unit_state "$u" loaded disabled inactive
+        done;;
+    mask)
+        for u in $(operands "$@"); do unit_state "$u" masked masked inactive; done;;
+    daemon-reload)
+        # Pick up unit files written under /etc/systemd/system
+        for f in /etc/systemd/system/*.service /etc/systemd/system/*.mount /etc/systemd/system/*.socket \
+                 /etc/systemd/system/*.timer; do
+            [ -f "$f" ] && [ ! -f "$state/units/${f##*/}" ] && unit_state "${f##*/}" loaded disabled inactive
+        done;;
+    is-enabled)
+        u=$(operands "$@" | head -n1)
+        sed -n 's/^UnitFileState=//p' "$state/units/$u" 2>/dev/null | grep . || { echo not-found; exit 1; };;
+    is-active)
+        u=$(operands "$@" | head -n1)
+        grep -q '^ActiveState=active' "$state/units/$u" 2>/dev/null && echo active || { echo inactive; exit 3; };;
+    esac;;
+dnf|rpm)
+    # The package set lives in the fixture rpmdb.sqlite, which the modules read directly
+    if [ "$name" = dnf ] && [ "$2" = shell ]; then script=$(cat); else script=; fi
+    exec python3 - "$name" "$script" "$@" <<'EOF'
+import sqlite3, sys
+prog, script, args = sys.argv[1], sys.argv[2], [a for a in sys.argv[3:] if not a.startswith("-")]
+db = sqlite3.connect("/var/lib/rpm/rpmdb.sqlite")
+have = {r[0] for r in db.execute("SELECT key FROM Name")}
+if prog == "rpm":
+    if "%{NAME}\n" in args:
+        args.remove("%{NAME}\n")
+    names = sorted(have) if "-qa" in sys.argv else args
+    for n in names:
+        print(n if n in have else f"package {n} is not installed")
+    sys.exit(0 if all(n in have for n in names) else 1)
+steps = [ln.split() for ln in script.splitlines()] if args[:1] == ["shell"] else [args]
+for step in steps:
+    if step and step[0] == "install":
+        for n in step[1:]:
+            if n not in have:
+                db.execute("INSERT INTO Name VALUES (?, ?, 0)", (n, len(have) + 1))
+                have.add(n)
+                print(f"Installed: {n}")
+    elif step and step[0] == "remove":
+        for n in step[1:]:
+            if n in have:
+                db.execute("DELETE FROM Name WHERE key = ?", (n,))
+                have.discard(n)
+                print(f"Removed: {n}")
+db.commit()
+print("Complete!")
+EOF
+    ;;
+sysctl)
+    for a in "$@"; do
+        case "$a" in
+        *=*) k=${a%%=*}; printf '%s\n' "${a#*=}" > "/proc/sys/$(echo "$k" | tr . /)" || exit 1;;
+        -*) ;;
+        *) cat "/proc/sys/$(echo "$a" | tr . /)" || exit 1;;
+        esac
+    done;;
+augenrules)
+    case "$1" in
+    --load)
+        cat /etc/audit/rules.d/*.rules > /etc/audit/audit.rules 2>/dev/null
+        grep -E '^-[aw] ' /etc/audit/audit.rules > "$state/audit.loaded" 2>/dev/null
+        grep -qx -- '-e 2' /etc/audit/audit.rules && touch "$state/audit.immutable";;
+    esac;;
+auditctl)
+    case "$1" in
+    -l) if [ -s "$state/audit.loaded" ]; then cat "$state/audit.loaded"; else echo "No rules"; fi;;
+    -s) if [ -f "$state/audit.immutable" ]; then echo "enabled 2"; else echo "enabled 1"; fi;;
+    esac;;
+firewall-cmd)
+    fw=$state/firewalld
+    mkdir -p "$fw"
+    [ -f "$fw/zone" ] || echo public > "$fw/zone"
+    [ -f "$fw/services" ] || printf 'cockpit\ndhcpv6-client\nssh\n' > "$fw/services"
+    touch "$fw/ports"
+    for a in "$@"; do
+        case "$a" in
+        --state) echo running;;
+        --get-default-zone) cat "$fw/zone";;
+        --set-default-zone=*) echo "${a#*=}" > "$fw/zone";;
+        --set-default-zone) setzone=1; continue;;
+        --list-services) tr '\n' ' ' < "$fw/services"; echo;;
+        --list-ports) tr '\n' ' ' < "$fw/ports"; echo;;
+        --add-service=*) echo "${a#*=}" >> "$fw/services";;
+        --remove-service=*) grep -vx "${a#*=}" "$fw/services" > "$fw/.tmp"; mv "$fw/.tmp" "$fw/services";;
+        --add-port=*) echo "${a#*=}" >> "$fw/ports";;
+        --remove-port=*) grep -vx "${a#*=}" "$fw/ports" > "$fw/.tmp"; mv "$fw/.tmp" "$fw/ports";;
+        -*) ;;
+        *) [ -n "$setzone" ] && echo "$a" > "$fw/zone";;
+        esac
+        setzone=
+    done
+    case " $* " in *" --add-"*|*" --remove-"*|*" --set-"*|*" --reload "*) echo success;; esac;;
+aide)
+    case " $* " in
+    *" --init "*|*" -i "*) mkdir -p /var/lib/aide && : > /var/lib/aide/aide.db.new.gz
+        echo "AIDE initialized database at /var/lib/aide/aide.db.new.gz";;
+    esac;;
+authselect)
+    cur=$state/authselect
+    [ -f "$cur" ] || printf 'Profile ID: sssd\nEnabled features:\n- with-silent-lastlog\n' > "$cur"
+    case "$1" in
+    current) cat "$cur";;
+    enable-feature) grep -qx -- "- $2" "$cur" || echo "- $2" >> "$cur";;
+    esac;;
+grub2-mkconfig)
+    [ "$1" = -o ] && { mkdir -p "$(dirname "$2")"; echo "# generated by grub2-mkconfig" > "$2"; }
+    echo done >&2;;
+update-crypto-policies)
+    case "$1" in
+    --show) cat /etc/crypto-policies/config;;
+    --set) echo "$2" > /etc/crypto-policies/config; mkdir -p /etc/crypto-policies/state
+        echo "$2" > /etc/crypto-policies/state/current
+        echo "Setting system policy to $2";;
+    esac;;
+getenforce) echo Enforcing;;
+modprobe)
+    case "$1" in -n) echo "install /bin/true";; esac;;
+ldd)
+    printf '\tlinux-vdso.so.1 (0x00007ffc)\n\tlibc.so.6 => /lib64/libc.so.6 (0x00007f00)\n';;
+sshd|setenforce) ;;
+*)
+    echo "$name: no stub behaviour" >&2;;
+esac
+exit 0
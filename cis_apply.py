@@ -3,6 +3,7 @@ import argparse, json, os, sys, importlib
 from typing import Dict, Any
 import yaml
 from modules.utils import is_root
+from modules import executor, postactions, sysctl
 
 DEFAULT_CONFIG = "cis_config.yaml"
 
@@ -34,21 +35,26 @@ def main():
         print("ERROR: must run as root (sudo).", file=sys.stderr)
         sys.exit(2)
 
+    executor.configure(dry_run=args.dry_run)
     cfg=load_config(args.config)
     results=[]
     overall_ok=True
+    sysctl.reset()
+    postactions.reset()
     for modname in PROFILES[args.profile]:
         mod=importlib.import_module(f"modules.{modname}")
         res = mod.apply(cfg.get(modname, {}), dry_run=args.dry_run, profile=args.profile)
         results.extend(res)
-        if any((not r.ok) for r in res):
-            overall_ok=False
+    sysctl.flush(args.dry_run)
+    results.extend(postactions.flush(args.dry_run))
+    if any((not r.ok) for r in results):
+        overall_ok=False
 
     report = {
         "profile": args.profile,
         "dry_run": args.dry_run,
         "host": os.uname().nodename,
-        "results": [r.__dict__ for r in results],
+        "results": [r.to_dict() for r in results],
         "ok": overall_ok
     }
     txt=json.dumps(report, indent=2)
@@ -3,11 +3,16 @@
 Enhanced CIS Oracle Enterprise Linux 9 Hardening Script
 With improved error handling, validation, and control mapping
 """
-import argparse, json, os, sys, importlib, logging
+import argparse, contextlib, heapq, json, os, shlex, sys, importlib, logging, threading, time
 from typing import Dict, Any, List, Tuple
 from datetime import datetime
 import yaml
-from modules.utils import is_root
+from modules.utils import is_root, offline
+from modules import scheduler
+from modules.facts import HostFacts
+from modules.pkgplan import PackagePlan
+from modules.state import StateStore
+from modules import accounting, executor, firstboot, fleet, pkgplan, postactions, state, sysctl, trace, utils
 
 DEFAULT_CONFIG = "cis_config.yaml"
 LOG_LEVEL = os.environ.get("CIS_LOG_LEVEL", "INFO")
@@ -28,6 +33,7 @@ CONTROL_MAPPING = {
     # Kernel and Boot Security
     "KERN-1": "1.1.1-1.1.24",
     "SYSCTL-1": "3.1.1-3.3.2",
+    "SYSCTL-IF": "3.1.1-3.3.2",
     
     # Cryptography
     "CRYPTO-1": "1.5.1",
@@ -58,12 +64,17 @@ CONTROL_MAPPING = {
     "AUD-1": "4.1.1",
     "AUD-2": "4.1.2",
     "AUD-3": "4.1.3-4.1.18",
+    "AUD-4": "4.1.3.6",
+    "AUD-5": "4.1.3.21",
     "LOG-1": "4.2.2.1",
     "LOG-2": "4.2.1.1",
     "LOG-3": "4.2.1.2",
     
     # File Integrity and Permissions
     "PERM-1": "5.6.1-5.6.5",
+    "FS-1": "7.1.11",
+    "FS-2": "7.1.12",
+    "FS-3": "7.1.13",
     "AIDE-1": "6.2.1",
     "AIDE-2": "6.2.1",
     
@@ -107,6 +118,7 @@ PROFILES = {
         "audit",
         "logging",
         "fileperms",
+        "fsscan",
         "firewalld"
     ],
     "l2-server": [
@@ -121,6 +133,7 @@ PROFILES = {
         "audit",
         "logging",
         "fileperms",
+        "fsscan",
         "firewalld",
         "selinux",
         "auth",
@@ -133,7 +146,13 @@ PROFILES = {
 }
 
 def load_config(path: str) -> Dict[str, Any]:
-    """Load configuration from YAML file"""
+    """Load configuration from YAML file ("-" reads it from stdin)"""
+    if path == "-":
+        try:
+            return yaml.safe_load(sys.stdin) or {}
+        except Exception as e:
+            logger.error(f"Failed to load config from stdin: {e}")
+            return {}
     if not os.path.exists(path):
         logger.warning(f"Config file not found: {path}, using defaults")
         return {}
@@ -148,52 +167,223 @@ def load_config(path: str) -> Dict[str, Any]:
 
 def get_system_info() -> Dict[str, str]:
     """Gather system information for reporting"""
-    return {
+    info = {
         "hostname": os.uname().nodename,
         "kernel": os.uname().release,
         "machine": os.uname().machine,
         "timestamp": datetime.now().isoformat(),
     }
+    if offline():
+        info["root"] = utils.ROOT
+    return info
 
-def apply_modules(profile: str, cfg: Dict[str, Any], dry_run: bool) -> Tuple[List[Any], bool]:
+def collect_facts(profile: str) -> HostFacts:
+    """Probe host state once so modules share a single snapshot"""
+    units = set()
+    for modname in PROFILES.get(profile, []):
+        try:
+            mod = importlib.import_module(f"modules.{modname}")
+        except ImportError:
+            continue
+        units.update(r.split(":", 1)[1] for r in getattr(mod, "WRITES", []) if r.startswith("unit:"))
+    with trace.span("collect facts", "phase"):
+        facts = HostFacts(units=sorted(units)).collect()
+    logger.info(f"Collected host facts: {len(facts.packages)} packages, {len(facts.units)} units, "
+                f"{len(facts.kmods)} kernel modules, {len(facts.mounts)} mounts")
+    return facts
+
+def check_module(mod: Any, cfg: Dict[str, Any], profile: str, facts: HostFacts) -> List[Any]:
+    """
+    Read-only compliance probe for one module: its own check() when it has one,
+    otherwise its dry-run, which reports changed=True for every deviation
+    """
+    if hasattr(mod, "check"):
+        return mod.check(cfg, profile=profile, facts=facts)
+    return mod.apply(cfg, dry_run=True, profile=profile, facts=facts)
+
+def compliant(r: Any) -> bool:
+    return r.ok and not r.changed
+
+def apply_modules(profile: str, cfg: Dict[str, Any], dry_run: bool, jobs: int = 1,
+                  facts: HostFacts = None, plan: PackagePlan = None,
+                  store: StateStore = None, force: bool = False,
+                  verify: bool = False, timings: Dict[str, Any] = None,
+                  stream: "JsonlReport" = None) -> Tuple[List[Any], bool]:
     """
     Apply all modules in the specified profile
+    Independent modules run concurrently on up to `jobs` workers; results are
+    always returned in profile order. Modules share the `facts` snapshot, which
+    is invalidated for whatever a module reports having changed. Package
+    installs/removals are merged into `plan` and run as one transaction first.
+    With a `store`, modules whose fingerprint is unchanged reuse their previous
+    results (`force` re-runs everything but still refreshes the store).
+    With `verify`, modules are only checked (see check_module), nothing is
+    executed or queued, and overall_ok means every control is compliant.
+    Per-module time, subprocess and I/O totals are stored in `timings`
+    (each result carries its own share).
+    With a `stream`, each module's results are written out as soon as the
+    module finishes, except those the sysctl/post-action flushes may still
+    change, which follow once those have run. Written results are dropped
+    (the stream keeps the counts), so results_list is empty, and memory does
+    not grow with the result count unless a `store` needs them.
     Returns: (results_list, overall_ok)
     """
     results = []
     overall_ok = True
     module_list = PROFILES.get(profile, [])
+    dry_run = dry_run or verify
+    timings = timings if timings is not None else {}
     
-    logger.info(f"Starting {profile} hardening {'(DRY-RUN)' if dry_run else '(APPLY)'}")
-    logger.info(f"Will apply {len(module_list)} modules")
+    logger.info(f"Starting {profile} hardening {'(VERIFY)' if verify else '(DRY-RUN)' if dry_run else '(APPLY)'}")
+    logger.info(f"Will apply {len(module_list)} modules with {jobs} worker(s)")
     
+    mods = {}
     for modname in module_list:
         try:
             logger.info(f"Loading module: {modname}")
-            mod = importlib.import_module(f"modules.{modname}")
-            res = mod.apply(cfg.get(modname, {}), dry_run=dry_run, profile=profile)
-            
-            # Add CIS control mapping
-            for r in res:
-                if hasattr(r, 'id') and r.id in CONTROL_MAPPING:
-                    if not hasattr(r, 'cis_control'):
-                        r.cis_control = CONTROL_MAPPING[r.id]
-            
-            results.extend(res)
-            
-            # Check if any control failed
-            if any((not r.ok) for r in res):
-                overall_ok = False
-                logger.error(f"Module {modname} had failures")
-            else:
-                logger.info(f"Module {modname} completed successfully")
-                
+            mods[modname] = importlib.import_module(f"modules.{modname}")
         except ImportError as e:
             logger.error(f"Failed to import module {modname}: {e}")
             overall_ok = False
-        except Exception as e:
-            logger.error(f"Error applying module {modname}: {e}")
+    
+    facts = facts or HostFacts()
+    
+    # Resolve every module's package needs into one transaction up front
+    plan = (plan if plan is not None else PackagePlan()).add_modules(mods)
+    plan.resolve(facts.packages)
+    with accounting.scope() as acc, trace.span("package plan", "phase"):
+        if not verify and not plan.execute(dry_run):
+            logger.error("Planned package transaction failed")
+            overall_ok = False
+    timings["(package plan)"] = acc.to_dict()
+    if plan.executed:
+        facts.invalidate("packages")
+    pkgplan.activate(plan)
+    sysctl.reset()
+    postactions.reset()
+    firstboot.reset()
+    
+    returned = {}
+    pending = {}  # streamed: results the flushes may still change, written afterwards
+    early = {}    # streamed: (any failed, any not compliant) among the results already written
+    
+    def _apply(modname, mod):
+        acc = None
+        try:
+            with accounting.scope() as acc, trace.span(modname, "module") as sp:
+                res = _run(modname, mod)
+                sp.update(controls=len(res), reused=store is not None and modname in store.reused)
+        finally:
+            if acc is not None:
+                timings[modname] = acc.to_dict()
+        # Add CIS control mapping
+        for r in res:
+            if r.cis_control is None and r.id in CONTROL_MAPPING:
+                r.cis_control = CONTROL_MAPPING[r.id]
+        if stream is not None:
+            held = [sysctl.holds(r) or postactions.holds(r) or firstboot.holds(r) for r in res]
+            done = [r for r, h in zip(res, held) if not h]
+            stream.write(modname, done)
+            early[modname] = (any(not r.ok for r in done), any(not compliant(r) for r in done))
+            pending[modname] = [r for r, h in zip(res, held) if h]
+            if store is None:
+                return pending[modname]
+        return res
+    
+    def _run(modname, mod):
+        if store is not None and not force:
+            cached, kv = store.lookup(modname, mod, cfg.get(modname, {}), profile, dry_run, facts)
+            if cached is not None:
+                logger.info(f"Module {modname} unchanged since last run; reusing results")
+                # Re-register sysctl keys so the drop-in is still rendered in full
+                for r in cached:
+                    if r.id in kv:
+                        sysctl.register(r, kv[r.id])
+                return cached
+        if verify:
+            logger.info(f"Checking module: {modname}")
+            res = check_module(mod, cfg.get(modname, {}), profile, facts)
+            returned[modname] = [state.to_dict(r) for r in res]
+            return res
+        logger.info(f"Applying module: {modname}")
+        res = mod.apply(cfg.get(modname, {}), dry_run=dry_run, profile=profile, facts=facts)
+        returned[modname] = [state.to_dict(r) for r in res]
+        if not dry_run and any(r.changed for r in res):
+            facts.invalidate_for(scheduler.resources(mod)[1])
+        return res
+    
+    try:
+        outcome = scheduler.run([m for m in module_list if m in mods], mods, _apply, jobs=jobs)
+    finally:
+        pkgplan.activate(None)
+    
+    # Sysctl keys registered by any module are rendered and applied once
+    registered = sysctl.registrations()
+    with accounting.scope() as acc, trace.span("sysctl flush", "phase"):
+        if not sysctl.flush(dry_run, facts):
+            logger.error("Sysctl flush had failures")
+    timings["(sysctl flush)"] = acc.to_dict()
+    
+    # Reloads/restarts/regenerations requested by modules, deduplicated, run once
+    if verify:
+        postactions.reset()
+        firstboot.reset()
+        post = []
+    else:
+        with accounting.scope() as acc, trace.span("post-actions", "phase"):
+            post = postactions.flush(dry_run, facts)
+            # With --root, whatever needs the booted target runs on its first boot
+            post += firstboot.flush(dry_run)
+        timings["(post-actions)"] = acc.to_dict()
+    
+    for modname in module_list:
+        if modname not in outcome:
+            continue
+        res, err = outcome[modname]
+        if err is not None:
+            logger.error(f"Error applying module {modname}: {err}")
+            overall_ok = False
+            continue
+        
+        failed, noncompliant = early.get(modname, (False, False))
+        if stream is not None:
+            res = pending.pop(modname)
+            stream.write(modname, res)
+            if store is None:
+                outcome[modname] = None
+        else:
+            results.extend(res)
+        
+        # Check if any control failed
+        if failed or any((not r.ok) for r in res):
+            overall_ok = False
+            logger.error(f"Module {modname} had failures")
+        elif verify and (noncompliant or not all(compliant(r) for r in res)):
             overall_ok = False
+            logger.warning(f"Module {modname} is not compliant")
+        else:
+            logger.info(f"Module {modname} completed successfully")
+    
+    if stream is not None:
+        stream.write("(post-actions)", post)
+    else:
+        results.extend(post)
+    if any((not r.ok) for r in post):
+        overall_ok = False
+        logger.error("Post-actions had failures")
+    
+    if store is not None:
+        for modname, ret in returned.items():
+            res, err = outcome[modname]
+            if err is None:
+                store.record(modname, mods[modname], cfg.get(modname, {}), profile, dry_run, res, ret,
+                             {r.id: registered[r.id] for r in res if r.id in registered}, facts)
+        try:
+            store.save()
+        except OSError as e:
+            logger.warning(f"Could not save incremental state to {store.path}: {e}")
+        if store.reused:
+            logger.info(f"Reused cached results for {len(store.reused)} unchanged module(s)")
     
     return results, overall_ok
 
@@ -202,17 +392,32 @@ def generate_report(
     dry_run: bool,
     results: List[Any],
     overall_ok: bool,
-    system_info: Dict[str, str]
+    system_info: Dict[str, str],
+    package_plan: Dict[str, Any] = None,
+    reused: List[str] = None,
+    verify: bool = False,
+    timings: Dict[str, Any] = None,
+    include_results: bool = True,
+    counts: "ResultCounts" = None
 ) -> Dict[str, Any]:
-    """Generate comprehensive compliance report"""
+    """
+    Generate comprehensive compliance report
+    In verify mode a control passes only if its check found nothing to change.
+    Without `include_results` only the counts and sections are built (the
+    trailer of a streamed report); `counts` then stands in for results that
+    were already written and dropped.
+    """
     
     # Categorize results
-    passed = sum(1 for r in results if r.ok)
-    failed = sum(1 for r in results if not r.ok)
-    remediated = sum(1 for r in results if r.changed and r.ok)
+    if counts is None:
+        counts = ResultCounts(verify)
+        counts.add(results)
+    passed = counts.passed
+    failed = counts.total - passed
+    remediated = counts.remediated
     
     # Calculate compliance percentage
-    total = len(results)
+    total = counts.total
     compliance = (passed / total * 100) if total > 0 else 0
     
     report = {
@@ -223,6 +428,7 @@ def generate_report(
         },
         "profile": profile,
         "dry_run": dry_run,
+        "mode": "verify" if verify else "dry-run" if dry_run else "apply",
         "execution": {
             "total_controls": total,
             "passed": passed,
@@ -234,14 +440,124 @@ def generate_report(
             "already_compliant": passed - remediated,
             "failed": failed,
         },
-        "results": [r.__dict__ if hasattr(r, '__dict__') else r for r in results],
         "ok": overall_ok,
     }
+    if include_results:
+        report["results"] = [result_dict(r, verify) for r in results]
+    if package_plan is not None:
+        report["package_plan"] = package_plan
+    if reused is not None:
+        report["incremental"] = {"reused": sorted(reused)}
+    if timings is not None:
+        report["timing"] = {
+            "modules": timings,
+            "slowest_controls": counts.slowest(),
+        }
     
     return report
 
+def result_dict(r: Any, verify: bool = False) -> Dict[str, Any]:
+    d = r.to_dict()
+    if verify:
+        d["compliant"] = compliant(r)
+    return d
+
+class JsonlReport:
+    """
+    Streamed report: one JSON line per result, written as it is final, then a
+    trailer line with the rest of the report ({"type": "summary", ...}).
+    Nothing is buffered: `counts` keeps what the trailer and summary need, so
+    report memory does not grow with the result count. Each result must be
+    written once.
+    """
+    def __init__(self, path: str, verify: bool = False, timing_rows: bool = False):
+        self.path = path
+        self.verify = verify
+        self.counts = ResultCounts(verify, timing_rows)
+        self._lock = threading.Lock()
+        if path == "-":
+            self._f = sys.stdout
+        else:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._f = open(path, "w", encoding="utf-8")
+
+    @property
+    def count(self) -> int:
+        return self.counts.total
+
+    def write(self, module: str, results: List[Any]):
+        """Write final results and count them"""
+        with self._lock:
+            for r in results:
+                self._f.write(json.dumps({"type": "result", "module": module, **result_dict(r, self.verify)},
+                                         default=str) + "\n")
+            self.counts.add(results)
+            self._f.flush()
+
+    def close(self, report: Dict[str, Any]):
+        with self._lock:
+            self._f.write(json.dumps({"type": "summary", **report}, default=str) + "\n")
+            self._f.flush()
+            if self._f is not sys.stdout:
+                self._f.close()
+        logger.info(f"Report streamed to {self.path} ({self.count} results)")
+
+class ResultCounts:
+    """
+    What the report needs from the results without keeping them: pass/fail
+    counts, the `n` slowest controls and, with `timing_rows`, each control's
+    timing fields for --timings
+    """
+    def __init__(self, verify: bool = False, timing_rows: bool = False, n: int = 10):
+        self.verify = verify
+        self.n = n
+        self.total = self.passed = self.remediated = 0
+        self.timing_rows: List[Dict[str, Any]] = [] if timing_rows else None
+        self._slowest: List[tuple] = []  # min-heap of (duration, -seq, row); ties keep the earlier control
+
+    def add(self, results: List[Any]):
+        for r in results:
+            self.total += 1
+            if compliant(r) if self.verify else r.ok:
+                self.passed += 1
+                if not self.verify and r.changed:
+                    self.remediated += 1
+            if self.timing_rows is not None:
+                self.timing_rows.append({"id": r.id, **{k: getattr(r, k) for k in accounting.FIELDS}})
+            item = (getattr(r, "duration", 0) or 0, -self.total,
+                    {"id": r.id, "title": r.title, "duration": r.duration, "subprocesses": r.subprocesses,
+                     "bytes_read": r.bytes_read, "bytes_written": r.bytes_written})
+            if len(self._slowest) < self.n:
+                heapq.heappush(self._slowest, item)
+            elif item[:2] > self._slowest[0][:2]:
+                heapq.heapreplace(self._slowest, item)
+
+    def slowest(self) -> List[Dict[str, Any]]:
+        return [row for _, _, row in sorted(self._slowest, key=lambda i: i[:2], reverse=True)]
+
+def timing_data(profile: str, results: List[Any], timings: Dict[str, Any], total: float,
+                controls: List[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Machine-readable timings for tracking run-time regressions between module versions"""
+    return {
+        "profile": profile,
+        "host": os.uname().nodename,
+        "script_version": "2.0",
+        "timestamp": datetime.now().isoformat(),
+        "total_duration": round(total, 6),
+        "module_versions": {m: state.source_hash(sys.modules[f"modules.{m}"])[:12]
+                            for m in timings if f"modules.{m}" in sys.modules},
+        "modules": timings,
+        "controls": controls if controls is not None else
+                    [{"id": r.id, **{k: getattr(r, k) for k in accounting.FIELDS}} for r in results],
+    }
+
 def save_report(report: Dict[str, Any], report_path: str) -> bool:
-    """Save report to JSON file"""
+    """Save report to JSON file ("-" writes it to stdout)"""
+    if report_path == "-":
+        json.dump(report, sys.stdout, default=str)
+        sys.stdout.write("\n")
+        sys.stdout.flush()
+        return True
     try:
         os.makedirs(os.path.dirname(report_path) or ".", exist_ok=True)
         with open(report_path, "w", encoding="utf-8") as f:
@@ -268,8 +584,20 @@ def print_summary(report: Dict[str, Any]):
     print(f"Failed:                {failed}")
     print(f"Compliance:            {compliance}%")
     print(f"Overall Status:        {'✅ PASS' if report.get('ok') else '❌ FAIL'}")
+    if report.get("metadata", {}).get("root"):
+        print(f"Target Root:           {report['metadata']['root']}")
     print(f"{'='*60}\n")
     
+    # Show where the time went
+    slowest = report.get("timing", {}).get("slowest_controls", [])
+    if slowest:
+        print("Slowest Controls:")
+        print(f"  {'Control':24} {'Seconds':>8} {'Procs':>6} {'Read':>10} {'Written':>10}")
+        for c in slowest:
+            print(f"  {c['id'][:24]:24} {c['duration'] or 0:8.3f} {c['subprocesses']:6} "
+                  f"{c['bytes_read']:10} {c['bytes_written']:10}")
+        print(f"{'='*60}\n")
+    
     # Show remediation summary
     if not report.get('dry_run'):
         remediation = report.get("remediation", {})
@@ -286,6 +614,76 @@ def validate_permissions():
         print("ERROR: must run as root (sudo).", file=sys.stderr)
         sys.exit(2)
 
+def fleet_args(args: argparse.Namespace) -> List[str]:
+    """Runner arguments for every fleet host: config on stdin, report on stdout"""
+    mode = "--verify" if args.verify else "--dry-run" if args.dry_run else "--apply"
+    fwd = ["--profile", args.profile, mode, "--config", "-", "--report", "-", "--log-level", "WARNING",
+           "--jobs", str(args.jobs), "--command-timeout", str(args.command_timeout), "--max-procs", str(args.max_procs)]
+    if args.timeout > 0:
+        fwd += ["--timeout", str(args.timeout)]
+    if args.incremental:
+        fwd.append("--incremental")
+    if args.force:
+        fwd.append("--force")
+    return fwd
+
+def apply_fleet(args: argparse.Namespace, hosts: List[fleet.Host]) -> bool:
+    """Run the profile on every inventory host and stream host entries into the combined report"""
+    remote = shlex.split(args.remote_command) if args.remote_command else None
+    if args.transport == "ssh":
+        transport = fleet.SSHTransport(options=[o for opt in args.ssh_option for o in ("-o", opt)], remote=remote)
+    else:
+        transport = fleet.LocalTransport(remote=remote)
+    config = ""
+    if os.path.exists(args.config):
+        with open(args.config, "r", encoding="utf-8") as f:
+            config = f.read()
+    else:
+        logger.warning(f"Config file not found: {args.config}, hosts use defaults")
+    
+    # With --report - stdout carries only the combined report
+    out = sys.stderr if args.report == "-" else sys.stdout
+    sink = None
+    if args.report == "-":
+        sink = sys.stdout
+    elif args.report:
+        os.makedirs(os.path.dirname(args.report) or ".", exist_ok=True)
+        sink = open(args.report, "w", encoding="utf-8")
+    
+    print(f"Running {args.profile} on {len(hosts)} hosts via {args.transport}, "
+          f"{args.fleet_jobs} at a time (timeout {args.host_timeout:.0f}s per host)", file=out)
+    tally = fleet.Tally()
+    t0 = time.monotonic()
+    try:
+        for entry in fleet.run_fleet(hosts, transport, fleet_args(args), jobs=args.fleet_jobs,
+                                     timeout=args.host_timeout or None, config=config):
+            tally.add(entry)
+            if sink:
+                sink.write(json.dumps(entry, default=str) + "\n")
+                sink.flush()
+            pct = (entry.get("summary") or {}).get("compliance_percentage")
+            print(f"  {'✅' if entry['ok'] else '❌'} {entry['host']:30} {entry['status']:11} "
+                  f"{'' if pct is None else f'{pct}%':>6} {entry.get('duration', 0):8.1f}s", file=out)
+        summary = tally.to_dict(time.monotonic() - t0)
+        if sink:
+            sink.write(json.dumps(summary) + "\n")
+    finally:
+        if sink not in (None, sys.stdout):
+            sink.close()
+    
+    print(f"\n{'='*60}", file=out)
+    print(f"Fleet {args.profile.upper()} Report", file=out)
+    print(f"{'='*60}", file=out)
+    print(f"Hosts:                 {summary['hosts']}", file=out)
+    for status, n in summary["statuses"].items():
+        print(f"  {status + ':':20} {n}", file=out)
+    print(f"Controls Compliance:   {summary['controls']['compliance_percentage']}%", file=out)
+    print(f"Duration:              {summary['duration']:.1f}s", file=out)
+    print(f"{'='*60}", file=out)
+    if args.report and args.report != "-":
+        logger.info(f"Fleet report saved to {args.report}")
+    return summary["ok"] == summary["hosts"]
+
 def main():
     ap = argparse.ArgumentParser(
         description="CIS Oracle Enterprise Linux 9 Hardening Tool",
@@ -321,11 +719,106 @@ def main():
         default="",
         help="Save report to JSON file"
     )
+    ap.add_argument(
+        "--report-format",
+        choices=["json", "jsonl"],
+        default="json",
+        help="json: one document at the end; jsonl: one line per result as it completes plus a summary trailer"
+    )
     ap.add_argument(
         "--verify",
         action="store_true",
         help="Verify compliance without applying changes"
     )
+    ap.add_argument(
+        "--root",
+        default="",
+        metavar="DIR",
+        help="Harden the offline system image or chroot mounted at DIR instead of the running host"
+    )
+    ap.add_argument(
+        "--inventory",
+        default="",
+        metavar="FILE",
+        help="Fleet mode: run on every host in FILE (YAML or one host per line); --report is a combined JSON-lines report"
+    )
+    ap.add_argument(
+        "--transport",
+        choices=sorted(fleet.TRANSPORTS),
+        default="ssh",
+        help="Fleet mode: how hosts are reached; local runs the runner here with the host's root or container (default: ssh)"
+    )
+    ap.add_argument(
+        "--fleet-jobs",
+        type=int,
+        default=fleet.DEFAULT_JOBS,
+        help=f"Fleet mode: number of hosts run concurrently (default: {fleet.DEFAULT_JOBS})"
+    )
+    ap.add_argument(
+        "--host-timeout",
+        type=float,
+        default=fleet.DEFAULT_HOST_TIMEOUT,
+        help=f"Fleet mode: give up on a host after this many seconds (default: {fleet.DEFAULT_HOST_TIMEOUT})"
+    )
+    ap.add_argument(
+        "--ssh-option",
+        action="append",
+        default=[],
+        metavar="OPT",
+        help="Fleet mode: extra ssh -o option, may be repeated"
+    )
+    ap.add_argument(
+        "--remote-command",
+        default="",
+        metavar="CMD",
+        help=f"Fleet mode: runner command on the target (default: {' '.join(fleet.REMOTE_RUNNER)})"
+    )
+    ap.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of modules to run concurrently (default: 1)"
+    )
+    ap.add_argument(
+        "--command-timeout",
+        type=float,
+        default=executor.DEFAULT_TIMEOUT,
+        help=f"Kill any single command after this many seconds (default: {executor.DEFAULT_TIMEOUT})"
+    )
+    ap.add_argument(
+        "--timeout",
+        type=float,
+        default=0,
+        help="Stop starting new commands after this many seconds of run time (default: no limit)"
+    )
+    ap.add_argument(
+        "--max-procs",
+        type=int,
+        default=executor.DEFAULT_MAX_PARALLEL,
+        help=f"Maximum concurrently running commands (default: {executor.DEFAULT_MAX_PARALLEL})"
+    )
+    ap.add_argument(
+        "--incremental",
+        action="store_true",
+        help=f"Skip modules whose inputs are unchanged since the last run (state in {state.STATE_DIR})"
+    )
+    ap.add_argument(
+        "--force",
+        action="store_true",
+        help="With --incremental, run every module and refresh the saved state"
+    )
+    ap.add_argument(
+        "--timings",
+        default="",
+        metavar="FILE",
+        help="Write per-module and per-control timings as JSON to FILE"
+    )
+    ap.add_argument(
+        "--trace",
+        default="",
+        metavar="FILE",
+        help="Write a Chrome trace-event file (open in Perfetto) of modules, commands and file operations"
+    )
     ap.add_argument(
         "--log-level",
         choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
@@ -338,41 +831,102 @@ def main():
     # Set logging level
     logger.setLevel(getattr(logging, args.log_level))
     
+    if args.jobs < 1:
+        ap.error("--jobs must be at least 1")
+    if args.max_procs < 1:
+        ap.error("--max-procs must be at least 1")
+    
     # Validate mode selection
     if not args.dry_run and not args.apply and not args.verify:
         args.dry_run = True
         logger.info("No mode specified; defaulting to --dry-run")
     
+    if args.inventory:
+        if args.root:
+            ap.error("--root cannot be combined with --inventory (give each host a root in the inventory)")
+        if args.fleet_jobs < 1:
+            ap.error("--fleet-jobs must be at least 1")
+        try:
+            hosts = fleet.load_inventory(args.inventory)
+        except (OSError, ValueError) as e:
+            ap.error(f"--inventory: {e}")
+        sys.exit(0 if apply_fleet(args, hosts) else 1)
+    
     # Validate permissions
     validate_permissions()
     
+    if args.root:
+        if not os.path.isdir(args.root):
+            ap.error(f"--root {args.root}: not a directory")
+        utils.set_root(args.root)
+        logger.info(f"Hardening offline root {utils.ROOT}; runtime-only actions are deferred to its first boot")
+    
+    # All commands go through one executor; dry-run/verify never start mutating ones
+    executor.configure(dry_run=args.dry_run or args.verify, timeout=args.command_timeout or None,
+                       deadline=time.monotonic() + args.timeout if args.timeout > 0 else None,
+                       max_parallel=args.max_procs)
+    
+    if args.trace:
+        trace.enable()
+    
     # Load configuration
     cfg = load_config(args.config)
     
     # Get system information
     sys_info = get_system_info()
     
+    # Collect host facts once for all modules
+    facts = collect_facts(args.profile)
+    
     # Apply hardening
-    results, overall_ok = apply_modules(args.profile, cfg, dry_run=args.dry_run or args.verify)
+    plan = PackagePlan()
+    store = StateStore().load() if args.incremental else None
+    stream = (JsonlReport(args.report, verify=args.verify, timing_rows=bool(args.timings))
+              if args.report and args.report_format == "jsonl" else None)
+    timings: Dict[str, Any] = {}
+    t0 = time.monotonic()
+    results, overall_ok = apply_modules(args.profile, cfg, dry_run=args.dry_run, jobs=args.jobs,
+                                        facts=facts, plan=plan, store=store, force=args.force,
+                                        verify=args.verify, timings=timings, stream=stream)
+    elapsed = time.monotonic() - t0
     
     # Generate report
-    report = generate_report(args.profile, args.dry_run or args.verify, results, overall_ok, sys_info)
+    report = generate_report(args.profile, args.dry_run or args.verify, results, overall_ok, sys_info,
+                             package_plan=plan.summary(), reused=store.reused if store else None,
+                             verify=args.verify, timings=timings, include_results=stream is None,
+                             counts=stream.counts if stream is not None else None)
     
     # Save report if specified
-    if args.report:
+    if stream is not None:
+        stream.close(report)
+    elif args.report:
         save_report(report, args.report)
-    
-    # Print summary
-    print_summary(report)
-    
-    # Print results (compact)
-    print("Control Results:")
-    for r in results:
-        status = "✅" if r.ok else "❌"
-        changed = "*" if r.changed else " "
-        r_id = r.id if hasattr(r, 'id') else "UNKNOWN"
-        title = r.title if hasattr(r, 'title') else "Unknown"
-        print(f"  {status} {changed} {r_id:20} {title}")
+    if args.timings:
+        save_report(timing_data(args.profile, results, timings, elapsed,
+                                stream.counts.timing_rows if stream is not None else None), args.timings)
+    if args.trace:
+        try:
+            trace.save(args.trace)
+            logger.info(f"Trace saved to {args.trace}")
+        except OSError as e:
+            logger.error(f"Failed to save trace to {args.trace}: {e}")
+    
+    # With --report - stdout carries only the report
+    with contextlib.redirect_stdout(sys.stderr) if args.report == "-" else contextlib.nullcontext():
+        # Print summary
+        print_summary(report)
+        
+        # Print results (compact)
+        if stream is not None:
+            print(f"Control Results: {stream.count} written to {args.report}")
+        else:
+            print("Control Results:")
+        for r in results:
+            status = "✅" if (compliant(r) if args.verify else r.ok) else "❌"
+            changed = "*" if r.changed else " "
+            r_id = r.id if hasattr(r, 'id') else "UNKNOWN"
+            title = r.title if hasattr(r, 'title') else "Unknown"
+            print(f"  {status} {changed} {r_id:20} {title}")
     
     sys.exit(0 if overall_ok else 1)
 
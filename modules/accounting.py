@@ -0,0 +1,87 @@
+"""
+Per-Thread Work Accounting
+Counts elapsed time, subprocesses and file bytes read/written by whatever runs
+on the current thread inside scope(). The runner opens one scope per module;
+each ActionResult created inside it takes the work done since the previous
+result was created (see ActionResult.__init__), so per-control figures
+add up to the module total. Work handed to another thread is counted in the
+caller's scope when the worker runs it inside attach(), as
+Executor.run_async() does.
+"""
+from typing import Dict, Any, Optional
+from contextlib import contextmanager
+import threading, time
+
+# ActionResult fields filled in from the accounting scope
+FIELDS = ("started", "duration", "subprocesses", "bytes_read", "bytes_written")
+
+_local = threading.local()
+_lock = threading.Lock()  # scopes can be attached to several threads at once
+
+class Counters:
+    __slots__ = ("started", "duration", "subprocesses", "bytes_read", "bytes_written", "_t0", "_mark")
+
+    def __init__(self):
+        self.started = time.time()
+        self._t0 = time.monotonic()
+        self.duration = 0.0
+        self.subprocesses = self.bytes_read = self.bytes_written = 0
+        self._mark = (self._t0, 0, 0, 0)
+
+    def take(self) -> Dict[str, Any]:
+        """Work done since the previous take(), as ActionResult timing fields"""
+        now = time.monotonic()
+        t, s, r, w = self._mark
+        self._mark = (now, self.subprocesses, self.bytes_read, self.bytes_written)
+        return {
+            "started": round(self.started + (t - self._t0), 6),
+            "duration": round(now - t, 6),
+            "subprocesses": self.subprocesses - s,
+            "bytes_read": self.bytes_read - r,
+            "bytes_written": self.bytes_written - w,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"started": self.started, "duration": round(self.duration, 6), "subprocesses": self.subprocesses,
+                "bytes_read": self.bytes_read, "bytes_written": self.bytes_written}
+
+def current() -> Optional[Counters]:
+    stack = getattr(_local, "stack", None)
+    return stack[-1] if stack else None
+
+@contextmanager
+def scope():
+    """Account everything done on this thread until exit; nested scopes roll up into the enclosing one"""
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    c = Counters()
+    _local.stack.append(c)
+    try:
+        yield c
+    finally:
+        c.duration = time.monotonic() - c._t0
+        _local.stack.pop()
+        _add(current(), c.subprocesses, c.bytes_read, c.bytes_written)
+
+@contextmanager
+def attach(c: Optional[Counters]):
+    """Account what this thread does until exit into c, a scope opened on another thread"""
+    if not hasattr(_local, "stack"):
+        _local.stack = []
+    if c is not None:
+        _local.stack.append(c)
+    try:
+        yield c
+    finally:
+        if c is not None:
+            _local.stack.pop()
+
+def _add(c: Optional[Counters], subprocesses: int, bytes_read: int, bytes_written: int):
+    if c is not None:
+        with _lock:
+            c.subprocesses += subprocesses
+            c.bytes_read += bytes_read
+            c.bytes_written += bytes_written
+
+def add(subprocesses: int = 0, bytes_read: int = 0, bytes_written: int = 0):
+    _add(current(), subprocesses, bytes_read, bytes_written)
@@ -1,8 +1,16 @@
 from typing import List, Dict, Any
-from .utils import ActionResult, ensure_pkg, run, write_file
+from .utils import ActionResult, ensure_pkg, run, write_file, rooted, offline
+from .facts import HostFacts
+from . import firstboot
 import shlex
 import os
 
+PKG_INSTALL = {"AIDE-1": ["aide"]}
+
+READS = ["pkg:aide"]
+WRITES = ["file:/etc/aide.conf", "file:/var/lib/aide/"]
+DEPENDS = []
+
 # Default AIDE configuration for CIS compliance
 DEFAULT_AIDE_CONF = """# AIDE configuration file for CIS compliance
 # Generated by CIS hardening scripts
@@ -35,11 +43,11 @@ DEFAULT_AIDE_CONF = """# AIDE configuration file for CIS compliance
 !/var/log/aide
 """
 
-def apply(cfg: Dict[str,Any], dry_run: bool, profile: str) -> List[ActionResult]:
+def apply(cfg: Dict[str,Any], dry_run: bool, profile: str, facts: HostFacts=None) -> List[ActionResult]:
     results = []
     
     # Ensure AIDE package is installed
-    ensure_pkg(["aide"], dry_run, results, "AIDE-1", "Install AIDE package")
+    ensure_pkg(["aide"], dry_run, results, "AIDE-1", "Install AIDE package", facts=facts)
     
     # Ensure AIDE configuration exists
     control_id = "AIDE-CONFIG"
@@ -51,12 +59,13 @@ def apply(cfg: Dict[str,Any], dry_run: bool, profile: str) -> List[ActionResult]
     files = ["/etc/aide.conf"]
     
     aide_conf = "/etc/aide.conf"
-    if not os.path.exists(aide_conf):
+    if not os.path.exists(rooted(aide_conf)):
         if not dry_run:
             changed, note = write_file(aide_conf, DEFAULT_AIDE_CONF, mode=0o644, dry_run=dry_run)
             notes = f"Created default AIDE configuration: {note}"
             ok = True
         else:
+            changed = True
             notes = "DRY-RUN: Would create default AIDE configuration"
             commands.append(f"cat > {aide_conf} << 'EOF'\n{DEFAULT_AIDE_CONF}EOF")
     else:
@@ -84,20 +93,40 @@ def apply(cfg: Dict[str,Any], dry_run: bool, profile: str) -> List[ActionResult]
         ))
         return results
     
+    databases = ["/var/lib/aide/aide.db.gz", "/var/lib/aide/aide.db"]
+    if any(os.path.exists(rooted(db)) for db in databases):
+        results.append(ActionResult(
+            "AIDE-2",
+            "Initialize AIDE database",
+            False,
+            True,
+            notes="AIDE database already initialized",
+            files=[db for db in databases if os.path.exists(rooted(db))]
+        ))
+        return results
+    
     cmd = ["bash", "-lc", "aide --init 2>&1 && mv -f /var/lib/aide/aide.db.new.gz /var/lib/aide/aide.db.gz 2>/dev/null || true"]
     if dry_run:
         results.append(ActionResult(
             "AIDE-2",
             "Initialize AIDE database",
-            False,
+            True,
             True,
             notes="DRY-RUN: would run " + shlex.join(cmd),
             commands=[shlex.join(cmd)]
         ))
         return results
     
-    cp = run(cmd)
-    ok = cp.returncode == 0 or os.path.exists("/var/lib/aide/aide.db.gz") or os.path.exists("/var/lib/aide/aide.db")
+    if offline():
+        # The database has to describe the deployed system, not the image being built
+        r = ActionResult("AIDE-2", "Initialize AIDE database", True, True,
+                         notes="Deferred to first boot: " + shlex.join(cmd), commands=[shlex.join(cmd)])
+        firstboot.defer(cmd, r)
+        results.append(r)
+        return results
+    
+    cp = run(cmd, mutating=True)
+    ok = cp.returncode == 0 or any(os.path.exists(rooted(db)) for db in databases)
     notes = (cp.stdout + cp.stderr).strip() if cp.stdout or cp.stderr else "AIDE database initialized"
     
     results.append(ActionResult(
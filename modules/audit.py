@@ -1,6 +1,23 @@
-from typing import List, Dict, Any
-from .utils import ActionResult, ensure_pkg, ensure_service_enabled, write_file, run, ensure_kv_in_file
-import shlex
+from typing import List, Dict, Any, Tuple, NamedTuple, Union
+from .utils import ActionResult, ensure_pkg, ensure_service_enabled, write_file, rooted, root_glob, offline
+from .filetx import FileTransaction
+from .facts import HostFacts
+from . import postactions, fsscan, executor
+import re, shlex, fnmatch
+
+PKG_INSTALL = {"AUD-1": ["audit", "audit-libs", "aide"]}
+
+READS = ["pkg:audit", "pkg:audit-libs", "pkg:aide", "mount"]
+WRITES = ["unit:auditd.service", "file:/etc/audit/", "file:" + fsscan.CACHE]
+DEPENDS = []
+# Setuid/setgid binaries come and go without touching any file we fingerprint
+# (the cached scan is cheap enough to run every time), and the loaded rules
+# live in the kernel
+VOLATILE = ["AUD-4", "AUD-5"]
+
+RULES_D = "/etc/audit/rules.d/"
+PRIVILEGED_RULES = RULES_D + "50-privileged.rules"
+MERGED_RULES = "/etc/audit/audit.rules"  # what augenrules builds from RULES_D
 
 RULES = """## CIS baseline audit rules - comprehensive
 # Remove any existing rules
@@ -52,7 +69,7 @@ RULES = """## CIS baseline audit rules - comprehensive
 -a always,exit -F arch=b64 -S adjtimex,settimeofday,clock_settime -k time-change
 -a always,exit -F arch=b64 -S clock_adjtime -F auid>=1000 -F auid!=4294967295 -k time-change
 -a always,exit -F arch=b32 -S adjtimex,settimeofday,stime,clock_settime -k time-change
--a always,exit -F arch=b32 -S clock_adjtime,setfsgid32,setfsgid,setfsuid32,setfsuid,setgid32,setgid,setgroups32,setgroups,sethostname,setitimer,setpgid,setpriority,setregid32,setregid,setresgid32,setresgid,setresuid32,setresuid,setreuid32,setreuid,setrlimit,setsid,setsockopt,settimeofday,setuid32,setuid -F auid>=1000 -F auid!=4294967295 -k time-change
+-a always,exit -F arch=b32 -S clock_adjtime -F auid>=1000 -F auid!=4294967295 -k time-change
 
 # Hostname changes
 -a always,exit -F arch=b64 -S sethostname,setdomainname -k system-locale
@@ -117,33 +134,297 @@ RULES = """## CIS baseline audit rules - comprehensive
 -e 2
 """
 
-def apply(cfg: Dict[str,Any], dry_run: bool, profile: str):
+# Syscall names per arch (b64 = x86_64, b32 = i386) that rules may use. auditctl
+# rejects a rule naming a syscall the arch lacks, and augenrules then fails the
+# whole load; extend these when adding rules.
+_SYSCALLS_COMMON = """
+    open openat openat2 creat close read write truncate ftruncate unlink unlinkat rename renameat
+    renameat2 rmdir mkdir mkdirat link linkat symlink symlinkat mknod mknodat chmod fchmod fchmodat
+    chown fchown fchownat lchown setxattr lsetxattr fsetxattr removexattr lremovexattr fremovexattr
+    utime utimes utimensat futimesat open_by_handle_at name_to_handle_at mount umount2 pivot_root
+    chroot swapon swapoff quotactl time adjtimex settimeofday clock_settime clock_adjtime sethostname
+    setdomainname init_module finit_module delete_module kexec_load reboot acct execve execveat ptrace
+    personality setuid setgid setreuid setregid setresuid setresgid setfsuid setfsgid setgroups setsid
+    setpgid setpriority setrlimit setitimer socket bind connect accept4 setsockopt
+"""
+SYSCALLS = {
+    "b64": frozenset((_SYSCALLS_COMMON + " accept kexec_file_load arch_prctl").split()),
+    "b32": frozenset((_SYSCALLS_COMMON + """ stime umount socketcall truncate64 ftruncate64 ugetrlimit
+        chown32 fchown32 lchown32 setuid32 setgid32 setreuid32 setregid32 setresuid32 setresgid32
+        setfsuid32 setfsgid32 setgroups32""").split()),
+}
+NATIVE_ARCH = "b64"
+UNSET_ID = "4294967295"  # auid/uid of -1 ("unset"), written the way RULES does
+
+class Watch(NamedTuple):
+    path: str
+    perms: str
+    keys: Tuple[str, ...]
+
+class SyscallRule(NamedTuple):
+    action: str                  # list,action, e.g. "always,exit"
+    arch: str                    # "b64", "b32" or "" when no arch is given
+    syscalls: Tuple[str, ...]
+    fields: Tuple[str, ...]      # -F filters other than arch, e.g. "auid>=1000"
+    keys: Tuple[str, ...]
+
+Rule = Union[str, Watch, SyscallRule]  # a str is a control line (-D, -b, -f, -e, ...)
+
+_OP = re.compile(r"(<=|>=|!=|&=|=|<|>|&)")
+
+def _field(f: str) -> str:
+    name, op, value = _OP.split(f, 1) if _OP.search(f) else (f, "", "")
+    if name in ("auid", "uid", "euid", "suid", "fsuid", "loginuid") and value in ("-1", "unset"):
+        value = UNSET_ID
+    return name + op + value
+
+def _perms(p: str) -> str:
+    return "".join(c for c in "rwxa" if c in p)
+
+def parse_rules(text: str) -> List[Rule]:
+    """Rules in file order; comments and blank lines are dropped"""
+    rules: List[Rule] = []
+    for ln in text.splitlines():
+        ln = ln.strip()
+        if not ln or ln.startswith("#"):
+            continue
+        tok = shlex.split(ln)
+        opts: Dict[str, List[str]] = {}
+        i = 0
+        while i < len(tok):
+            if tok[i].startswith("-") and i + 1 < len(tok) and not tok[i + 1].startswith("-"):
+                opts.setdefault(tok[i], []).append(tok[i + 1])
+                i += 2
+            else:
+                opts.setdefault(tok[i], [])
+                i += 1
+        keys = tuple(dict.fromkeys(opts.get("-k", [])))
+        if "-w" in opts:
+            rules.append(Watch(opts["-w"][0], _perms("".join(opts.get("-p", []))), keys))
+        elif "-a" in opts or "-A" in opts:
+            action = ",".join(sorted((opts.get("-a") or opts["-A"])[0].split(","), key=lambda w: w not in
+                                     ("always", "never")))
+            fields = [_field(f) for f in opts.get("-F", [])]
+            arch = next((f.split("=", 1)[1] for f in fields if f.startswith("arch=")), "")
+            syscalls = tuple(sc for arg in opts.get("-S", []) for sc in arg.split(",") if sc)
+            # auditctl -l lists keys as -F key=...
+            keys = tuple(dict.fromkeys(keys + tuple(f[4:] for f in fields if f.startswith("key="))))
+            rules.append(SyscallRule(action, arch, syscalls, tuple(dict.fromkeys(
+                f for f in fields if not f.startswith(("arch=", "key=")))), keys))
+        else:
+            rules.append(ln)
+    return rules
+
+def render(rule: Rule) -> str:
+    if isinstance(rule, Watch):
+        return f"-w {rule.path}" + (f" -p {rule.perms}" if rule.perms else "") + "".join(f" -k {k}" for k in rule.keys)
+    if isinstance(rule, SyscallRule):
+        parts = ["-a", rule.action] + (["-F", f"arch={rule.arch}"] if rule.arch else [])
+        parts += ["-S", ",".join(rule.syscalls)] if rule.syscalls else []
+        for f in rule.fields:
+            parts += ["-F", f]
+        for k in rule.keys:
+            parts += ["-k", k]
+        return " ".join(parts)
+    return rule
+
+def compile_rules(text: str) -> Tuple[str, List[str]]:
+    """
+    Merge, dedupe and check rules; returns (rules file, report lines).
+
+    The exit list is first-match, so rules are merged only within a run of
+    rules with the same list and action: a never rule between two always
+    rules stays between them. Inside a run, syscall rules with the same arch,
+    filters and keys become one rule over the union of their syscalls, at the
+    position of the first one, and watches on the same path and key share one
+    watch. Exact duplicates of an earlier rule go anywhere, as do duplicate
+    filters. Syscalls the arch does not have are dropped, and so is a rule
+    left with none. Output: control lines, then each run (watches sorted by
+    path, then syscall rules), then -e.
+    """
+    rules = parse_rules(text)
+    controls, tail, report = [], [], []
+    runs: List[Tuple[Dict[Any, Watch], Dict[Any, List[Any]]]] = []  # (watches, merged syscall rules) per run
+    action, seen = None, set()
+    dropped, duplicates = 0, 0
+    for r in rules:
+        if isinstance(r, (Watch, SyscallRule)):
+            if isinstance(r, SyscallRule):
+                table = SYSCALLS.get(r.arch or NATIVE_ARCH, frozenset())
+                bad = [sc for sc in r.syscalls if sc not in table and sc != "all"]
+                if bad:
+                    report.append(f"not on {r.arch or NATIVE_ARCH}: {','.join(bad)} (dropped from {' '.join(r.keys) or 'rule'})")
+                    if len(bad) == len(r.syscalls):
+                        dropped += 1
+                        continue
+                    r = r._replace(syscalls=tuple(sc for sc in r.syscalls if sc not in bad))
+            if _canon(r) in seen:
+                duplicates += 1
+                continue
+            seen.add(_canon(r))
+            # watches are always,exit rules on the path
+            if (r.action if isinstance(r, SyscallRule) else "always,exit") != action or not runs:
+                action = r.action if isinstance(r, SyscallRule) else "always,exit"
+                runs.append(({}, {}))
+            watches, merged = runs[-1]
+            if isinstance(r, Watch):
+                old = watches.get((r.path, r.keys))
+                if old:
+                    duplicates += 1
+                    r = r._replace(perms=_perms(old.perms + r.perms))
+                watches[(r.path, r.keys)] = r
+            else:
+                key = (r.arch, tuple(sorted(r.fields)), r.keys)
+                if key in merged:
+                    duplicates += 1
+                    merged[key][1].update(r.syscalls)
+                    merged[key][2] += 1
+                else:
+                    merged[key] = [r, set(r.syscalls), 1]
+        elif r.split()[0] == "-e":
+            tail = [r]
+        elif r not in controls:
+            controls.append(r)
+    out = list(controls)
+    for watches, merged in runs:
+        out += [render(w) for _, w in sorted(watches.items())]
+        out += [render(r._replace(syscalls=tuple(sorted(scs)))) for r, scs, _ in merged.values()]
+        for r, scs, n in merged.values():
+            if n > 1:
+                report.append(f"{n} rules -> 1: {r.arch or NATIVE_ARCH} {' '.join(r.fields)} -k {','.join(r.keys)} "
+                              f"-S {','.join(sorted(scs))}")
+    out += tail
+    report = [f"{len(rules)} rules compiled to {len(out)}: {duplicates} merged or duplicate, "
+              f"{dropped} dropped"] + list(dict.fromkeys(report))
+    return "\n".join(["## Generated by cis hardening scripts (compiled, see modules/audit.py)"] + out) + "\n", report
+
+def privileged_rules(paths: List[str]) -> str:
+    """One execution rule per setuid/setgid binary, in path order"""
+    lines = ["## Generated by cis hardening scripts from the setuid/setgid inventory",
+             f"## {len(paths)} privileged executables on local filesystems"]
+    lines += [f"-a always,exit -F path={p} -F perm=x -F auid>=1000 -F auid!=4294967295 -k privileged"
+              for p in paths]
+    return "\n".join(lines) + "\n"
+
+def _rule_paths(path: str) -> List[str]:
+    try:
+        with open(rooted(path), "r", encoding="utf-8", errors="ignore") as f:
+            return re.findall(r"^-a .*-F path=(\S+)", f.read(), re.M)
+    except OSError:
+        return []
+
+def ensure_privileged_rules(cfg: Dict[str,Any], dry_run: bool) -> Tuple[ActionResult, str]:
+    exclude = cfg.get("privileged_exclude", [])
+    skip = re.compile("|".join(fnmatch.translate(p) for p in exclude)) if exclude else None
+    inv = fsscan.scan(skip_fstypes=tuple(cfg.get("privileged_skip_fstypes", [])), dry_run=dry_run)
+    paths = [e.path for e in inv.privileged if skip is None or not skip.match(e.path)]
+    before = set(_rule_paths(PRIVILEGED_RULES))
+    content = privileged_rules(paths)
+    changed, note = write_file(PRIVILEGED_RULES, content, mode=0o640, dry_run=dry_run)
+    notes = [f"{len(paths)} setuid/setgid executables ({inv.dirs} directories, {inv.listed} listed"
+             + (", full scan)" if inv.full else ")"), note]
+    added, removed = sorted(set(paths) - before), sorted(before - set(paths))
+    if added:
+        notes.append("New: " + ", ".join(added[:fsscan.SAMPLE]) + (" ..." if len(added) > fsscan.SAMPLE else ""))
+    if removed:
+        notes.append("Gone: " + ", ".join(removed[:fsscan.SAMPLE]) + (" ..." if len(removed) > fsscan.SAMPLE else ""))
+    if inv.errors:
+        notes.append(f"{len(inv.errors)} not walked, e.g. " + "; ".join(inv.errors[:fsscan.SAMPLE]))
+    return ActionResult("AUD-4", "Audit use of privileged commands", changed, True, notes="\n".join(notes),
+                        files=[PRIVILEGED_RULES]), content
+
+def _canon(rule: Rule) -> Any:
+    """What the kernel keeps of a rule, in the form both rule files and auditctl -l parse to"""
+    if isinstance(rule, Watch):
+        return ("-w", rule.path.rstrip("/") or "/", rule.perms, rule.keys)
+    return ("-a", rule.action, rule.arch, frozenset(rule.syscalls) - {"all"}, frozenset(rule.fields), rule.keys)
+
+def canonical(text: str) -> List[Any]:
+    """Rules in load order without control lines (-D, -b, -e, ...)"""
+    return [_canon(r) for r in parse_rules(text) if not isinstance(r, str)]
+
+def _read(path: str) -> str:
+    try:
+        with open(rooted(path), "r", encoding="utf-8", errors="ignore") as f:
+            return f.read()
+    except OSError:
+        return ""
+
+def ensure_rules_loaded(pending: Dict[str, str], dry_run: bool) -> ActionResult:
+    """
+    Compare what augenrules would load from rules.d (with `pending`, the
+    contents written this run, standing in for unwritten dry-run files)
+    against the merged audit.rules and the kernel's `auditctl -l`. A reload is
+    queued only when they differ. With `-e 2` loaded the kernel refuses a
+    reload, so only audit.rules is regenerated (if it is stale) and the result
+    stays changed, with the new rules pending the next boot.
+    """
+    files = sorted(set(root_glob(RULES_D + "*.rules")) | set(pending))
+    desired = [c for f in files for c in canonical(pending[f] if f in pending else _read(f))]
+    merged_ok = canonical(_read(MERGED_RULES)) == desired
+    if offline():
+        changed = not merged_ok
+        notes = ["Loaded by augenrules at boot" if changed else "Merged rules match rules.d"]
+        return ActionResult("AUD-5", "Load audit rules", changed, True, notes="\n".join(notes),
+                            files=[MERGED_RULES])
+    ex = executor.get(dry_run)
+    try:
+        listed = ex.run(["auditctl", "-l"])
+        status = ex.run(["auditctl", "-s"])
+    except OSError as e:
+        listed = status = None
+        notes = [f"Loaded rules unknown: {e}"]
+    if listed is not None and listed.returncode == 0:
+        loaded_ok = canonical(listed.stdout) == desired
+        notes = [f"Loaded rules ({len(desired)}) {'match' if loaded_ok else 'differ from'} rules.d"]
+    else:
+        loaded_ok = False
+        if listed is not None:
+            notes = ["Loaded rules unknown: " + (listed.stdout + listed.stderr).strip()]
+    notes.append(f"{MERGED_RULES} {'matches' if merged_ok else 'differs from'} rules.d")
+    immutable = status is not None and status.returncode == 0 and re.search(r"^enabled 2$", status.stdout, re.M)
+    if loaded_ok and merged_ok:
+        return ActionResult("AUD-5", "Load audit rules", False, True, notes="\n".join(notes + ["No reload needed"]),
+                            files=[MERGED_RULES])
+    if immutable:
+        notes.append("Pending reboot: the loaded rules are immutable (-e 2); they take effect at the next boot")
+        result = ActionResult("AUD-5", "Load audit rules", True, True, notes="\n".join(notes),
+                              commands=[] if merged_ok else ["augenrules"], files=[MERGED_RULES])
+        if not merged_ok:
+            postactions.request("regen-audit-rules", result)
+        return result
+    result = ActionResult("AUD-5", "Load audit rules", True, True, notes="\n".join(notes),
+                          commands=["augenrules --load"], files=[MERGED_RULES])
+    postactions.request("load-audit-rules", result)
+    return result
+
+def apply(cfg: Dict[str,Any], dry_run: bool, profile: str, facts: HostFacts=None):
     results=[]
-    ensure_pkg(["audit","audit-libs","aide"], dry_run, results, "AUD-1", "Install auditd and aide packages")
-    ensure_service_enabled("auditd", dry_run, results, "AUD-2", "Enable auditd service")
+    ensure_pkg(["audit","audit-libs","aide"], dry_run, results, "AUD-1", "Install auditd and aide packages", facts=facts)
+    ensure_service_enabled("auditd", dry_run, results, "AUD-2", "Enable auditd service", facts=facts)
     
     # Configure auditd settings
     aconf="/etc/audit/auditd.conf"
-    c1,n1=ensure_kv_in_file(aconf,"log_file", "/var/log/audit/audit.log", sep=" = ", dry_run=dry_run)
-    c2,n2=ensure_kv_in_file(aconf,"log_group", "adm", sep=" = ", dry_run=dry_run)
-    c3,n3=ensure_kv_in_file(aconf,"log_format", "RAW", sep=" = ", dry_run=dry_run)
+    with FileTransaction(dry_run) as tx:
+        c1,n1=tx.set_kv(aconf,"log_file", "/var/log/audit/audit.log", sep=" = ")
+        c2,n2=tx.set_kv(aconf,"log_group", "adm", sep=" = ")
+        c3,n3=tx.set_kv(aconf,"log_format", "RAW", sep=" = ")
     results.append(ActionResult("AUD-2a","Configure auditd settings", c1 or c2 or c3, True, 
                                 notes="; ".join([n1,n2,n3]), files=[aconf]))
+    postactions.request("reload:auditd", results[-1])
     
-    # Write comprehensive audit rules
-    changed, note = write_file("/etc/audit/rules.d/99-cis-hardening.rules", RULES, mode=0o640, dry_run=dry_run)
-    
-    # Load audit rules
-    cmd=["augenrules","--load"]
-    if dry_run:
-        results.append(ActionResult("AUD-3","Install CIS audit rules and load", changed, True,
-                                    notes=note+"\nDRY-RUN: would run "+shlex.join(cmd),
-                                    commands=[shlex.join(cmd)], files=["/etc/audit/rules.d/99-cis-hardening.rules"]))
-    else:
-        cp=run(cmd)
-        ok=(cp.returncode==0)
-        results.append(ActionResult("AUD-3","Install CIS audit rules and load", changed, ok,
-                                    notes=note+"\n"+(cp.stdout+cp.stderr).strip(),
-                                    commands=[shlex.join(cmd)], files=["/etc/audit/rules.d/99-cis-hardening.rules"]))
+    # Write comprehensive audit rules; they are loaded once at the end of the run,
+    # and only if the kernel does not already have them
+    rules=RULES_D + "99-cis-hardening.rules"
+    content, report = compile_rules(RULES)
+    changed, note = write_file(rules, content, mode=0o640, dry_run=dry_run)
+    results.append(ActionResult("AUD-3","Install CIS audit rules", changed, True,
+                                notes="\n".join([note] + report), files=[rules]))
+    pending = {rules: content}
+
+    if cfg.get("privileged_rules", True):
+        result, pending[PRIVILEGED_RULES] = ensure_privileged_rules(cfg, dry_run)
+        results.append(result)
     
+    results.append(ensure_rules_loaded(pending, dry_run))
     return results
@@ -1,59 +1,70 @@
 from typing import List, Dict, Any
-from .utils import ActionResult, ensure_kv_in_file, run, ensure_pkg
-import shlex, os, re
+from .utils import ActionResult, run, ensure_pkg, write_file, rooted, offline
+from .filetx import FileTransaction
+from .facts import HostFacts
+from . import postactions, firstboot
+import shlex, subprocess
 
-def apply(cfg: Dict[str,Any], dry_run: bool, profile: str):
+PKG_INSTALL = {"AUTH-0": ["authselect", "libpwquality", "pam"]}
+
+READS = ["pkg:authselect", "pkg:libpwquality", "pkg:pam"]
+WRITES = ["authselect",
+          "file:/etc/security/", "file:/etc/login.defs", "file:/etc/profile.d/",
+          "file:/etc/bashrc", "file:/etc/profile", "file:/etc/pam.d/"]
+DEPENDS = []
+
+def apply(cfg: Dict[str,Any], dry_run: bool, profile: str, facts: HostFacts=None):
     results=[]
     
     # Ensure authselect and pam packages
-    ensure_pkg(["authselect","libpwquality","pam"], dry_run, results, "AUTH-0", "Install authentication packages")
+    ensure_pkg(["authselect","libpwquality","pam"], dry_run, results, "AUTH-0", "Install authentication packages", facts=facts)
     
+    # All config-file edits below are staged in memory and each file is written once
+    tx=FileTransaction(dry_run)
+
     # Configure password quality (pwquality.conf)
     pwq="/etc/security/pwquality.conf"
     pwq_dir="/etc/security/pwquality.conf.d"
     changes=[]
-    changes.append(ensure_kv_in_file(pwq,"minlen", str(cfg.get("pwquality_minlen",14)), sep=" = ", dry_run=dry_run))
-    changes.append(ensure_kv_in_file(pwq,"minclass", str(cfg.get("pwquality_minclass",4)), sep=" = ", dry_run=dry_run))
-    changes.append(ensure_kv_in_file(pwq,"maxrepeat", str(cfg.get("pwquality_maxrepeat",3)), sep=" = ", dry_run=dry_run))
-    changes.append(ensure_kv_in_file(pwq,"maxsequence", str(cfg.get("pwquality_maxsequence",3)), sep=" = ", dry_run=dry_run))
-    changes.append(ensure_kv_in_file(pwq,"difok", str(cfg.get("pwquality_difok",3)), sep=" = ", dry_run=dry_run))
-    changes.append(ensure_kv_in_file(pwq,"enforce_for_root", "", sep="", dry_run=dry_run))
+    changes.append(tx.set_kv(pwq,"minlen", str(cfg.get("pwquality_minlen",14)), sep=" = "))
+    changes.append(tx.set_kv(pwq,"minclass", str(cfg.get("pwquality_minclass",4)), sep=" = "))
+    changes.append(tx.set_kv(pwq,"maxrepeat", str(cfg.get("pwquality_maxrepeat",3)), sep=" = "))
+    changes.append(tx.set_kv(pwq,"maxsequence", str(cfg.get("pwquality_maxsequence",3)), sep=" = "))
+    changes.append(tx.set_kv(pwq,"difok", str(cfg.get("pwquality_difok",3)), sep=" = "))
+    changes.append(tx.set_kv(pwq,"enforce_for_root", "", sep=""))
     for k in ["dcredit","ucredit","lcredit","ocredit"]:
-        changes.append(ensure_kv_in_file(pwq,k, str(cfg.get(f"pwquality_{k}",-1)), sep=" = ", dry_run=dry_run))
+        changes.append(tx.set_kv(pwq,k, str(cfg.get(f"pwquality_{k}",-1)), sep=" = "))
     results.append(ActionResult("AUTH-1","Configure password quality (pwquality.conf)", any(c for c,_ in changes), True,
                                 notes="; ".join(n for _,n in changes), files=[pwq]))
 
     # Configure password history
     pwh="/etc/security/pwhistory.conf"
     ph_changes=[]
-    ph_changes.append(ensure_kv_in_file(pwh,"remember", str(cfg.get("pwhistory_remember",5)), sep=" = ", dry_run=dry_run))
-    ph_changes.append(ensure_kv_in_file(pwh,"enforce_for_root", "", sep="", dry_run=dry_run))
+    ph_changes.append(tx.set_kv(pwh,"remember", str(cfg.get("pwhistory_remember",5)), sep=" = "))
+    ph_changes.append(tx.set_kv(pwh,"enforce_for_root", "", sep=""))
     results.append(ActionResult("AUTH-1b","Configure password history (pwhistory.conf)", any(c for c,_ in ph_changes), True,
                                 notes="; ".join(n for _,n in ph_changes), files=[pwh]))
 
     # Configure login.defs for password aging
     ld="/etc/login.defs"
     ch=[]
-    ch.append(ensure_kv_in_file(ld,"PASS_MAX_DAYS", str(cfg.get("pass_max_days",365)), sep="\t", dry_run=dry_run))
-    ch.append(ensure_kv_in_file(ld,"PASS_MIN_DAYS", str(cfg.get("pass_min_days",1)), sep="\t", dry_run=dry_run))
-    ch.append(ensure_kv_in_file(ld,"PASS_WARN_AGE", str(cfg.get("pass_warn_age",14)), sep="\t", dry_run=dry_run))
+    ch.append(tx.set_kv(ld,"PASS_MAX_DAYS", str(cfg.get("pass_max_days",365)), sep="\t"))
+    ch.append(tx.set_kv(ld,"PASS_MIN_DAYS", str(cfg.get("pass_min_days",1)), sep="\t"))
+    ch.append(tx.set_kv(ld,"PASS_WARN_AGE", str(cfg.get("pass_warn_age",14)), sep="\t"))
     results.append(ActionResult("AUTH-2","Configure password aging (login.defs)", any(c for c,_ in ch), True,
                                 notes="; ".join(n for _,n in ch), files=[ld]))
 
     # Set default umask
     um="/etc/profile.d/99-cis-umask.sh"
     umask_val=str(cfg.get("umask","027"))
-    cmd=["bash","-lc", f"cat > {shlex.quote(um)} <<'EOF'\numask {umask_val}\nEOF\nchmod 644 {shlex.quote(um)}"]
-    if dry_run:
-        results.append(ActionResult("AUTH-3","Set default umask", True, True, notes="DRY-RUN: would write "+um, commands=[shlex.join(cmd)], files=[um]))
-    else:
-        cp=run(cmd); results.append(ActionResult("AUTH-3","Set default umask", True, cp.returncode==0, notes=(cp.stdout+cp.stderr).strip(), commands=[shlex.join(cmd)], files=[um]))
+    c,n=write_file(um, f"umask {umask_val}\n", mode=0o644, dry_run=dry_run)
+    results.append(ActionResult("AUTH-3","Set default umask", c, True, notes=n, files=[um]))
 
     # Set session timeout (tmout)
     tmout_files = ["/etc/bashrc", "/etc/profile"]
     for tf in tmout_files:
-        if os.path.exists(tf):
-            c,n = ensure_kv_in_file(tf,"TMOUT", str(cfg.get("tmout",900)), sep="=", dry_run=dry_run)
+        if tx.exists(tf):
+            c,n = tx.set_kv(tf,"TMOUT", str(cfg.get("tmout",900)), sep="=")
             results.append(ActionResult(f"AUTH-3a-{tf}",f"Set session timeout in {tf}", c, True, notes=n, files=[tf]))
 
     # Configure faillock
@@ -63,34 +74,60 @@ def apply(cfg: Dict[str,Any], dry_run: bool, profile: str):
     root_unlock_time=int(cfg.get("root_unlock_time",60))
     
     fl="/etc/security/faillock.conf"
-    c1,n1=ensure_kv_in_file(fl,"deny", str(deny), sep=" = ", dry_run=dry_run)
-    c2,n2=ensure_kv_in_file(fl,"fail_interval", str(fail_interval), sep=" = ", dry_run=dry_run)
-    c3,n3=ensure_kv_in_file(fl,"unlock_time", str(unlock_time), sep=" = ", dry_run=dry_run)
-    c4,n4=ensure_kv_in_file(fl,"root_unlock_time", str(root_unlock_time), sep=" = ", dry_run=dry_run)
+    c1,n1=tx.set_kv(fl,"deny", str(deny), sep=" = ")
+    c2,n2=tx.set_kv(fl,"fail_interval", str(fail_interval), sep=" = ")
+    c3,n3=tx.set_kv(fl,"unlock_time", str(unlock_time), sep=" = ")
+    c4,n4=tx.set_kv(fl,"root_unlock_time", str(root_unlock_time), sep=" = ")
     
     # Remove nullok from pam files
     pam_files = ["/etc/pam.d/password-auth", "/etc/pam.d/system-auth"]
     for pf in pam_files:
-        if os.path.exists(pf):
-            with open(pf, "r", encoding="utf-8", errors="ignore") as f:
-                content = f.read()
-            new_content = re.sub(r'\bnullok\b', '', content)
-            if new_content != content and not dry_run:
-                with open(pf, "w", encoding="utf-8") as f:
-                    f.write(new_content)
-                results.append(ActionResult(f"AUTH-3b-{pf}", f"Remove nullok from {pf}", True, True, files=[pf]))
-            elif new_content != content:
-                results.append(ActionResult(f"AUTH-3b-{pf}", f"Remove nullok from {pf}", True, True, notes="DRY-RUN: would update", files=[pf]))
-    
-    cmd2=["bash","-lc","authselect current >/dev/null 2>&1 && authselect enable-feature with-faillock && authselect apply-changes || true"]
-    if dry_run:
-        results.append(ActionResult("AUTH-4","Enable/configure account lockout (faillock)", c1 or c2 or c3 or c4, True,
-                                    notes="DRY-RUN: would run "+shlex.join(cmd2)+"; "+ "; ".join([n1,n2,n3,n4]),
-                                    commands=[shlex.join(cmd2)], files=[fl]))
+        if tx.exists(pf):
+            c,n = tx.sub(pf, r'\bnullok\b', '', what="nullok")
+            if c:
+                results.append(ActionResult(f"AUTH-3b-{pf}", f"Remove nullok from {pf}", True, True, notes=n, files=[pf]))
+
+    # faillock.conf must be on disk before authselect picks it up
+    tx.flush()
+
+    # Only enable the feature when authselect manages PAM and it is missing;
+    # profile changes are applied once at the end of the run
+    title="Enable/configure account lockout (faillock)"
+    notes="; ".join([n1,n2,n3,n4])
+    cmd2=["authselect","enable-feature","with-faillock"]
+    cur=_current()
+    if cur is None or cur.returncode!=0:
+        result=ActionResult("AUTH-4", title, c1 or c2 or c3 or c4, True, notes="authselect not in use; "+notes, files=[fl])
+    elif "with-faillock" in cur.stdout:
+        result=ActionResult("AUTH-4", title, c1 or c2 or c3 or c4, True, notes="with-faillock already enabled; "+notes, files=[fl])
+    elif dry_run:
+        result=ActionResult("AUTH-4", title, True, True, notes="DRY-RUN: would run "+shlex.join(cmd2)+"; "+notes,
+                            commands=[shlex.join(cmd2)], files=[fl])
+    elif offline():
+        result=ActionResult("AUTH-4", title, True, True, notes="Deferred to first boot: "+shlex.join(cmd2)+"; "+notes,
+                            commands=[shlex.join(cmd2)], files=[fl])
+        firstboot.defer(cmd2, result)
     else:
-        cp=run(cmd2)
-        results.append(ActionResult("AUTH-4","Enable/configure account lockout (faillock)", True, cp.returncode==0,
-                                    notes=(cp.stdout+cp.stderr).strip()+"; "+ "; ".join([n1,n2,n3,n4]),
-                                    commands=[shlex.join(cmd2)], files=[fl]))
+        cp=run(cmd2, mutating=True)
+        result=ActionResult("AUTH-4", title, True, cp.returncode==0, notes=(cp.stdout+cp.stderr).strip()+"; "+notes,
+                            commands=[shlex.join(cmd2)], files=[fl])
+    results.append(result)
+    if cur is not None and cur.returncode==0:
+        postactions.request("authselect-apply", result)
     
     return results
+
+def _current():
+    """`authselect current`; for an offline root the selection is read from its authselect.conf"""
+    if offline():
+        try:
+            with open(rooted("/etc/authselect/authselect.conf"), "r", encoding="utf-8") as f:
+                lines=[l.strip() for l in f if l.strip() and not l.startswith("#")]
+        except OSError:
+            return None
+        out="Profile ID: "+(lines[0] if lines else "")+"\nEnabled features:\n"+"".join(f"- {l}\n" for l in lines[1:])
+        return subprocess.CompletedProcess(["authselect","current"], 0 if lines else 2, out, "")
+    try:
+        return run(["authselect","current"])
+    except OSError:
+        return None
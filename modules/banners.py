@@ -1,9 +1,14 @@
 from typing import List, Dict, Any
 from .utils import ActionResult, write_file
+from .facts import HostFacts
+
+READS = []
+WRITES = ["file:/etc/issue", "file:/etc/issue.net", "file:/etc/motd"]
+DEPENDS = []
 
 BANNER = "Authorized uses only. All activity may be monitored and reported.\n"
 
-def apply(cfg: Dict[str,Any], dry_run: bool, profile: str):
+def apply(cfg: Dict[str,Any], dry_run: bool, profile: str, facts: HostFacts=None):
     c1,n1=write_file("/etc/issue", BANNER, mode=0o644, dry_run=dry_run)
     c2,n2=write_file("/etc/issue.net", BANNER, mode=0o644, dry_run=dry_run)
     c3,n3=write_file("/etc/motd", "", mode=0o644, dry_run=dry_run)
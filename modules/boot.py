@@ -3,10 +3,16 @@ Boot and Bootloader Hardening
 CIS Reference: 1.3.x, 1.4.x - Boot Settings and Bootloader Configuration
 """
 from typing import List, Dict, Any
-from .utils import ActionResult, run, ensure_kv_in_file
-import os, re, subprocess, shlex
+from .utils import ActionResult, ensure_kv_in_file, rooted, offline
+from .facts import HostFacts
+from . import postactions
+import os, re, subprocess
 
-def apply(cfg: Dict[str, Any], dry_run: bool, profile: str) -> List[ActionResult]:
+READS = ["file:/proc/cmdline"]
+WRITES = ["file:/boot/grub2/", "file:/etc/default/grub"]
+DEPENDS = []
+
+def apply(cfg: Dict[str, Any], dry_run: bool, profile: str, facts: HostFacts=None) -> List[ActionResult]:
     """
     Apply bootloader hardening:
     - Protect GRUB with password
@@ -29,17 +35,18 @@ def apply(cfg: Dict[str, Any], dry_run: bool, profile: str) -> List[ActionResult
         grub_cfg = "/boot/grub2/grub.cfg"
         target_mode = 0o600
         
-        if os.path.exists(grub_cfg):
-            current_stat = os.stat(grub_cfg)
+        if os.path.exists(rooted(grub_cfg)):
+            current_stat = os.stat(rooted(grub_cfg))
             current_mode = current_stat.st_mode & 0o777
             
             if current_mode != target_mode:
                 if not dry_run:
-                    os.chmod(grub_cfg, target_mode)
+                    os.chmod(rooted(grub_cfg), target_mode)
                     changed = True
                     notes = f"Changed permissions from {oct(current_mode)} to {oct(target_mode)}"
                 else:
-                    notes = f"Would change permissions from {oct(current_mode)} to {oct(target_mode)}"
+                    changed = True
+                    notes = f"DRY-RUN: Would change permissions from {oct(current_mode)} to {oct(target_mode)}"
                 
                 commands.append(f"chmod 600 {grub_cfg}")
                 files.append(grub_cfg)
@@ -83,17 +90,18 @@ def apply(cfg: Dict[str, Any], dry_run: bool, profile: str) -> List[ActionResult
         user_cfg = "/boot/grub2/user.cfg"
         target_mode = 0o600
         
-        if os.path.exists(user_cfg):
-            current_stat = os.stat(user_cfg)
+        if os.path.exists(rooted(user_cfg)):
+            current_stat = os.stat(rooted(user_cfg))
             current_mode = current_stat.st_mode & 0o777
             
             if current_mode != target_mode:
                 if not dry_run:
-                    os.chmod(user_cfg, target_mode)
+                    os.chmod(rooted(user_cfg), target_mode)
                     changed = True
                     notes = f"Changed permissions from {oct(current_mode)} to {oct(target_mode)}"
                 else:
-                    notes = f"Would change permissions from {oct(current_mode)} to {oct(target_mode)}"
+                    changed = True
+                    notes = f"DRY-RUN: Would change permissions from {oct(current_mode)} to {oct(target_mode)}"
                 
                 commands.append(f"chmod 600 {user_cfg}")
                 files.append(user_cfg)
@@ -140,8 +148,8 @@ def apply(cfg: Dict[str, Any], dry_run: bool, profile: str) -> List[ActionResult
         if enforce_grub_password:
             # Check if superuser is set in user.cfg
             has_password = False
-            if os.path.exists(user_cfg):
-                with open(user_cfg, "r", encoding="utf-8") as f:
+            if os.path.exists(rooted(user_cfg)):
+                with open(rooted(user_cfg), "r", encoding="utf-8") as f:
                     content = f.read()
                     if "superusers" in content:
                         has_password = True
@@ -187,9 +195,9 @@ def apply(cfg: Dict[str, Any], dry_run: bool, profile: str) -> List[ActionResult
     
     try:
         grub_default = "/etc/default/grub"
-        if os.path.exists(grub_default):
+        if os.path.exists(rooted(grub_default)):
             # Read current content
-            with open(grub_default, "r", encoding="utf-8", errors="ignore") as f:
+            with open(rooted(grub_default), "r", encoding="utf-8", errors="ignore") as f:
                 content = f.read()
             
             # Check and update GRUB_CMDLINE_LINUX
@@ -217,25 +225,20 @@ def apply(cfg: Dict[str, Any], dry_run: bool, profile: str) -> List[ActionResult
                         f'GRUB_CMDLINE_LINUX="{updated_params}"',
                         content
                     )
-                    with open(grub_default, "w", encoding="utf-8") as f:
+                    with open(rooted(grub_default), "w", encoding="utf-8") as f:
                         f.write(new_content)
-                    
-                    # Regenerate grub configuration
-                    cmd = ["grub2-mkconfig", "-o", "/boot/grub2/grub.cfg"]
-                    cp = run(cmd)
-                    commands.append(shlex.join(cmd))
-                    notes = f"Updated kernel parameters to: {updated_params}\n" + (cp.stdout + cp.stderr).strip()
-                    ok = (cp.returncode == 0)
+                    notes = f"Updated kernel parameters to: {updated_params}"
                 else:
                     notes = f"DRY-RUN: Would update kernel parameters to: {updated_params}"
-                    commands.append("grub2-mkconfig -o /boot/grub2/grub.cfg")
+                # grub.cfg is regenerated once at the end of the run
+                commands.append("grub2-mkconfig -o /boot/grub2/grub.cfg")
             else:
                 notes = f"Audit kernel parameters already configured: {updated_params}"
     except Exception as e:
         ok = False
         notes = f"Error: {str(e)}"
     
-    results.append(ActionResult(
+    result = ActionResult(
         id=control_id,
         title=title,
         changed=changed,
@@ -243,7 +246,9 @@ def apply(cfg: Dict[str, Any], dry_run: bool, profile: str) -> List[ActionResult
         notes=notes,
         commands=commands,
         files=files
-    ))
+    )
+    results.append(result)
+    postactions.request("regen-grub", result)
     
     # Control: Ensure secure boot options in GRUB
     control_id = "BOOT-5"
@@ -256,15 +261,12 @@ def apply(cfg: Dict[str, Any], dry_run: bool, profile: str) -> List[ActionResult
     
     try:
         # Check /proc/cmdline for security parameters
-        kernel_params_file = "/proc/cmdline"
         desired_params = {
             "audit=1": "Auditd enabled",
         }
+        current_params = (facts or HostFacts()).cmdline
         
-        if os.path.exists(kernel_params_file):
-            with open(kernel_params_file, "r", encoding="utf-8") as f:
-                current_params = f.read()
-            
+        if current_params:
             missing = []
             for param, desc in desired_params.items():
                 if param not in current_params:
@@ -275,6 +277,8 @@ def apply(cfg: Dict[str, Any], dry_run: bool, profile: str) -> List[ActionResult
                 notes += "\nTo apply, add to /etc/default/grub GRUB_CMDLINE_LINUX and run 'grub2-mkconfig -o /boot/grub2/grub.cfg'"
             else:
                 notes = "Kernel parameters are secure"
+        elif offline():
+            notes = "Offline root: the kernel command line is set from /etc/default/grub (BOOT-4) at first boot"
         
         results.append(ActionResult(
             id=control_id,
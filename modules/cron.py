@@ -1,9 +1,16 @@
 from typing import List, Dict, Any
 from .utils import ActionResult, ensure_perm, ensure_service_enabled, write_file
+from .facts import HostFacts
 
-def apply(cfg: Dict[str,Any], dry_run: bool, profile: str):
+READS = []
+WRITES = ["unit:crond.service", "file:/etc/cron.allow", "file:/etc/at.allow", "file:/etc/crontab",
+          "file:/etc/cron.hourly/", "file:/etc/cron.daily/", "file:/etc/cron.weekly/",
+          "file:/etc/cron.monthly/", "file:/etc/cron.d/"]
+DEPENDS = []
+
+def apply(cfg: Dict[str,Any], dry_run: bool, profile: str, facts: HostFacts=None):
     results=[]
-    ensure_service_enabled("crond", dry_run, results, "CRON-1", "Enable cron daemon")
+    ensure_service_enabled("crond", dry_run, results, "CRON-1", "Enable cron daemon", facts=facts)
     c1,n1=write_file("/etc/cron.allow","root\n", mode=0o600, dry_run=dry_run)
     c2,n2=write_file("/etc/at.allow","root\n", mode=0o600, dry_run=dry_run)
     results.append(ActionResult("CRON-2","Restrict cron/at to authorized users", c1 or c2, True, notes="; ".join([n1,n2]),
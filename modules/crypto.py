@@ -1,20 +1,30 @@
 from typing import List, Dict, Any
-from .utils import ActionResult, run
+from .utils import ActionResult, offline
+from .facts import HostFacts
+from . import executor, firstboot
+import shlex
 
-def apply(cfg: Dict[str,Any], dry_run: bool, profile: str):
-    if dry_run:
-        return [ActionResult("CRYPTO-1","Ensure system crypto policy is not LEGACY", False, True,
-                             notes="DRY-RUN: would check and set crypto policy to DEFAULT if LEGACY",
-                             commands=["update-crypto-policies --show","update-crypto-policies --set DEFAULT"])]
-    cp=run(["update-crypto-policies","--show"])
-    cur=(cp.stdout+cp.stderr).strip()
-    changed=False
+READS = ["crypto"]
+WRITES = ["crypto", "file:/etc/crypto-policies/"]
+DEPENDS = []
+
+def apply(cfg: Dict[str,Any], dry_run: bool, profile: str, facts: HostFacts=None):
+    facts = facts or HostFacts()
+    cur=facts.crypto_policy
+    changed="LEGACY" in cur
     ok=True
     notes=[f"current: {cur}"]
-    if "LEGACY" in cur:
-        changed=True
-        cp2=run(["update-crypto-policies","--set","DEFAULT"])
+    cmd=["update-crypto-policies","--set","DEFAULT"]
+    if changed and offline():
+        # The back-ends are regenerated on the booted system
+        notes.append("Deferred to first boot: "+shlex.join(cmd))
+        result=ActionResult("CRYPTO-1","Ensure system crypto policy is not LEGACY", True, True, notes="\n".join(notes),
+                            commands=[shlex.join(cmd)])
+        firstboot.defer(cmd, result)
+        return [result]
+    if changed:
+        cp2=executor.get(dry_run).run(cmd, mutating=True)
         ok = (cp2.returncode==0)
         notes.append((cp2.stdout+cp2.stderr).strip())
     return [ActionResult("CRYPTO-1","Ensure system crypto policy is not LEGACY", changed, ok, notes="\n".join(notes),
-                         commands=["update-crypto-policies --show","update-crypto-policies --set DEFAULT"])]
+                         commands=[shlex.join(cmd)] if changed else [])]
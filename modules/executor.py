@@ -0,0 +1,206 @@
+"""
+Central Command Executor
+Every external command goes through one Executor, which enforces:
+
+  - a per-command timeout and an optional run-wide deadline
+  - a limit on concurrently running commands
+  - a cap on captured stdout/stderr (the rest is drained and dropped)
+  - wall-clock and CPU time per command (from wait4 rusage), plus the time it
+    queued for a slot; with tracing enabled each command is also a trace span
+  - dry-run: commands marked mutating=True are not started and return a
+    successful CompletedProcess whose stdout says what would have run
+
+utils.run() delegates to the run-wide executor, so modules normally just call
+run(); modules that want dry-run handled for them use
+
+    ex = executor.get(dry_run)
+    cp = ex.run(["update-crypto-policies", "--set", "DEFAULT"], mutating=True)
+"""
+from typing import List, Dict, Any, Optional, Sequence
+import os, shlex, signal, subprocess, threading, time, asyncio, logging
+from . import accounting, trace
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 1800      # seconds per command
+DEFAULT_MAX_PARALLEL = 4
+DEFAULT_MAX_OUTPUT = 1 << 20  # bytes kept per stream
+TIMEOUT_RC = 124            # same as coreutils timeout(1)
+
+class CommandRecord:
+    __slots__ = ("cmd", "returncode", "started", "queued", "wall", "cpu_user", "cpu_sys",
+                 "timed_out", "truncated", "skipped", "thread")
+
+    def __init__(self, cmd: List[str]):
+        self.cmd = shlex.join(cmd)
+        self.returncode = None
+        self.started = time.time()
+        self.queued = self.wall = self.cpu_user = self.cpu_sys = 0.0
+        self.timed_out = self.truncated = self.skipped = False
+        self.thread = threading.get_ident()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {k: getattr(self, k) for k in self.__slots__}
+
+def _drain(stream, limit: int, out: list, flags: dict):
+    kept = 0
+    while True:
+        chunk = stream.read(65536)
+        if not chunk:
+            break
+        part = chunk[:max(limit - kept, 0)]
+        if part:
+            out.append(part)
+            kept += len(part)
+        if len(part) < len(chunk):
+            flags["truncated"] = True
+    stream.close()
+
+def _feed(stream, data: bytes):
+    try:
+        stream.write(data)
+    except BrokenPipeError:
+        pass
+    finally:
+        try:
+            stream.close()
+        except BrokenPipeError:
+            pass
+
+class Executor:
+    def __init__(self, dry_run: bool = False, timeout: float = DEFAULT_TIMEOUT, deadline: float = None,
+                 max_parallel: int = DEFAULT_MAX_PARALLEL, max_output: int = DEFAULT_MAX_OUTPUT):
+        """deadline is a time.monotonic() value after which no command may run"""
+        self.dry_run = dry_run
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_output = max_output
+        self._slots = threading.BoundedSemaphore(max_parallel)
+        self._lock = threading.Lock()
+        self.history: List[CommandRecord] = []
+
+    def view(self, dry_run: bool) -> "Executor":
+        """Same limits and history, different dry-run setting"""
+        if dry_run == self.dry_run:
+            return self
+        other = Executor.__new__(Executor)
+        other.__dict__.update(self.__dict__)
+        other.dry_run = dry_run
+        return other
+
+    def _record(self, rec: CommandRecord):
+        with self._lock:
+            self.history.append(rec)
+        if trace.enabled():
+            trace.complete(os.path.basename(rec.cmd.split(" ", 1)[0]), "command", rec.started, rec.wall,
+                           {"cmd": rec.cmd, "rc": rec.returncode, "queued": round(rec.queued, 6),
+                            "cpu": round(rec.cpu_user + rec.cpu_sys, 6), "timed_out": rec.timed_out,
+                            "skipped": rec.skipped})
+
+    def _budget(self, timeout: Optional[float]) -> Optional[float]:
+        t = self.timeout if timeout is None else timeout
+        if self.deadline is not None:
+            left = self.deadline - time.monotonic()
+            t = left if t is None else min(t, left)
+        return t
+
+    def run(self, cmd: List[str], check: bool = False, input: str = None, timeout: float = None,
+            mutating: bool = False) -> subprocess.CompletedProcess:
+        """
+        Run cmd with captured text output. Raises OSError if the program cannot
+        be started, CalledProcessError with check=True on a non-zero exit.
+        A timed-out command is killed (with its process group) and returns 124.
+        """
+        rec = CommandRecord(cmd)
+        if mutating and self.dry_run:
+            rec.skipped = True
+            rec.returncode = 0
+            self._record(rec)
+            return subprocess.CompletedProcess(cmd, 0, "DRY-RUN: would run " + rec.cmd, "")
+        budget = self._budget(timeout)
+        if budget is not None and budget <= 0:
+            rec.timed_out = True
+            rec.returncode = TIMEOUT_RC
+            self._record(rec)
+            return subprocess.CompletedProcess(cmd, TIMEOUT_RC, "", "Not started: run time limit reached")
+
+        with self._slots:
+            t0 = time.monotonic()
+            now = time.time()
+            rec.queued, rec.started = now - rec.started, now
+            proc = subprocess.Popen(cmd, stdin=subprocess.PIPE if input is not None else subprocess.DEVNULL,
+                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE, start_new_session=True)
+            accounting.add(subprocesses=1)
+            out: list = []
+            err: list = []
+            flags: Dict[str, bool] = {}
+            io = [threading.Thread(target=_drain, args=(proc.stdout, self.max_output, out, flags), daemon=True),
+                  threading.Thread(target=_drain, args=(proc.stderr, self.max_output, err, flags), daemon=True)]
+            if input is not None:
+                io.append(threading.Thread(target=_feed, args=(proc.stdin, input.encode()), daemon=True))
+            for t in io:
+                t.start()
+
+            def _kill():
+                rec.timed_out = True
+                try:
+                    os.killpg(proc.pid, signal.SIGKILL)
+                except OSError:
+                    pass
+            timer = threading.Timer(budget, _kill) if budget is not None else None
+            if timer:
+                timer.daemon = True
+                timer.start()
+            try:
+                _, status, usage = os.wait4(proc.pid, 0)
+            finally:
+                if timer:
+                    timer.cancel()
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            for t in io:
+                t.join()
+            rec.wall = time.monotonic() - t0
+            rec.cpu_user, rec.cpu_sys = usage.ru_utime, usage.ru_stime
+
+        stdout = b"".join(out).decode("utf-8", errors="replace")
+        stderr = b"".join(err).decode("utf-8", errors="replace")
+        rc = proc.returncode
+        if flags.get("truncated"):
+            rec.truncated = True
+            stderr += f"\n[output truncated to {self.max_output} bytes per stream]"
+        if rec.timed_out:
+            rc = TIMEOUT_RC
+            stderr += f"\nTimed out after {budget:.0f}s: {rec.cmd}"
+            logger.error(f"Command timed out after {budget:.0f}s: {rec.cmd}")
+        rec.returncode = rc
+        self._record(rec)
+        cp = subprocess.CompletedProcess(cmd, rc, stdout, stderr)
+        if check:
+            cp.check_returncode()
+        return cp
+
+    async def run_async(self, cmd: List[str], **kw) -> subprocess.CompletedProcess:
+        return await asyncio.to_thread(self._run_for, accounting.current(), cmd, **kw)
+
+    def _run_for(self, acc: Optional[accounting.Counters], cmd: List[str], **kw) -> subprocess.CompletedProcess:
+        # runs on a worker thread; count the command in the awaiting caller's scope
+        with accounting.attach(acc):
+            return self.run(cmd, **kw)
+
+    def run_many(self, cmds: Sequence[List[str]], **kw) -> List[subprocess.CompletedProcess]:
+        """Dispatch independent commands concurrently (bounded by max_parallel); results in input order"""
+        async def _all():
+            return await asyncio.gather(*(self.run_async(c, **kw) for c in cmds))
+        return list(asyncio.run(_all()))
+
+_DEFAULT = Executor()
+
+def configure(**kw) -> Executor:
+    """Replace the run-wide executor (see Executor for the options)"""
+    global _DEFAULT
+    _DEFAULT = Executor(**kw)
+    return _DEFAULT
+
+def get(dry_run: bool = None) -> Executor:
+    """The run-wide executor, optionally viewed with a specific dry-run setting"""
+    return _DEFAULT if dry_run is None else _DEFAULT.view(dry_run)
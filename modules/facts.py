@@ -0,0 +1,215 @@
+"""
+Host Fact Snapshot
+Collects installed packages, unit-file states, live sysctl values, loaded kernel
+modules, the mount table, the crypto policy and SELinux mode once per run.
+
+Modules receive the snapshot read-only; the runner invalidates individual
+sections after a module changes the corresponding part of the host, and the
+section is re-probed lazily on next access.
+
+For an offline root (--root) the runtime sections (live sysctl values, loaded
+kernel modules, mounts, kernel command line) are empty, configuration comes
+from the files under the root, and the SELinux runtime mode reads "offline".
+"""
+from typing import Dict, Any, Iterable, Tuple, FrozenSet, Mapping
+from types import MappingProxyType
+import os, threading
+from . import units as systemd_units
+from . import rpmdb
+from .utils import offline, rooted
+
+PROC_SYS = "/proc/sys"
+
+# Scheduler resource kinds (see modules/scheduler.py) mapped to fact sections
+RESOURCE_SECTIONS = {
+    "pkg": "packages",
+    "rpmdb": "packages",
+    "unit": "units",
+    "sysctl": "sysctl",
+    "kmod": "kmods",
+    "mount": "mounts",
+    "crypto": "crypto",
+    "selinux": "selinux",
+}
+
+def _read(path: str) -> str:
+    try:
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            return f.read()
+    except OSError:
+        return ""
+
+def sysctl_path(key: str) -> str:
+    return os.path.join(PROC_SYS, key.replace(".", "/"))
+
+def read_sysctl(key: str):
+    """Runtime value from /proc/sys with whitespace normalized, None if the key does not exist"""
+    if offline():
+        return None
+    try:
+        with open(sysctl_path(key), "r") as f:
+            return " ".join(f.read().split())
+    except OSError:
+        return None
+
+class HostFacts:
+    SECTIONS = ("packages", "units", "sysctl", "kmods", "mounts", "crypto", "selinux", "cmdline")
+
+    def __init__(self, sysctl_keys: Iterable[str] = (), units: Iterable[str] = ()):
+        self._sysctl_keys = list(sysctl_keys)
+        self._units = [systemd_units.unit_name(u) for u in units]
+        self._data: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+
+    def collect(self) -> "HostFacts":
+        """Probe every section now instead of on first access"""
+        for section in self.SECTIONS:
+            self._get(section)
+        return self
+
+    def invalidate(self, *sections: str):
+        with self._lock:
+            for section in sections or self.SECTIONS:
+                self._data.pop(section, None)
+
+    def invalidate_for(self, resources: Iterable[str]):
+        """Invalidate the sections backing scheduler resources such as "pkg:aide" or "sysctl" """
+        resources = list(resources)
+        if "*" in resources:
+            return self.invalidate()
+        self.invalidate(*{RESOURCE_SECTIONS[r.split(":", 1)[0]] for r in resources
+                          if r.split(":", 1)[0] in RESOURCE_SECTIONS})
+
+    def _get(self, section: str):
+        with self._lock:
+            if section not in self._data:
+                self._data[section] = getattr(self, "_collect_" + section)()
+            return self._data[section]
+
+    # Collectors - one pass each
+
+    def _collect_packages(self) -> FrozenSet[str]:
+        return frozenset(rpmdb.installed())
+
+    def _collect_units(self) -> Dict[str, Dict[str, str]]:
+        return systemd_units.show(self._units)
+
+    def _collect_sysctl(self) -> Dict[str, str]:
+        values = {}
+        for key in self._sysctl_keys:
+            values[key] = read_sysctl(key)
+        return values
+
+    def _collect_kmods(self) -> Mapping[str, Tuple[str, ...]]:
+        # /proc/modules: name size refcount used_by state offset
+        mods = {}
+        for ln in ("" if offline() else _read("/proc/modules")).splitlines():
+            parts = ln.split()
+            if len(parts) >= 4:
+                mods[parts[0]] = tuple(u for u in parts[3].split(",") if u and u != "-")
+        return MappingProxyType(mods)
+
+    def _collect_mounts(self) -> Tuple[Tuple[str, str, str, str], ...]:
+        mounts = []
+        for ln in ("" if offline() else _read("/proc/self/mounts")).splitlines():
+            parts = ln.split()
+            if len(parts) >= 4:
+                mounts.append((parts[0], parts[1], parts[2], parts[3]))
+        return tuple(mounts)
+
+    def _collect_crypto(self) -> str:
+        for path in ("/etc/crypto-policies/state/current", "/etc/crypto-policies/config"):
+            for ln in _read(rooted(path)).splitlines():
+                if ln.strip() and not ln.strip().startswith("#"):
+                    return ln.strip()
+        return ""
+
+    def _collect_selinux(self) -> Tuple[str, str]:
+        if offline():
+            runtime = "offline"
+        else:
+            enforce = _read("/sys/fs/selinux/enforce").strip()
+            runtime = {"1": "enforcing", "0": "permissive"}.get(enforce, "disabled")
+        configured = ""
+        for ln in _read(rooted("/etc/selinux/config")).splitlines():
+            if ln.strip().startswith("SELINUX="):
+                configured = ln.split("=", 1)[1].strip()
+        return runtime, configured
+
+    def _collect_cmdline(self) -> str:
+        return "" if offline() else _read("/proc/cmdline").strip()
+
+    # Read-only accessors
+
+    @property
+    def packages(self) -> FrozenSet[str]:
+        return self._get("packages")
+
+    def installed(self, pkg: str) -> bool:
+        return pkg in self.packages
+
+    def unit_status(self, *units: str) -> Dict[str, Mapping[str, str]]:
+        """LoadState/UnitFileState/ActiveState per unit; units not yet known are fetched in one batch"""
+        names = [systemd_units.unit_name(u) for u in units]
+        with self._lock:
+            data = self._get("units")
+            missing = [u for u in names if u not in data]
+            if missing:
+                data.update(systemd_units.show(missing))
+            return {u: MappingProxyType(data[u]) for u in names}
+
+    @property
+    def units(self) -> Mapping[str, Mapping[str, str]]:
+        with self._lock:
+            return MappingProxyType({u: MappingProxyType(st) for u, st in self._get("units").items()})
+
+    def unit_state(self, unit: str) -> str:
+        """UnitFileState of a unit ("" if the unit is not installed)"""
+        st = self.unit_status(unit)[systemd_units.unit_name(unit)]
+        return "" if st["LoadState"] in ("not-found", "unknown") else st["UnitFileState"]
+
+    def sysctl(self, key: str):
+        """Live value of a sysctl key with whitespace normalized, None if absent"""
+        with self._lock:
+            values = self._get("sysctl")
+            if key not in values:
+                values[key] = read_sysctl(key)
+            return values[key]
+
+    @property
+    def kmods(self) -> FrozenSet[str]:
+        return frozenset(self._get("kmods"))
+
+    def kmod_loaded(self, name: str) -> bool:
+        return name.replace("-", "_") in self._get("kmods")
+
+    def kmod_holders(self, name: str) -> Tuple[str, ...]:
+        """Loaded modules that use `name` (the used_by column of /proc/modules)"""
+        return self._get("kmods").get(name.replace("-", "_"), ())
+
+    @property
+    def mounts(self) -> Tuple[Tuple[str, str, str, str], ...]:
+        return self._get("mounts")
+
+    def mount(self, mountpoint: str):
+        """(device, mountpoint, fstype, options) for a mountpoint, None if not mounted"""
+        for m in self.mounts:
+            if m[1] == mountpoint:
+                return m
+        return None
+
+    @property
+    def crypto_policy(self) -> str:
+        return self._get("crypto")
+
+    @property
+    def selinux_mode(self) -> str:
+        return self._get("selinux")[0]
+
+    @property
+    def selinux_config(self) -> str:
+        return self._get("selinux")[1]
+
+    @property
+    def cmdline(self) -> str:
+        return self._get("cmdline")
@@ -1,9 +1,14 @@
 from typing import List, Dict, Any
 from .utils import ActionResult, ensure_perm
+from .facts import HostFacts
 
 TARGETS = [("/etc/passwd",0o644),("/etc/group",0o644),("/etc/shadow",0o000),("/etc/gshadow",0o000),("/etc/ssh/sshd_config",0o600)]
 
-def apply(cfg: Dict[str,Any], dry_run: bool, profile: str):
+READS = []
+WRITES = ["file:" + p for p, _ in TARGETS]
+DEPENDS = []
+
+def apply(cfg: Dict[str,Any], dry_run: bool, profile: str, facts: HostFacts=None):
     notes=[]; changed=False
     for p,mode in TARGETS:
         c,n=ensure_perm(p, mode, 0,0, dry_run=dry_run)
@@ -0,0 +1,112 @@
+"""
+Config-File Transactions
+Loads each file once, applies any number of key/regex edits in memory and
+writes every modified file exactly once, atomically, when the transaction is
+flushed (at the end of the `with` block):
+
+    with FileTransaction(dry_run) as tx:
+        c1, n1 = tx.set_kv("/etc/systemd/journald.conf", "Storage", "persistent", sep="=")
+        c2, n2 = tx.set_kv("/etc/systemd/journald.conf", "Compress", "yes", sep="=")
+
+Reads go through a run-wide cache keyed on inode/size/mtime, so modules that
+look at the same file (e.g. /etc/pam.d/system-auth) only read it once.
+Paths are host paths, resolved under the target root (utils.rooted).
+"""
+from typing import Dict, List, Tuple
+from .utils import atomic_write, set_kv, rooted
+from . import accounting
+import os, re, threading
+
+_CACHE: Dict[str, Tuple[Tuple[int, int, int], str]] = {}
+_CACHE_LOCK = threading.Lock()
+
+def read_cached(path: str) -> str:
+    """File content ("" if missing), served from the cache while the file is unchanged"""
+    real = rooted(path)
+    try:
+        st = os.stat(real)
+    except FileNotFoundError:
+        return ""
+    sig = (st.st_ino, st.st_size, st.st_mtime_ns)
+    with _CACHE_LOCK:
+        hit = _CACHE.get(path)
+        if hit and hit[0] == sig:
+            return hit[1]
+    with open(real, "r", encoding="utf-8", errors="ignore") as f:
+        content = f.read()
+    accounting.add(bytes_read=len(content))
+    with _CACHE_LOCK:
+        _CACHE[path] = (sig, content)
+    return content
+
+def forget(path: str):
+    with _CACHE_LOCK:
+        _CACHE.pop(path, None)
+
+class FileTransaction:
+    def __init__(self, dry_run: bool = False):
+        self.dry_run = dry_run
+        self._original: Dict[str, str] = {}
+        self._current: Dict[str, str] = {}
+        self._modes: Dict[str, int] = {}
+
+    def __enter__(self) -> "FileTransaction":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+        return False
+
+    def exists(self, path: str) -> bool:
+        return path in self._current or os.path.exists(rooted(path))
+
+    def read(self, path: str) -> str:
+        """Current content of path within this transaction"""
+        if path not in self._current:
+            self._original[path] = read_cached(path)
+            self._current[path] = self._original[path]
+        return self._current[path]
+
+    def _note(self, path: str, changed: bool, what: str) -> Tuple[bool, str]:
+        if not changed:
+            return False, "No change"
+        if self.dry_run:
+            return True, f"DRY-RUN: would update {path}: {what}"
+        return True, f"Updated {path}: {what}"
+
+    def set_kv(self, path: str, key: str, value: str, sep: str = " ", comment_prefix: str = "#") -> Tuple[bool, str]:
+        new, changed = set_kv(self.read(path), key, value, sep=sep, comment_prefix=comment_prefix)
+        self._current[path] = new
+        return self._note(path, changed, key)
+
+    def sub(self, path: str, pattern: str, repl: str, flags: int = 0, what: str = "") -> Tuple[bool, str]:
+        """re.sub over the file content"""
+        old = self.read(path)
+        new = re.sub(pattern, repl, old, flags=flags)
+        self._current[path] = new
+        return self._note(path, new != old, what or pattern)
+
+    def write(self, path: str, content: str, mode: int = None) -> Tuple[bool, str]:
+        """Replace the whole content (mode applies when the file is written)"""
+        old = self.read(path)
+        self._current[path] = content
+        if mode is not None:
+            self._modes[path] = mode
+        return self._note(path, content != old, "content")
+
+    def dirty(self) -> List[str]:
+        return [p for p in self._current if self._current[p] != self._original[p]]
+
+    def flush(self) -> Dict[str, Tuple[bool, str]]:
+        """Write every modified file once; returns {path: (changed, note)}"""
+        out = {}
+        for path in self.dirty():
+            if self.dry_run:
+                out[path] = (True, "DRY-RUN: would write " + path)
+                continue
+            atomic_write(rooted(path), self._current[path], self._modes.get(path))
+            forget(path)
+            self._original[path] = self._current[path]
+            out[path] = (True, "Wrote " + path)
+        return out
@@ -1,49 +1,88 @@
 from typing import List, Dict, Any
-from .utils import ActionResult, ensure_pkg, ensure_service_enabled, run
+from .utils import ActionResult, ensure_pkg, ensure_service_enabled, run, offline
+from .facts import HostFacts
+from . import executor, postactions, firstboot
 import shlex
 
-def apply(cfg: Dict[str,Any], dry_run: bool, profile: str) -> List[ActionResult]:
+PKG_INSTALL = {"FW-1": ["firewalld"]}
+
+READS = ["pkg:firewalld"]
+WRITES = ["unit:firewalld.service", "firewalld"]
+DEPENDS = []
+
+def apply(cfg: Dict[str,Any], dry_run: bool, profile: str, facts: HostFacts=None) -> List[ActionResult]:
     results=[]
-    ensure_pkg(["firewalld"], dry_run, results, "FW-1", "Install firewalld")
-    ensure_service_enabled("firewalld", dry_run, results, "FW-2", "Enable firewalld")
+    ensure_pkg(["firewalld"], dry_run, results, "FW-1", "Install firewalld", facts=facts)
+    ensure_service_enabled("firewalld", dry_run, results, "FW-2", "Enable firewalld", facts=facts)
 
     zone = str(cfg.get("zone","public"))
     enforce = bool(cfg.get("enforce_allowlist", False))
     allow_services = cfg.get("allow_services", [])
     allow_ports = cfg.get("allow_ports", [])
 
-    cmds=[["firewall-cmd","--set-default-zone",zone]]
+    if offline():
+        results.append(_defer(zone, enforce, [str(s) for s in allow_services], [str(p) for p in allow_ports]))
+        return results
+
+    # Compare against the live configuration and only issue the differences
+    cmds=[]
+    try:
+        current=run(["firewall-cmd","--get-default-zone"]).stdout.strip()
+    except OSError:
+        current=""
+    if current!=zone:
+        cmds.append(["firewall-cmd","--set-default-zone",zone])
 
+    permanent=[]
     if enforce:
-        bash_lines = [
-          "set -e",
-          f'ZONE={shlex.quote(zone)}',
-          'SVCS="$(firewall-cmd --zone=\"$ZONE\" --list-services || true)"',
-          'PORTS="$(firewall-cmd --zone=\"$ZONE\" --list-ports || true)"',
-          'for s in $SVCS; do firewall-cmd --permanent --zone=\"$ZONE\" --remove-service=\"$s\" || true; done',
-          'for p in $PORTS; do firewall-cmd --permanent --zone=\"$ZONE\" --remove-port=\"$p\" || true; done',
-        ]
-        for s in allow_services:
-            bash_lines.append(f'firewall-cmd --permanent --zone=\"$ZONE\" --add-service={shlex.quote(str(s))}')
-        for p in allow_ports:
-            bash_lines.append(f'firewall-cmd --permanent --zone=\"$ZONE\" --add-port={shlex.quote(str(p))}')
-        bash_lines.append("firewall-cmd --reload")
-        cmds.append(["bash","-lc","\n".join(bash_lines)])
-    else:
-        cmds.append(["firewall-cmd","--reload"])
-
-    if dry_run:
+        def listed(what):
+            try:
+                return run(["firewall-cmd","--permanent",f"--zone={zone}",f"--list-{what}"]).stdout.split()
+            except OSError:
+                return []
+        have_svcs, have_ports = listed("services"), listed("ports")
+        want_svcs, want_ports = [str(s) for s in allow_services], [str(p) for p in allow_ports]
+        permanent += [["firewall-cmd","--permanent",f"--zone={zone}",f"--remove-service={s}"] for s in have_svcs if s not in want_svcs]
+        permanent += [["firewall-cmd","--permanent",f"--zone={zone}",f"--remove-port={p}"] for p in have_ports if p not in want_ports]
+        permanent += [["firewall-cmd","--permanent",f"--zone={zone}",f"--add-service={s}"] for s in want_svcs if s not in have_svcs]
+        permanent += [["firewall-cmd","--permanent",f"--zone={zone}",f"--add-port={p}"] for p in want_ports if p not in have_ports]
+    cmds += permanent
+
+    if not cmds:
         results.append(ActionResult("FW-3","Configure firewalld", False, True,
-                                    notes="DRY-RUN: would run\n" + "\n".join(shlex.join(c) for c in cmds),
-                                    commands=[shlex.join(c) for c in cmds]))
+                                    notes=f"Default zone {zone} already set" + ("; allowlist already enforced" if enforce else "")))
         return results
 
+    ex=executor.get(dry_run)
     out=[]
     ok=True
     for c in cmds:
-        cp=run(c)
+        cp=ex.run(c, mutating=True)
         out.append((cp.stdout+cp.stderr).strip())
         ok = ok and (cp.returncode==0)
-    results.append(ActionResult("FW-3","Configure firewalld", True, ok, notes="\n".join(o for o in out if o),
-                                commands=[shlex.join(c) for c in cmds]))
+    result=ActionResult("FW-3","Configure firewalld", True, ok, notes="\n".join(o for o in out if o),
+                        commands=[shlex.join(c) for c in cmds])
+    results.append(result)
+    # Permanent changes take effect on the next reload, done once at the end of the run
+    if permanent:
+        postactions.request("reload-firewalld", result)
     return results
+
+def _defer(zone: str, enforce: bool, want_svcs: List[str], want_ports: List[str]) -> ActionResult:
+    """There is no live configuration to compare with in an offline root: queue commands that are safe to repeat"""
+    base=["firewall-cmd","--permanent",f"--zone={zone}"]
+    cmds=[["firewall-cmd","--set-default-zone",zone]]
+    if enforce:
+        # Whatever the image ships with is only known once it is running
+        keep_s, keep_p = " ".join(want_svcs), " ".join(want_ports)
+        for what, keep in (("service", keep_s), ("port", keep_p)):
+            cmds.append(["sh","-c",f'for x in $({shlex.join(base)} --list-{what}s); do '
+                                   f'case " {keep} " in *" $x "*) ;; *) {shlex.join(base)} --remove-{what}="$x";; esac; done'])
+        cmds += [base+[f"--add-service={s}"] for s in want_svcs] + [base+[f"--add-port={p}"] for p in want_ports]
+    cmds.append(["firewall-cmd","--reload"])
+    result=ActionResult("FW-3","Configure firewalld", True, True,
+                        notes=f"Deferred to first boot: default zone {zone}" + ("; allowlist" if enforce else ""),
+                        commands=[shlex.join(c) for c in cmds])
+    for c in cmds:
+        firstboot.defer(c, result)
+    return result
@@ -0,0 +1,109 @@
+"""
+First-Boot Deferred Actions
+With --root the target is an image or chroot that is not running, so commands
+that need the booted system (authselect, update-crypto-policies, grub2-mkconfig,
+aide --init, firewall-cmd) cannot run at hardening time. Modules defer them:
+
+    result = ActionResult("CRYPTO-1", ..., notes="Deferred to first boot: ...")
+    firstboot.defer(["update-crypto-policies", "--set", "DEFAULT"], result)
+
+flush() writes every deferred command, once and in request order, into a
+script in the image and enables a oneshot unit that runs it on the first boot
+(and on later boots until it has succeeded once).
+"""
+from typing import List, Tuple
+from .utils import ActionResult, write_file
+from .units import systemctl
+from . import executor
+import shlex, threading
+
+SCRIPT = "/usr/local/libexec/cis-firstboot.sh"
+UNIT_NAME = "cis-firstboot.service"
+UNIT = "/etc/systemd/system/" + UNIT_NAME
+DONE = "/var/lib/cis_apply/firstboot.done"
+LOG = "/var/log/cis-firstboot.log"
+
+_LOCK = threading.Lock()
+_QUEUE: List[Tuple[List[str], List[ActionResult]]] = []
+
+def reset():
+    """Forget everything deferred by a previous run"""
+    with _LOCK:
+        del _QUEUE[:]
+
+def defer(cmd: List[str], result: ActionResult):
+    """Run cmd on the first boot of the target, on behalf of `result`"""
+    with _LOCK:
+        for queued, triggers in _QUEUE:
+            if queued == cmd:
+                if result not in triggers:
+                    triggers.append(result)
+                return
+        _QUEUE.append((list(cmd), [result]))
+
+def pending() -> List[str]:
+    with _LOCK:
+        return [shlex.join(c) for c, _ in _QUEUE]
+
+def holds(result: ActionResult) -> bool:
+    """True while `result` waits for the first-boot unit to be installed"""
+    with _LOCK:
+        return any(t is result for _, triggers in _QUEUE for t in triggers)
+
+def script(cmds: List[List[str]]) -> str:
+    lines = ["#!/bin/sh",
+             "# Generated by cis hardening scripts: actions deferred from an offline (--root) run",
+             f"exec >>{LOG} 2>&1",
+             "rc=0",
+             'run() { echo "+ $*"; "$@" || { echo "FAILED ($?): $*"; rc=1; }; }']
+    lines += ["run " + shlex.join(c) for c in cmds]
+    lines += [f'[ "$rc" -eq 0 ] && mkdir -p {shlex.quote(DONE.rsplit("/", 1)[0])} && touch {shlex.quote(DONE)}',
+              'exit "$rc"']
+    return "\n".join(lines) + "\n"
+
+def unit() -> str:
+    return "\n".join([
+        "# Generated by cis hardening scripts",
+        "[Unit]",
+        "Description=CIS hardening actions deferred from offline hardening",
+        f"ConditionPathExists=!{DONE}",
+        "Wants=network-online.target",
+        "After=network-online.target firewalld.service auditd.service",
+        "",
+        "[Service]",
+        "Type=oneshot",
+        f"ExecStart={SCRIPT}",
+        "RemainAfterExit=yes",
+        "",
+        "[Install]",
+        "WantedBy=multi-user.target",
+    ]) + "\n"
+
+def flush(dry_run: bool) -> List[ActionResult]:
+    """Write the first-boot script and unit for everything deferred; one FIRSTBOOT result"""
+    with _LOCK:
+        queue = [(list(c), list(t)) for c, t in _QUEUE]
+        del _QUEUE[:]
+    if not queue:
+        return []
+    why = "Deferred by " + ", ".join(dict.fromkeys(t.id for _, ts in queue for t in ts))
+    try:
+        c1, n1 = write_file(SCRIPT, script([c for c, _ in queue]), mode=0o750, dry_run=dry_run)
+        c2, n2 = write_file(UNIT, unit(), mode=0o644, dry_run=dry_run)
+        cmd = systemctl("enable", UNIT_NAME)
+        cp = executor.get(dry_run).run(cmd, mutating=True)
+        ok = cp.returncode == 0
+        notes = [n1, n2, (cp.stdout + cp.stderr).strip()]
+    except OSError as e:
+        c1 = c2 = False
+        ok, notes, cmd = False, [str(e)], []
+    notes += [f"{len(queue)} command(s) run by {UNIT_NAME} on first boot:"] + ["  " + shlex.join(c) for c, _ in queue]
+    result = ActionResult("FIRSTBOOT-1", "Install first-boot unit for deferred actions", c1 or c2, ok,
+                          notes="\n".join(n for n in notes + [why] if n),
+                          commands=[shlex.join(cmd)] if cmd else [], files=[SCRIPT, UNIT])
+    if not ok:
+        for _, triggers in queue:
+            for t in triggers:
+                t.ok = False
+                t.notes = (t.notes + "\n" if t.notes else "") + "First-boot unit could not be installed"
+    return [result]
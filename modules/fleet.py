@@ -0,0 +1,248 @@
+"""
+Fleet Runner
+Runs the hardening runner on many hosts at once through a Transport and hands
+back one entry per host as soon as it finishes:
+
+    hosts = fleet.load_inventory("inventory.yaml")
+    for entry in fleet.run_fleet(hosts, fleet.SSHTransport(), args, jobs=20, config=text):
+        sink.write(json.dumps(entry) + "\\n")
+
+Each host gets the shared config on stdin (--config -) and prints its report on
+stdout (--report -). Hosts run through a dedicated Executor, so every host has
+a timeout and a cap on captured output, and a hung or unreachable host only
+takes up its own slot. Finished entries go through a queue with `jobs` slots.
+If the consumer falls behind, the queue fills, workers block and no further
+hosts are started, so memory stays bounded however large the inventory is.
+
+Transports turn (host, runner arguments) into a local command line:
+  ssh    - ssh <address> sudo -n python3 <remote runner> ...
+  local  - the local runner with --root <dir>, or `podman exec <container>`
+           for a container; a stand-in for testing without a fleet
+"""
+from typing import List, Dict, Any, Iterator, Optional
+from dataclasses import dataclass, field
+from datetime import datetime
+from . import executor
+import os, sys, abc, json, heapq, shlex, queue, threading, time, logging
+import yaml
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOBS = 10
+DEFAULT_HOST_TIMEOUT = 3600   # seconds for one host's run, connection included
+MAX_OUTPUT = 64 << 20         # bytes of report/log kept per host and stream
+SSH_UNREACHABLE = 255         # ssh's own exit status for connection failures
+FAILED_SAMPLE = 100           # failed hosts named in the summary; the rest are only counted
+SLOWEST = 10                  # slowest hosts named in the summary
+
+RUNNER = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cis_apply_enhanced.py")
+REMOTE_RUNNER = ["sudo", "-n", "/usr/bin/python3", "/opt/cis_apply/cis_apply_enhanced.py"]
+
+@dataclass
+class Host:
+    name: str
+    address: str = ""
+    user: str = ""
+    root: str = ""         # local transport: offline root directory
+    container: str = ""    # local transport: container name
+    vars: Dict[str, Any] = field(default_factory=dict)
+
+    def target(self) -> str:
+        addr = self.address or self.name
+        return f"{self.user}@{addr}" if self.user else addr
+
+def load_inventory(path: str) -> List[Host]:
+    """
+    Hosts from a YAML inventory (a list, or a mapping with a `hosts` list, of
+    names or {name, address, user, root, container, ...} mappings) or from a
+    plain file with one host per line (`#` comments allowed)
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    try:
+        data = yaml.safe_load(text)
+    except yaml.YAMLError:
+        data = None
+    if isinstance(data, dict):
+        data = data.get("hosts", [])
+    if not isinstance(data, list):
+        data = [ln.split("#", 1)[0].strip() for ln in text.splitlines()]
+    hosts: List[Host] = []
+    seen = set()
+    for item in data:
+        if isinstance(item, dict):
+            known = {k: str(item[k]) for k in ("name", "address", "user", "root", "container") if item.get(k)}
+            if "name" not in known:
+                known["name"] = known.get("address") or known.get("container") or known.get("root", "")
+            h = Host(**known, vars={k: v for k, v in item.items() if k not in known})
+        elif item:
+            h = Host(name=str(item))
+        else:
+            continue
+        if not h.name:
+            raise ValueError(f"{path}: inventory entry without a name: {item!r}")
+        if h.name in seen:
+            raise ValueError(f"{path}: duplicate host {h.name}")
+        seen.add(h.name)
+        hosts.append(h)
+    return hosts
+
+class Transport(abc.ABC):
+    """How a host is reached: builds the local command that runs the runner there"""
+    name = ""
+
+    @abc.abstractmethod
+    def command(self, host: Host, args: List[str]) -> List[str]:
+        """Local command line that runs the runner with args on host"""
+
+    def describe(self, host: Host) -> str:
+        return host.target()
+
+class SSHTransport(Transport):
+    name = "ssh"
+    OPTIONS = ["-o", "BatchMode=yes", "-o", "ConnectTimeout=30",
+               "-o", "ServerAliveInterval=30", "-o", "ServerAliveCountMax=4"]
+
+    def __init__(self, ssh: str = "ssh", options: List[str] = (), remote: List[str] = None):
+        self.ssh = ssh
+        self.options = self.OPTIONS + list(options)
+        self.remote = list(remote or REMOTE_RUNNER)
+
+    def command(self, host: Host, args: List[str]) -> List[str]:
+        # ssh hands the remote side a single shell string
+        return [self.ssh] + self.options + [host.target(), shlex.join(self.remote + list(args))]
+
+class LocalTransport(Transport):
+    name = "local"
+
+    def __init__(self, python: str = sys.executable, runner: str = RUNNER, engine: str = "podman",
+                 remote: List[str] = None):
+        self.python = python
+        self.runner = runner
+        self.engine = engine
+        self.remote = list(remote or REMOTE_RUNNER[2:])
+
+    def command(self, host: Host, args: List[str]) -> List[str]:
+        if host.container:
+            return [self.engine, "exec", "-i", host.container] + self.remote + list(args)
+        if host.root:
+            return [self.python, self.runner, "--root", host.root] + list(args)
+        return [self.python, self.runner] + list(args)
+
+    def describe(self, host: Host) -> str:
+        return f"container {host.container}" if host.container else host.root or "localhost"
+
+TRANSPORTS = {"ssh": SSHTransport, "local": LocalTransport}
+
+def _tail(text: str, n: int = 2000) -> str:
+    text = text.strip()
+    return text if len(text) <= n else "..." + text[-n:]
+
+def run_host(host: Host, transport: Transport, args: List[str], ex: executor.Executor,
+             config: str = None) -> Dict[str, Any]:
+    """Run on one host; never raises, every failure becomes the entry's status"""
+    entry: Dict[str, Any] = {"type": "host", "host": host.name, "target": transport.describe(host),
+                             "started": datetime.now().isoformat()}
+    t0 = time.monotonic()
+    try:
+        cp = ex.run(transport.command(host, args), input=config if config is not None else "")
+    except Exception as e:
+        entry.update(status="error", ok=False, returncode=None, error=str(e),
+                     duration=round(time.monotonic() - t0, 3))
+        return entry
+    entry["duration"] = round(time.monotonic() - t0, 3)
+    entry["returncode"] = cp.returncode
+    report: Optional[Dict[str, Any]] = None
+    if cp.stdout.strip():
+        try:
+            report = json.loads(cp.stdout)
+        except ValueError:
+            report = None
+    if cp.returncode == executor.TIMEOUT_RC and report is None:
+        status = "timeout"
+    elif transport.name == "ssh" and cp.returncode == SSH_UNREACHABLE and report is None:
+        status = "unreachable"
+    elif not isinstance(report, dict):
+        status = "error"
+    else:
+        status = "ok" if report.get("ok") else "failed"
+    entry["status"] = status
+    entry["ok"] = status == "ok"
+    if isinstance(report, dict):
+        entry["summary"] = {"mode": report.get("mode"), **report.get("execution", {})}
+        entry["report"] = report
+    if status != "ok":
+        entry["error"] = _tail(cp.stderr)
+    return entry
+
+def run_fleet(hosts: List[Host], transport: Transport, args: List[str], jobs: int = DEFAULT_JOBS,
+              timeout: float = DEFAULT_HOST_TIMEOUT, config: str = None) -> Iterator[Dict[str, Any]]:
+    """Run args on every host, at most `jobs` at a time; yields host entries in completion order"""
+    ex = executor.Executor(timeout=timeout, max_parallel=jobs, max_output=MAX_OUTPUT)
+    todo: "queue.Queue[Host]" = queue.Queue()
+    for h in hosts:
+        todo.put(h)
+    # Backpressure: a worker holding a finished entry waits for the consumer
+    # before it picks up the next host
+    done: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=jobs)
+
+    def worker():
+        while True:
+            try:
+                h = todo.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                entry = run_host(h, transport, args, ex, config)
+            except Exception as e:  # run_host reports failures itself; this is a last resort
+                entry = {"type": "host", "host": h.name, "status": "error", "ok": False, "error": str(e)}
+            done.put(entry)
+
+    for i in range(min(jobs, len(hosts))):
+        threading.Thread(target=worker, name=f"fleet-{i}", daemon=True).start()
+    for _ in hosts:
+        yield done.get()
+
+class Tally:
+    """
+    Fleet-wide trailer built up from host entries as they stream past. Memory
+    does not grow with the fleet: failed hosts are counted and the first
+    FAILED_SAMPLE named, and only the SLOWEST longest runs are kept.
+    """
+
+    def __init__(self):
+        self.statuses: Dict[str, int] = {}
+        self.controls = self.passed = self.failed = 0
+        self.failed_hosts: List[str] = []
+        self.failed_host_count = 0
+        self.durations: List[tuple] = []   # min-heap of (duration, host)
+
+    def add(self, entry: Dict[str, Any]):
+        self.statuses[entry["status"]] = self.statuses.get(entry["status"], 0) + 1
+        s = entry.get("summary") or {}
+        self.controls += s.get("total_controls", 0)
+        self.passed += s.get("passed", 0)
+        self.failed += s.get("failed", 0)
+        if not entry["ok"]:
+            self.failed_host_count += 1
+            if len(self.failed_hosts) < FAILED_SAMPLE:
+                self.failed_hosts.append(entry["host"])
+        if "duration" in entry:
+            if len(self.durations) < SLOWEST:
+                heapq.heappush(self.durations, (entry["duration"], entry["host"]))
+            else:
+                heapq.heappushpop(self.durations, (entry["duration"], entry["host"]))
+
+    def to_dict(self, elapsed: float) -> Dict[str, Any]:
+        return {
+            "type": "summary",
+            "hosts": sum(self.statuses.values()),
+            "ok": self.statuses.get("ok", 0),
+            "statuses": dict(sorted(self.statuses.items())),
+            "controls": {"total": self.controls, "passed": self.passed, "failed": self.failed,
+                         "compliance_percentage": round(self.passed / self.controls * 100, 1) if self.controls else 0},
+            "failed_hosts": sorted(self.failed_hosts),
+            "failed_host_count": self.failed_host_count,
+            "slowest_hosts": [{"host": h, "duration": d} for d, h in sorted(self.durations, reverse=True)],
+            "duration": round(elapsed, 3),
+        }
@@ -0,0 +1,374 @@
+"""
+Whole-Filesystem Scanner
+Walks every local filesystem once and collects, in the same pass, everything
+the CIS file-system checks look for:
+
+    inv = fsscan.scan(exclude=("/var/lib/containers/*",))
+    inv.world_writable    # [Entry(path, mode, uid, gid)] regular files with o+w
+    inv.unsticky          # world-writable directories without the sticky bit
+    inv.unowned           # files and directories whose uid/gid has no account
+    inv.ungrouped
+    inv.privileged        # setuid/setgid regular files
+
+Mounts come from /proc/self/mountinfo. Pseudo and network filesystems are
+skipped (SKIP_FSTYPES, NETWORK_FSTYPES, fuse.*). Each device is walked once,
+by its own thread, and the walk never leaves that device, so a filesystem that
+is mounted twice is still walked once. With --root the target tree is walked,
+plus any local mounts below it.
+
+The walk goes through directory descriptors with permwalk.walk(), and each
+entry is lstat'ed once. It is not recursive, keeps at most permwalk.MAX_OPEN
+directories open per walker, and reports subtrees deeper than
+permwalk.MAX_DEPTH as errors instead of walking them. The result is cached in /var/lib/cis_apply/fsscan.json, which
+holds per directory its mtime, subdirectories, flagged entries (mode findings
+and unknown owners) and the uids/gids that resolved. The next scan fstat()s
+each directory and reuses the cached entries when its mtime has not changed;
+only directories whose mtime changed (or one of whose owners stopped
+resolving) are listed and their entries stat'ed again. A chmod or chown of
+an existing file does not change its directory's mtime, so the cache is only
+trusted for `full_scan_days` and the next scan after that is a full one.
+Scans with different exclude/skip_fstypes settings (fsscan itself, the audit
+module's privileged-command rules) keep separate entries in the same file.
+Dry-run and verify scans read the cache but never write it.
+"""
+from typing import List, Dict, Any, Tuple, NamedTuple, Optional, Callable
+from concurrent.futures import ThreadPoolExecutor
+from .utils import ActionResult, atomic_write, rooted, offline
+from .facts import HostFacts
+from . import permwalk, trace, utils
+import os, re, pwd, grp, json, stat, time, fnmatch, hashlib, threading, logging
+
+logger = logging.getLogger(__name__)
+
+CACHE = "/var/lib/cis_apply/fsscan.json"
+FORMAT = 2
+FULL_SCAN_DAYS = 7
+MAX_WALKERS = 8
+SAMPLE = 10  # offenders named per result
+
+SKIP_FSTYPES = {"proc", "sysfs", "devtmpfs", "devpts", "cgroup", "cgroup2", "securityfs", "debugfs",
+                "tracefs", "configfs", "pstore", "bpf", "mqueue", "hugetlbfs", "autofs", "fusectl",
+                "binfmt_misc", "rpc_pipefs", "nsfs", "efivarfs", "selinuxfs", "nfsd"}
+NETWORK_FSTYPES = {"nfs", "nfs4", "cifs", "smb3", "smbfs", "ceph", "glusterfs", "9p", "afs", "lustre",
+                   "gpfs", "fuse", "fuseblk"}
+
+DIR_FLAGS = permwalk.DIR_FLAGS
+FILE_FLAGS = permwalk.FILE_FLAGS
+
+# Mode-based findings, decided from the entry alone and therefore cacheable
+WORLD_WRITABLE, UNSTICKY, PRIVILEGED = 1, 2, 4
+
+READS = ["mount"]
+WRITES = ["file:" + CACHE]
+DEPENDS = []
+# The walk itself is what tells whether anything changed
+VOLATILE = ["FS-1", "FS-2", "FS-3"]
+
+class Entry(NamedTuple):
+    path: str
+    mode: int
+    uid: int
+    gid: int
+    dev: int = 0
+    ino: int = 0
+
+    def __str__(self) -> str:
+        return f"{self.path} {oct(stat.S_IMODE(self.mode))} {self.uid}:{self.gid}"
+
+class Inventory:
+    """Findings of one scan, with target paths"""
+
+    def __init__(self):
+        self.world_writable: List[Entry] = []
+        self.unsticky: List[Entry] = []
+        self.unowned: List[Entry] = []
+        self.ungrouped: List[Entry] = []
+        self.privileged: List[Entry] = []
+        self.mounts: List[str] = []
+        self.errors: List[str] = []
+        self.dirs = self.listed = self.stated = 0
+        self.full = True
+
+    def sort(self):
+        for lst in (self.world_writable, self.unsticky, self.unowned, self.ungrouped, self.privileged):
+            lst.sort()
+
+def local_mounts(skip_fstypes=()) -> List[Tuple[str, str]]:
+    """
+    [(target mount point, fstype)] of local filesystems, one per device (the
+    mount with the shortest filesystem root wins for bind mounts)
+    """
+    skip = SKIP_FSTYPES | set(skip_fstypes)
+    try:
+        with open("/proc/self/mountinfo", "r", encoding="utf-8", errors="replace") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        lines = []
+    base = utils.ROOT.rstrip("/") if offline() else ""
+    # Later mounts hide earlier ones on the same mount point
+    visible: Dict[str, Tuple[str, str, str]] = {}
+    for ln in lines:
+        left, _, right = ln.partition(" - ")
+        parts, rparts = left.split(), right.split()
+        if len(parts) < 5 or not rparts:
+            continue
+        mp = _unescape(parts[4])
+        if base:
+            if mp != base and not mp.startswith(base + "/"):
+                continue
+            mp = mp[len(base):] or "/"
+        visible[mp] = (parts[2], _unescape(parts[3]), rparts[0])
+    best: Dict[str, Tuple[int, str, str]] = {}
+    for mp, (dev, fsroot, fstype) in visible.items():
+        if fstype in skip or fstype in NETWORK_FSTYPES or fstype.startswith("fuse."):
+            continue
+        if dev not in best or len(fsroot) < best[dev][0]:
+            best[dev] = (len(fsroot), mp, fstype)
+    mounts = sorted((mp, fstype) for _, mp, fstype in best.values())
+    if base and not any(mp == "/" for mp, _ in mounts):
+        # A plain directory tree, not a mount point of its own
+        mounts.insert(0, ("/", "dir"))
+    return mounts
+
+def _unescape(field: str) -> str:
+    return re.sub(r"\\([0-7]{3})", lambda m: chr(int(m.group(1), 8)), field)
+
+def _resolver(db: str, live: Callable[[int], Any]) -> Callable[[int], bool]:
+    """id -> known; NSS on the running host, the target's file offline"""
+    if offline():
+        known = set(permwalk.account_ids(db).values())
+        return known.__contains__
+    memo: Dict[int, bool] = {}
+
+    def resolves(i: int) -> bool:
+        if i not in memo:
+            try:
+                live(i)
+                memo[i] = True
+            except KeyError:
+                memo[i] = False
+        return memo[i]
+    return resolves
+
+def _flags(mode: int) -> int:
+    f = 0
+    if stat.S_ISREG(mode):
+        if mode & stat.S_IWOTH:
+            f |= WORLD_WRITABLE
+        if mode & (stat.S_ISUID | stat.S_ISGID):
+            f |= PRIVILEGED
+    elif stat.S_ISDIR(mode) and mode & stat.S_IWOTH and not mode & stat.S_ISVTX:
+        f |= UNSTICKY
+    return f
+
+def _load(path: str) -> Dict[str, Any]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) and data.get("format") == FORMAT else {}
+
+_LOCK = threading.Lock()
+
+def _walk(mp: str, old: Dict[str, list], skip, user_ok, group_ok, inv: Inventory) -> Dict[str, list]:
+    """Walk one mount; returns its new directory cache and adds findings to inv"""
+    dirs: Dict[str, list] = {}
+    prefix = mp.rstrip("/") + "/"
+
+    def add(path: str, mode: int, uid: int, gid: int, flags: int, dev: int, ino: int):
+        e = Entry(path, mode, uid, gid, dev, ino)
+        if flags & WORLD_WRITABLE:
+            inv.world_writable.append(e)
+        if flags & UNSTICKY:
+            inv.unsticky.append(e)
+        if flags & PRIVILEGED:
+            inv.privileged.append(e)
+        if not user_ok(uid):
+            inv.unowned.append(e)
+        if not group_ok(gid):
+            inv.ungrouped.append(e)
+
+    def visit(dfd: int, rel: str) -> List[str]:
+        inv.dirs += 1
+        mtime = os.fstat(dfd).st_mtime_ns
+        cached = old.get(rel)
+        # Entries with unknown owners are kept; the ids that did resolve must still do
+        if cached and cached[0] == mtime and all(map(user_ok, cached[3])) and all(map(group_ok, cached[4])):
+            _, subdirs, flagged, uids, gids = cached
+            for name, mode, uid, gid, ino in flagged:
+                add(prefix + rel + name, mode, uid, gid, _flags(mode), dev, ino)
+        else:
+            try:
+                with os.scandir(dfd) as it:
+                    entries = list(it)
+            except OSError as e:
+                inv.errors.append(f"{prefix}{rel}: {e.strerror}")
+                return []
+            inv.listed += 1
+            subdirs, flagged, uids, gids = [], [], set(), set()
+            for e in entries:
+                if skip is not None and skip.match(prefix + rel + e.name):
+                    continue
+                try:
+                    st = e.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                inv.stated += 1
+                if st.st_dev != dev:
+                    continue  # a mount point; its device is walked on its own
+                if stat.S_ISDIR(st.st_mode):
+                    subdirs.append(e.name)
+                flags = _flags(st.st_mode)
+                known_uid, known_gid = user_ok(st.st_uid), group_ok(st.st_gid)
+                if known_uid:
+                    uids.add(st.st_uid)
+                if known_gid:
+                    gids.add(st.st_gid)
+                if flags or not known_uid or not known_gid:
+                    flagged.append([e.name, st.st_mode, st.st_uid, st.st_gid, st.st_ino])
+                    add(prefix + rel + e.name, st.st_mode, st.st_uid, st.st_gid, flags, dev, st.st_ino)
+            uids, gids = sorted(uids), sorted(gids)
+        dirs[rel] = [mtime, subdirs, flagged, uids, gids]
+        return subdirs
+
+    with trace.span("fsscan", "file", path=mp):
+        try:
+            fd: Optional[int] = os.open(rooted(mp), DIR_FLAGS)
+        except OSError as e:
+            inv.errors.append(f"{mp}: {e.strerror}")
+            return dirs
+        try:
+            # The mount point itself is not on the parent's device
+            st = os.fstat(fd)
+            dev = st.st_dev
+            add(mp, st.st_mode, st.st_uid, st.st_gid, _flags(st.st_mode), dev, st.st_ino)
+            permwalk.walk(fd, visit, inv.errors, prefix, dev)
+        finally:
+            os.close(fd)
+    return dirs
+
+def scan(exclude=(), skip_fstypes=(), full_scan_days: float = FULL_SCAN_DAYS, jobs: int = MAX_WALKERS,
+         use_cache: bool = True, dry_run: bool = False) -> Inventory:
+    """Walk every local filesystem of the target; see the module docstring. dry_run leaves the cache as it is"""
+    skip = re.compile("|".join(fnmatch.translate(p) for p in exclude)) if exclude else None
+    key = hashlib.sha256(json.dumps([sorted(exclude), sorted(skip_fstypes)]).encode()).hexdigest()
+    user_ok = _resolver("/etc/passwd", pwd.getpwuid)
+    group_ok = _resolver("/etc/group", grp.getgrgid)
+    mounts = [m for m in local_mounts(skip_fstypes) if skip is None or not skip.match(m[0])]
+    with _LOCK:
+        data = _load(rooted(CACHE)) if use_cache else {}
+        scans = data.get("scans", {})
+        now = time.time()
+        cache = scans.get(key, {})
+        if now - cache.get("created", 0) > full_scan_days * 86400:
+            cache = {}
+        old = cache.get("mounts", {})
+        parts = [Inventory() for _ in mounts]
+        with ThreadPoolExecutor(max_workers=max(1, min(jobs, len(mounts)))) as pool:
+            walked = list(pool.map(lambda m, inv: _walk(m[0], old.get(m[0], {}), skip, user_ok, group_ok, inv),
+                                   mounts, parts))
+        inv = Inventory()
+        inv.full = not cache
+        inv.mounts = [mp for mp, _ in mounts]
+        for p in parts:
+            for name in ("world_writable", "unsticky", "unowned", "ungrouped", "privileged", "errors"):
+                getattr(inv, name).extend(getattr(p, name))
+            inv.dirs += p.dirs
+            inv.listed += p.listed
+            inv.stated += p.stated
+        inv.sort()
+        if use_cache and not dry_run:
+            # Settings nobody scanned with lately would get a full scan anyway
+            scans = {k: c for k, c in scans.items() if now - c.get("created", 0) <= full_scan_days * 86400}
+            scans[key] = {"created": cache.get("created", now),
+                          "mounts": {mp: d for (mp, _), d in zip(mounts, walked)}}
+            data = {"format": FORMAT, "scans": scans}
+            try:
+                atomic_write(rooted(CACHE), json.dumps(data, separators=(",", ":")), mode=0o600)
+            except OSError as e:
+                inv.errors.append(f"{CACHE}: {e.strerror}")
+    return inv
+
+def forget(paths: List[str]):
+    """Drop the cached directories holding `paths` so the next scan lists them again"""
+    with _LOCK:
+        data = _load(rooted(CACHE))
+        if not data:
+            return
+        for path in paths:
+            parent = os.path.dirname(path)
+            for mp, dirs in ((mp, d) for c in data.get("scans", {}).values() for mp, d in c["mounts"].items()):
+                prefix = mp.rstrip("/") + "/"
+                if parent == mp or parent.startswith(prefix):
+                    dirs.pop(parent[len(prefix):] + "/" if parent != mp else "", None)
+        atomic_write(rooted(CACHE), json.dumps(data, separators=(",", ":")), mode=0o600)
+
+def _secure(e: Entry):
+    """o-w on a file, +t on a directory; only if it is still the inode that was scanned"""
+    fd = os.open(rooted(e.path, follow=False), FILE_FLAGS)
+    try:
+        st = os.fstat(fd)
+        if (st.st_dev, st.st_ino) != (e.dev, e.ino):
+            raise OSError(0, "replaced since the scan")
+        if stat.S_ISREG(st.st_mode) and st.st_mode & stat.S_IWOTH:
+            os.fchmod(fd, stat.S_IMODE(st.st_mode) & ~stat.S_IWOTH)
+        elif stat.S_ISDIR(st.st_mode) and st.st_mode & stat.S_IWOTH and not st.st_mode & stat.S_ISVTX:
+            os.fchmod(fd, stat.S_IMODE(st.st_mode) | stat.S_ISVTX)
+    finally:
+        os.close(fd)
+
+def _sample(entries: List[Entry]) -> str:
+    more = f" (+{len(entries) - SAMPLE} more)" if len(entries) > SAMPLE else ""
+    return "; ".join(str(e) for e in entries[:SAMPLE]) + more
+
+def apply(cfg: Dict[str, Any], dry_run: bool, profile: str, facts: HostFacts = None) -> List[ActionResult]:
+    fix = cfg.get("fix_world_writable", False)
+    inv = scan(exclude=tuple(cfg.get("exclude", [])), skip_fstypes=tuple(cfg.get("skip_fstypes", [])),
+               full_scan_days=float(cfg.get("full_scan_days", FULL_SCAN_DAYS)), dry_run=dry_run)
+    walk = (f"{len(inv.mounts)} filesystems ({', '.join(inv.mounts)}), {inv.dirs} directories, "
+            f"{inv.listed} listed, {inv.stated} entries stat'ed" + (" (full scan)" if inv.full else " (cached)"))
+    if inv.errors:
+        walk += f"\n{len(inv.errors)} not walked, e.g. " + "; ".join(inv.errors[:SAMPLE])
+    results = []
+
+    ww = inv.world_writable + inv.unsticky
+    notes = [f"{len(inv.world_writable)} world-writable files, "
+             f"{len(inv.unsticky)} world-writable directories without the sticky bit"]
+    if ww:
+        notes.append("e.g. " + _sample(ww))
+    fixed, failures = [], []
+    if ww and not fix:
+        notes.append("Not changed: set fsscan.fix_world_writable to remove o+w from files "
+                     "and set the sticky bit on directories")
+    elif ww and dry_run:
+        notes.append(f"DRY-RUN: would secure {len(ww)} entries")
+    elif ww:
+        for e in ww:
+            try:
+                _secure(e)
+                fixed.append(e.path)
+            except OSError as err:
+                failures.append(f"{e.path}: {err.strerror}")
+        forget(fixed)
+        notes.append(f"Secured {len(fixed)} entries")
+        if failures:
+            notes.append(f"{len(failures)} failed, e.g. " + "; ".join(failures[:SAMPLE]))
+    results.append(ActionResult("FS-1", "Ensure world writable files and directories are secured",
+                                bool(ww), not failures, notes="\n".join(notes + [walk])))
+
+    notes = [f"{len(inv.unowned)} unowned, {len(inv.ungrouped)} ungrouped files and directories"]
+    for label, entries in (("unowned", inv.unowned), ("ungrouped", inv.ungrouped)):
+        if entries:
+            notes.append(f"{label}: " + _sample(entries))
+    if inv.unowned or inv.ungrouped:
+        notes.append("Not changed: assign an existing owner/group or remove them")
+    results.append(ActionResult("FS-2", "Ensure no unowned or ungrouped files or directories exist",
+                                bool(inv.unowned or inv.ungrouped), True, notes="\n".join(notes)))
+
+    notes = [f"{len(inv.privileged)} setuid/setgid executables (review)"]
+    if inv.privileged:
+        notes.append(_sample(inv.privileged))
+    results.append(ActionResult("FS-3", "Review SUID and SGID executables", False, True,
+                                notes="\n".join(notes)))
+    return results
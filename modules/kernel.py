@@ -1,32 +1,114 @@
 from typing import List, Dict, Any
-from .utils import ActionResult, write_file, run
-import shlex
+from .utils import ActionResult, write_file, run, rooted, offline
+from .facts import HostFacts
+import os, shlex
+
+READS = ["file:/etc/modprobe.d/"]
+WRITES = ["file:/etc/modprobe.d/", "kmod"]
+DEPENDS = []
 
 DISABLE_MODULES_L1 = ["cramfs","freevxfs","hfs","hfsplus","jffs2","squashfs","udf","usb-storage"]
 DISABLE_NETPROTO_L2 = ["dccp","sctp","rds","tipc"]
 
+# Searched in this order; a file name in an earlier directory hides the same
+# name in later ones, then all files are read in lexical order of their names
+MODPROBE_DIRS = ["/etc/modprobe.d", "/run/modprobe.d", "/usr/local/lib/modprobe.d", "/usr/lib/modprobe.d", "/lib/modprobe.d"]
+SYS_MODULE = "/sys/module"
+DISABLED_CMDS = ("/bin/true", "/bin/false", "/usr/bin/true", "/usr/bin/false")
+
 def _conf(mod: str) -> str:
     return f"install {mod} /bin/true\nblacklist {mod}\n"
 
-def apply(cfg: Dict[str,Any], dry_run: bool, profile: str) -> List[ActionResult]:
+def _norm(mod: str) -> str:
+    return mod.replace("-", "_")
+
+def effective_modprobe(dirs: List[str] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    {module: {"install": cmd, "blacklist": bool}} as modprobe would see it.
+    Like kmod, the first install command for a module wins.
+    """
+    files = {}
+    for d in dirs or MODPROBE_DIRS:
+        try:
+            names = os.listdir(rooted(d))
+        except OSError:
+            continue
+        for n in names:
+            if n.endswith(".conf") and n not in files:
+                files[n] = os.path.join(rooted(d), n)
+    cfg: Dict[str, Dict[str, Any]] = {}
+    for n in sorted(files):
+        try:
+            with open(files[n], "r", encoding="utf-8", errors="ignore") as f:
+                text = f.read().replace("\\\n", " ")
+        except OSError:
+            continue
+        for ln in text.splitlines():
+            parts = ln.split()
+            if len(parts) < 2 or parts[0].startswith("#"):
+                continue
+            entry = cfg.setdefault(_norm(parts[1]), {"install": None, "blacklist": False})
+            if parts[0] == "install" and entry["install"] is None:
+                entry["install"] = " ".join(parts[2:])
+            elif parts[0] == "blacklist":
+                entry["blacklist"] = True
+    return cfg
+
+def is_disabled(entry: Dict[str, Any]) -> bool:
+    return bool(entry) and entry["blacklist"] and (entry["install"] or "").split(" ")[0] in DISABLED_CMDS
+
+def unload_order(mods: List[str], facts: HostFacts) -> List[str]:
+    """Loaded targets ordered so that every module is unloaded before the ones it uses"""
+    loaded = [m for m in mods if facts.kmod_loaded(m)]
+    ordered: List[str] = []
+    def visit(m, seen):
+        if m in ordered or m in seen:
+            return
+        seen.add(m)
+        for holder in facts.kmod_holders(m):
+            hm = next((x for x in loaded if _norm(x) == holder), None)
+            if hm:
+                visit(hm, seen)
+        ordered.append(m)
+    for m in loaded:
+        visit(m, set())
+    return ordered
+
+def apply(cfg: Dict[str,Any], dry_run: bool, profile: str, facts: HostFacts=None) -> List[ActionResult]:
     mods=list(DISABLE_MODULES_L1)
     if profile.startswith("l2"):
         mods += DISABLE_NETPROTO_L2
+    facts = facts or HostFacts()
+    effective = effective_modprobe()
     notes=[]
+    files=[]
     changed_any=False
     for m in mods:
+        if is_disabled(effective.get(_norm(m))):
+            continue
         path=f"/etc/modprobe.d/cis-disable-{m}.conf"
         changed, note = write_file(path, _conf(m), mode=0o644, dry_run=dry_run)
         changed_any = changed_any or changed
+        files.append(path)
         notes.append(f"{m}: {note}")
-    cmds=[["modprobe","-r",m] for m in mods]
+    if not notes:
+        notes.append(f"All {len(mods)} modules already disabled in modprobe configuration")
+    builtin=[m for m in mods if not offline() and not facts.kmod_loaded(m) and os.path.isdir(os.path.join(SYS_MODULE, _norm(m)))
+             and not os.path.exists(os.path.join(SYS_MODULE, _norm(m), "initstate"))]
+    if builtin:
+        notes.append("Built into the kernel (cannot be unloaded): " + " ".join(builtin))
+    # modprobe -r takes the modules in the order given
+    order=unload_order(mods, facts)
+    cmds=[["modprobe","-r"]+order] if order else []
     if dry_run:
-        return [ActionResult("KERN-1","Disable uncommon filesystem/network kernel modules", changed_any, True,
-                             notes="; ".join(notes)+"\nDRY-RUN: would attempt unload modules",
-                             commands=[shlex.join(c) for c in cmds], files=[f"/etc/modprobe.d/cis-disable-{m}.conf" for m in mods])]
-    out=[]
+        if order:
+            notes.append("DRY-RUN: would unload " + " ".join(order))
+        return [ActionResult("KERN-1","Disable uncommon filesystem/network kernel modules", changed_any or bool(cmds), True,
+                             notes="; ".join(notes),
+                             commands=[shlex.join(c) for c in cmds], files=files)]
+    out=[]; ok=True
     for c in cmds:
-        cp=run(c); out.append((cp.stdout+cp.stderr).strip())
-    return [ActionResult("KERN-1","Disable uncommon filesystem/network kernel modules", True, True,
-                         notes="; ".join(notes)+"\n"+"\n".join(o for o in out if o),
-                         commands=[shlex.join(c) for c in cmds], files=[f"/etc/modprobe.d/cis-disable-{m}.conf" for m in mods])]
+        cp=run(c, mutating=True); out.append((cp.stdout+cp.stderr).strip()); ok = ok and cp.returncode==0
+    return [ActionResult("KERN-1","Disable uncommon filesystem/network kernel modules", changed_any or bool(cmds), ok,
+                         notes="; ".join(notes)+("\n"+"\n".join(o for o in out if o) if any(out) else ""),
+                         commands=[shlex.join(c) for c in cmds], files=files)]
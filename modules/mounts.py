@@ -1,11 +1,16 @@
 from typing import List, Dict, Any
-from .utils import ActionResult, run
-import shlex
+from .utils import ActionResult, write_file
+from .facts import HostFacts
+from . import postactions, units
 
 TMP_UNIT="/etc/systemd/system/tmp.mount"
 VARTMP_UNIT="/etc/systemd/system/var-tmp.mount"
 
-def apply(cfg: Dict[str,Any], dry_run: bool, profile: str):
+READS = []
+WRITES = ["file:" + TMP_UNIT, "file:" + VARTMP_UNIT, "unit:tmp.mount", "unit:var-tmp.mount", "mount"]
+DEPENDS = []
+
+def apply(cfg: Dict[str,Any], dry_run: bool, profile: str, facts: HostFacts=None):
     enable=bool(cfg.get("enable_tmp_mount_units", True))
     if not enable:
         return [ActionResult("MNT-0","tmpfs mount units (skipped by config)", False, True, notes="mounts.enable_tmp_mount_units=false")]
@@ -37,10 +42,20 @@ Options=mode=1777,strictatime,nodev,nosuid,noexec,size={vartmp_size}
 [Install]
 WantedBy=local-fs.target
 """
-    cmd=["bash","-lc", f"cat > {shlex.quote(TMP_UNIT)} <<'EOF'\n{tmp_unit}EOF\ncat > {shlex.quote(VARTMP_UNIT)} <<'EOF'\n{vartmp_unit}EOF\nsystemctl daemon-reload\nsystemctl enable --now tmp.mount var-tmp.mount"]
-    if dry_run:
-        return [ActionResult("MNT-1","Configure tmpfs mounts for /tmp and /var/tmp", True, True,
-                             notes="DRY-RUN: would create systemd mount units and enable them",
-                             commands=[shlex.join(cmd)], files=[TMP_UNIT,VARTMP_UNIT])]
-    cp=run(cmd); return [ActionResult("MNT-1","Configure tmpfs mounts for /tmp and /var/tmp", True, cp.returncode==0,
-                                     notes=(cp.stdout+cp.stderr).strip(), commands=[shlex.join(cmd)], files=[TMP_UNIT,VARTMP_UNIT])]
+    c1,n1=write_file(TMP_UNIT, tmp_unit, mode=0o644, dry_run=dry_run)
+    c2,n2=write_file(VARTMP_UNIT, vartmp_unit, mode=0o644, dry_run=dry_run)
+    mounts=["tmp.mount", "var-tmp.mount"]
+    states = facts.unit_status(*mounts) if facts is not None else units.show(mounts)
+    inactive=[u for u in mounts if not units.satisfied(states[u], "enable")]
+    changed = c1 or c2 or bool(inactive)
+    notes=[n1, n2]
+    if inactive and not (c1 or c2):
+        notes.append(("DRY-RUN: would enable " if dry_run else "Enabling ")+" ".join(inactive))
+    result=ActionResult("MNT-1","Configure tmpfs mounts for /tmp and /var/tmp", changed, True,
+                        notes="; ".join(notes), files=[TMP_UNIT,VARTMP_UNIT])
+    # Reload and enable once at the end of the run, only for what changed
+    if c1 or c2:
+        postactions.request("daemon-reload", result)
+    for u in (mounts if c1 or c2 else inactive):
+        postactions.request("enable:"+u, result)
+    return [result]
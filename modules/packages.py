@@ -1,12 +1,27 @@
 from typing import List, Dict, Any
-from .utils import ActionResult, run
+from .utils import ActionResult, dnf_cmd
+from .facts import HostFacts
+from . import executor, pkgplan
 import shlex
 
 REMOVE = ["telnet","telnet-server","ftp","tftp","tftp-server","rsh","rsh-server","ypbind","ypserv","talk","talk-server","xinetd"]
 
-def apply(cfg: Dict[str,Any], dry_run: bool, profile: str):
-    cmd=["dnf","-y","remove"]+REMOVE
-    if dry_run:
-        return [ActionResult("PKG-1","Remove legacy/insecure network packages", False, True, notes="DRY-RUN: would run "+shlex.join(cmd), commands=[shlex.join(cmd)])]
-    cp=run(cmd); ok=(cp.returncode==0)
-    return [ActionResult("PKG-1","Remove legacy/insecure network packages", True, ok, notes=(cp.stdout+cp.stderr).strip(), commands=[shlex.join(cmd)])]
+PKG_REMOVE = {"PKG-1": REMOVE}
+
+READS = ["pkg:" + p for p in REMOVE]
+WRITES = []
+DEPENDS = []
+
+def apply(cfg: Dict[str,Any], dry_run: bool, profile: str, facts: HostFacts=None):
+    title="Remove legacy/insecure network packages"
+    plan=pkgplan.active()
+    if plan is not None and plan.covers(REMOVE, "remove"):
+        changed, ok, notes = plan.outcome(REMOVE, "remove", dry_run)
+        return [ActionResult("PKG-1", title, changed, ok, notes=notes, commands=plan.commands if changed else [])]
+    facts = facts or HostFacts()
+    present=[p for p in REMOVE if facts.installed(p)]
+    if not present:
+        return [ActionResult("PKG-1", title, False, True, notes="None of the packages are installed", commands=[])]
+    cmd=dnf_cmd("-y","remove",*present)
+    cp=executor.get(dry_run).run(cmd, mutating=True); ok=(cp.returncode==0)
+    return [ActionResult("PKG-1", title, ok, ok, notes=(cp.stdout+cp.stderr).strip(), commands=[shlex.join(cmd)])]
@@ -3,10 +3,16 @@ PAM (Pluggable Authentication Modules) Hardening
 CIS Reference: 5.3.x series - Password and Authentication Policy
 """
 from typing import List, Dict, Any
-from .utils import ActionResult, run
+from .utils import ActionResult, run, rooted
+from .filetx import FileTransaction
+from .facts import HostFacts
 import os, re
 
-def apply(cfg: Dict[str, Any], dry_run: bool, profile: str) -> List[ActionResult]:
+READS = []
+WRITES = ["file:/etc/pam.d/system-auth", "file:/etc/login.defs"]
+DEPENDS = []
+
+def apply(cfg: Dict[str, Any], dry_run: bool, profile: str, facts: HostFacts=None) -> List[ActionResult]:
     """
     Apply PAM hardening configurations:
     - Password quality requirements
@@ -30,34 +36,27 @@ def apply(cfg: Dict[str, Any], dry_run: bool, profile: str) -> List[ActionResult
         pam_file = "/etc/pam.d/system-auth"
         pam_file_local = "/etc/pam.d/system-auth-local"
         
-        if os.path.exists(pam_file):
+        tx = FileTransaction(dry_run)
+        if tx.exists(pam_file):
             # Check if password history line exists and is correct
-            with open(pam_file, "r", encoding="utf-8") as f:
-                content = f.read()
+            content = tx.read(pam_file)
             
             # Look for pam_unix.so with remember parameter
             pattern = r"password\s+sufficient\s+pam_unix\.so.*remember="
             
             if not re.search(pattern, content):
-                # Need to add or modify the line
-                # This is a simplified version - actual implementation would be more careful
-                if not dry_run:
-                    # Backup file first
-                    run(["cp", pam_file, f"{pam_file}.backup"])
-                    
-                    # Add remember parameter if not present
-                    # Note: This is simplified; production code should use proper PAM parsing
-                    new_content = re.sub(
-                        r"(password\s+sufficient\s+pam_unix\.so[^\n]*?)(\n)",
-                        rf"\1 remember={password_remember}\2",
-                        content
-                    )
-                    
-                    if new_content != content:
-                        with open(pam_file, "w", encoding="utf-8") as f:
-                            f.write(new_content)
-                        changed = True
-                        notes += f"Added remember={password_remember} to pam_unix.so; "
+                # Add remember parameter if not present
+                # Note: This is simplified; production code should use proper PAM parsing
+                changed, note = tx.sub(pam_file,
+                                       r"(password\s+sufficient\s+pam_unix\.so[^\n]*?)(\n)",
+                                       rf"\1 remember={password_remember}\2", what="pam_unix.so remember")
+                if changed:
+                    if not dry_run:
+                        # Backup file first
+                        run(["cp", "--preserve=all", rooted(pam_file), rooted(f"{pam_file}.backup")], mutating=True)
+                    tx.flush()
+                    notes += f"{note} (remember={password_remember}); "
+                    files.append(pam_file)
                 
                 commands.append(f"pam configuration updated for password history")
             else:
@@ -134,33 +133,15 @@ def apply(cfg: Dict[str, Any], dry_run: bool, profile: str) -> List[ActionResult
         pass_min_len = int(cfg.get("pass_min_len", 14))
         login_defs = "/etc/login.defs"
         
-        with open(login_defs, "r", encoding="utf-8") as f:
-            content = f.read()
-        
-        # Check for PASS_MIN_LEN setting
-        if re.search(rf"^PASS_MIN_LEN\s+{pass_min_len}$", content, re.MULTILINE):
-            notes = f"PASS_MIN_LEN already set to {pass_min_len}"
+        if not os.path.exists(rooted(login_defs)):
+            raise FileNotFoundError(login_defs)
+        with FileTransaction(dry_run) as tx:
+            changed, note = tx.set_kv(login_defs, "PASS_MIN_LEN", str(pass_min_len), sep="\t")
+        if changed:
+            notes = note
+            files.append(login_defs)
         else:
-            if not dry_run:
-                # Update or add PASS_MIN_LEN
-                new_content = re.sub(
-                    r"^PASS_MIN_LEN\s+\d+",
-                    f"PASS_MIN_LEN\t{pass_min_len}",
-                    content,
-                    flags=re.MULTILINE,
-                    count=1
-                )
-                
-                if new_content == content:
-                    # Line doesn't exist, add it
-                    new_content = content.rstrip() + f"\nPASS_MIN_LEN\t{pass_min_len}\n"
-                
-                with open(login_defs, "w", encoding="utf-8") as f:
-                    f.write(new_content)
-                
-                changed = True
-                notes = f"Set PASS_MIN_LEN to {pass_min_len}"
-                files.append(login_defs)
+            notes = f"PASS_MIN_LEN already set to {pass_min_len}"
         
         results.append(ActionResult(
             id=control_id,
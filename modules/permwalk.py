@@ -0,0 +1,212 @@
+"""
+Rule-Based Permission Walker
+Walks a directory tree once and enforces modes and owners by rule, reporting
+one aggregated result per rule instead of one per file:
+
+    RULES = [Rule("LOG-6", "Restrict login records", ("wtmp", "wtmp[.-]*"), 0o664, ("root",), ("root", "utmp")),
+             Rule("LOG-7", "Restrict log files", ("*",), 0o640)]
+    results = permwalk.enforce("/var/log", RULES, dry_run)
+
+Each regular file goes to the first rule whose pattern matches its path
+relative to the walked directory (fnmatch, `*` also crosses `/`). `mode` is the
+most permissive mode allowed: extra bits are removed, never added. Owners are
+only checked when the rule names them; the first name is what a deviating file
+gets. Names are resolved from the target's passwd/group files.
+
+The walk goes through directory descriptors (scandir on an fd, openat for
+subdirectories), so each entry is stat'ed exactly once and symlinks are never
+followed. walk() does this without recursion and with a bounded number of
+open descriptors; fsscan uses it too. Changes are applied with fchmod/fchown on a descriptor opened with
+O_NOFOLLOW, after checking that it is still the inode that was inspected.
+"""
+from typing import List, Dict, Tuple, NamedTuple, Optional, Callable, Iterable
+from .utils import ActionResult, rooted
+from . import trace
+import os, re, stat, errno, fnmatch
+
+SAMPLE = 10  # offenders named per rule
+MAX_DEPTH = 256  # directory levels walked below the top; deeper subtrees are reported, not walked
+MAX_OPEN = 32    # directory descriptors one walk keeps open
+
+DIR_FLAGS = os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW | os.O_CLOEXEC
+FILE_FLAGS = os.O_RDONLY | os.O_NOFOLLOW | os.O_NONBLOCK | os.O_NOCTTY | os.O_CLOEXEC
+
+class Rule(NamedTuple):
+    id: str
+    title: str
+    patterns: Tuple[str, ...]
+    mode: int
+    users: Tuple[str, ...] = ()
+    groups: Tuple[str, ...] = ()
+
+def account_ids(db: str) -> Dict[str, int]:
+    """{name: id} from the target's /etc/passwd or /etc/group"""
+    ids = {}
+    try:
+        with open(rooted(db), "r", encoding="utf-8", errors="ignore") as f:
+            for ln in f:
+                parts = ln.split(":")
+                if len(parts) > 2 and parts[2].isdigit():
+                    ids.setdefault(parts[0], int(parts[2]))
+    except OSError:
+        pass
+    return ids
+
+def walk(top_fd: int, visit: Callable[[int, str], Iterable[str]], errors: List[str], prefix: str = "",
+         dev: int = None, max_depth: int = MAX_DEPTH, max_open: int = MAX_OPEN):
+    """
+    Depth-first walk below the directory top_fd, without recursion.
+    visit(dfd, rel) handles one directory (rel is "" for the top, else ends in
+    "/") and returns the names of the subdirectories to descend into. Only
+    the directories on the way to the current one stay open, at most
+    max_open of them; a directory whose parent was closed is reached again
+    with openat() one component at a time from the nearest open ancestor, so
+    symlinks are never followed. With `dev`, directories on another device
+    are skipped. Subtrees below max_depth and directories that cannot be
+    opened go to `errors` as "<prefix><rel>: reason"; one that vanished is
+    skipped.
+    """
+    chain: List[Tuple[str, int]] = []  # (rel, fd) of open ancestors, outermost first
+    todo: List[Tuple[str, int]] = [("", 0)]
+    try:
+        while todo:
+            rel, depth = todo.pop()
+            while chain and not rel.startswith(chain[-1][0]):
+                os.close(chain.pop()[1])
+            fd = top_fd
+            if rel:
+                base, fd = chain[-1] if chain else ("", top_fd)
+                for name in rel[len(base):].rstrip("/").split("/"):
+                    try:
+                        sub = os.open(name, DIR_FLAGS, dir_fd=fd)
+                    except OSError as e:
+                        if e.errno not in (errno.ENOENT, errno.ENOTDIR, errno.ELOOP):  # gone, or not a directory
+                            errors.append(f"{prefix}{rel.rstrip('/')}: {e.strerror}")
+                        fd = None
+                        break
+                    base += name + "/"
+                    chain.append((base, sub))
+                    if len(chain) > max_open:
+                        os.close(chain.pop(0)[1])
+                    fd = sub
+                    if dev is not None and os.fstat(sub).st_dev != dev:
+                        fd = None  # a mount point; its device is walked on its own
+                        break
+                if fd is None:
+                    continue
+            for name in reversed(list(visit(fd, rel))):
+                if depth >= max_depth:
+                    errors.append(f"{prefix}{rel}{name}: more than {max_depth} levels deep, not walked")
+                else:
+                    todo.append((f"{rel}{name}/", depth + 1))
+    finally:
+        for _, fd in chain:
+            os.close(fd)
+
+class _Tally:
+    __slots__ = ("checked", "deviating", "fixed", "failures", "sample")
+
+    def __init__(self):
+        self.checked = self.deviating = self.fixed = 0
+        self.failures: List[str] = []
+        self.sample: List[str] = []
+
+def _fix(dfd: int, name: str, st: os.stat_result, mode: int, uid: int, gid: int):
+    fd = os.open(name, FILE_FLAGS, dir_fd=dfd)
+    try:
+        now = os.fstat(fd)
+        if (now.st_dev, now.st_ino) != (st.st_dev, st.st_ino) or not stat.S_ISREG(now.st_mode):
+            raise OSError(0, "replaced while walking")
+        if stat.S_IMODE(now.st_mode) != mode:
+            os.fchmod(fd, mode)
+        if (uid != -1 and now.st_uid != uid) or (gid != -1 and now.st_gid != gid):
+            os.fchown(fd, uid, gid)
+    finally:
+        os.close(fd)
+
+def enforce(top: str, rules: List[Rule], dry_run: bool, exclude: Tuple[str, ...] = ()) -> List[ActionResult]:
+    """Walk `top` (a path inside the target) and return one result per rule"""
+    users, groups = account_ids("/etc/passwd"), account_ids("/etc/group")
+    compiled = []
+    for r in rules:
+        uids = [users[u] for u in r.users if u in users]
+        gids = [groups[g] for g in r.groups if g in groups]
+        compiled.append((re.compile("|".join(fnmatch.translate(p) for p in r.patterns)), ~r.mode & 0o7777,
+                         set(uids), set(gids), uids[0] if uids else -1, gids[0] if gids else -1))
+    skip = re.compile("|".join(fnmatch.translate(p) for p in exclude)) if exclude else None
+    tallies = [_Tally() for _ in rules]
+    walk_errors: List[str] = []
+
+    def visit(dfd: int, rel: str) -> List[str]:
+        try:
+            with os.scandir(dfd) as it:
+                entries = list(it)
+        except OSError as e:
+            walk_errors.append(f"{rel or '.'}: {e.strerror}")
+            return []
+        subdirs = []
+        for e in entries:
+            path = rel + e.name
+            if skip is not None and skip.match(path):
+                continue
+            try:
+                st = e.stat(follow_symlinks=False)
+            except OSError:
+                continue
+            if stat.S_ISDIR(st.st_mode):
+                subdirs.append(e.name)
+                continue
+            if not stat.S_ISREG(st.st_mode):
+                continue
+            for i, (pattern, extra, uids, gids, uid, gid) in enumerate(compiled):
+                if not pattern.match(path):
+                    continue
+                t = tallies[i]
+                t.checked += 1
+                cur = stat.S_IMODE(st.st_mode)
+                bad_mode = cur & extra
+                bad_uid = uids and st.st_uid not in uids
+                bad_gid = gids and st.st_gid not in gids
+                if bad_mode or bad_uid or bad_gid:
+                    t.deviating += 1
+                    if len(t.sample) < SAMPLE:
+                        t.sample.append(f"{top.rstrip('/')}/{path} {oct(cur)} {st.st_uid}:{st.st_gid}")
+                    if not dry_run:
+                        try:
+                            _fix(dfd, e.name, st, cur & ~extra, uid if bad_uid else -1, gid if bad_gid else -1)
+                            t.fixed += 1
+                        except OSError as err:
+                            t.failures.append(f"{path}: {err.strerror}")
+                break
+        return subdirs
+
+    with trace.span("permwalk", "file", path=top):
+        try:
+            root_fd: Optional[int] = os.open(rooted(top), DIR_FLAGS)
+        except OSError:
+            root_fd = None
+        if root_fd is not None:
+            try:
+                walk(root_fd, visit, walk_errors)
+            finally:
+                os.close(root_fd)
+
+    results = []
+    for r, t in zip(rules, tallies):
+        owners = ""
+        if r.users or r.groups:
+            owners = f", owner {'|'.join(r.users) or 'any'}:{'|'.join(r.groups) or 'any'}"
+        notes = [f"{t.checked} files checked (mode <= {oct(r.mode)}{owners}), {t.deviating} deviating"]
+        if t.sample:
+            notes.append("e.g. " + "; ".join(t.sample))
+        if dry_run and t.deviating:
+            notes.append(f"DRY-RUN: would fix {t.deviating} files")
+        elif t.fixed:
+            notes.append(f"Fixed {t.fixed} files")
+        if t.failures:
+            notes.append(f"{len(t.failures)} failed, e.g. " + "; ".join(t.failures[:SAMPLE]))
+        if walk_errors and r is rules[0]:
+            notes.append(f"{len(walk_errors)} directories not walked, e.g. " + "; ".join(walk_errors[:SAMPLE]))
+        results.append(ActionResult(r.id, r.title, t.deviating > 0 and (dry_run or t.fixed > 0), not t.failures,
+                                    notes="\n".join(notes), files=[top]))
+    return results
@@ -0,0 +1,123 @@
+"""
+Cross-Module Package Transaction Planner
+Modules declare the packages they need (PKG_INSTALL) or forbid (PKG_REMOVE) as
+{control_id: [packages]}. The runner merges the declarations of every module in
+the profile, drops packages that are already in the desired state and runs the
+remainder as one dnf transaction before any module starts. ensure_pkg() then
+reports against the executed plan instead of starting dnf itself.
+"""
+from typing import List, Dict, Any, Iterable, Tuple
+from .utils import run, dnf_cmd
+import shlex, logging
+
+logger = logging.getLogger(__name__)
+
+_ACTIVE = None
+
+def activate(plan: "PackagePlan"):
+    """Make `plan` the run-wide plan consulted by ensure_pkg (None to deactivate)"""
+    global _ACTIVE
+    _ACTIVE = plan
+
+def active() -> "PackagePlan":
+    return _ACTIVE
+
+class PackagePlan:
+    def __init__(self):
+        self.install: Dict[str, List[str]] = {}
+        self.remove: Dict[str, List[str]] = {}
+        self.to_install: List[str] = []
+        self.to_remove: List[str] = []
+        self.executed = False
+        self.ok = True
+        self.output = ""
+        self.commands: List[str] = []
+
+    def add_modules(self, mods: Dict[str, Any]) -> "PackagePlan":
+        """Merge the PKG_INSTALL/PKG_REMOVE declarations of {name: module}"""
+        for modname, mod in mods.items():
+            for rid, pkgs in getattr(mod, "PKG_INSTALL", {}).items():
+                for p in pkgs:
+                    self.require(p, f"{modname}:{rid}")
+            for rid, pkgs in getattr(mod, "PKG_REMOVE", {}).items():
+                for p in pkgs:
+                    self.forbid(p, f"{modname}:{rid}")
+        return self
+
+    def require(self, pkg: str, reason: str):
+        self.install.setdefault(pkg, []).append(reason)
+
+    def forbid(self, pkg: str, reason: str):
+        self.remove.setdefault(pkg, []).append(reason)
+
+    def covers(self, pkgs: Iterable[str], action: str = "install") -> bool:
+        wanted = self.install if action == "install" else self.remove
+        return all(p in wanted for p in pkgs)
+
+    def resolve(self, installed: Iterable[str]):
+        """Reduce the plan to packages whose state actually has to change"""
+        installed = set(installed)
+        self.to_install = sorted(p for p in self.install if p not in installed)
+        self.to_remove = sorted(p for p in self.remove if p in installed and p not in self.install)
+        for p in sorted(set(self.install) & set(self.remove)):
+            logger.warning(f"Package {p} is both required and forbidden; keeping it installed")
+
+    def transaction(self) -> Tuple[List[str], str]:
+        """(command, stdin script) for one dnf transaction, ([], "") when nothing to do"""
+        if self.to_install and self.to_remove:
+            script = "".join([f"install {' '.join(self.to_install)}\n",
+                              f"remove {' '.join(self.to_remove)}\n", "run\n"])
+            return dnf_cmd("-y", "shell"), script
+        if self.to_install:
+            return dnf_cmd("-y", "install", *self.to_install), ""
+        if self.to_remove:
+            return dnf_cmd("-y", "remove", *self.to_remove), ""
+        return [], ""
+
+    def describe(self) -> str:
+        cmd, script = self.transaction()
+        if not cmd:
+            return ""
+        return shlex.join(cmd) + (" <<'EOF'\n" + script + "EOF" if script else "")
+
+    def execute(self, dry_run: bool) -> bool:
+        cmd, script = self.transaction()
+        if not cmd:
+            logger.info("Package plan: nothing to install or remove")
+            return True
+        self.commands = [self.describe()]
+        if dry_run:
+            logger.info("Package plan (DRY-RUN): " + self.commands[0])
+            return True
+        logger.info("Package plan: " + self.commands[0])
+        cp = run(cmd, input=script or None, mutating=True)
+        self.executed = True
+        self.ok = (cp.returncode == 0)
+        self.output = (cp.stdout + cp.stderr).strip()
+        return self.ok
+
+    def outcome(self, pkgs: List[str], action: str, dry_run: bool) -> Tuple[bool, bool, str]:
+        """(changed, ok, notes) for a module's share of the plan"""
+        pending = self.to_install if action == "install" else self.to_remove
+        mine = [p for p in pkgs if p in pending]
+        verb = "installed" if action == "install" else "removed"
+        if not mine:
+            if action == "install":
+                return False, True, f"Already installed: {' '.join(pkgs)}"
+            return False, True, "None of the packages are installed"
+        if dry_run:
+            return True, True, f"DRY-RUN: planned transaction would {action} {' '.join(mine)}"
+        if not self.ok:
+            return False, False, f"Planned transaction failed for {' '.join(mine)}:\n{self.output}"
+        return True, True, f"{verb.capitalize()} by planned transaction: {' '.join(mine)}"
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "install": {p: {"reasons": r, "action": "install" if p in self.to_install else "none"}
+                        for p, r in sorted(self.install.items())},
+            "remove": {p: {"reasons": r, "action": "remove" if p in self.to_remove else "none"}
+                       for p, r in sorted(self.remove.items())},
+            "transaction": self.commands[0] if self.commands else "",
+            "executed": self.executed,
+            "ok": self.ok,
+        }
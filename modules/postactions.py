@@ -0,0 +1,168 @@
+"""
+Coalesced Post-Action Queue
+Reloads, restarts and regenerations are requested by name while modules run
+and executed once, at the end of the run, by flush(). An action is only queued
+when the result that triggers it actually changed something.
+
+    request("reload:sshd", result)      # systemctl try-reload-or-restart sshd
+    request("restart:auditd", result)   # systemctl restart auditd (covers a reload)
+    request("enable:tmp.mount", result) # systemctl enable --now tmp.mount (covers a start)
+    request("daemon-reload", result)
+    request("regen-grub", result)
+    request("regen-audit-rules", result) # augenrules, without --load
+
+Modules should ask for a reload wherever the service supports one; a restart
+requested for the same unit by someone else supersedes it.
+
+For an offline root (--root) unit enables run as `systemctl --root enable`,
+regenerations that need the booted system are deferred to first boot (see
+firstboot.py), and everything else is reported as taking effect at boot.
+"""
+from typing import List, Dict, Tuple
+from .utils import ActionResult, offline
+from .facts import HostFacts
+from .units import systemctl
+from . import executor, firstboot
+import shlex, threading
+
+# Named actions: (command, title); unit actions are built from UNIT_ACTIONS
+ACTIONS = {
+    "daemon-reload": (["systemctl", "daemon-reload"], "Reload systemd manager configuration"),
+    "regen-grub": (["grub2-mkconfig", "-o", "/boot/grub2/grub.cfg"], "Regenerate GRUB configuration"),
+    "authselect-apply": (["authselect", "apply-changes"], "Apply authselect profile changes"),
+    "regen-audit-rules": (["augenrules"], "Regenerate audit rules"),
+    "load-audit-rules": (["augenrules", "--load"], "Load audit rules"),
+    "reload-firewalld": (["firewall-cmd", "--reload"], "Reload firewalld"),
+}
+
+# Unit verbs, weakest first; a stronger verb for a unit covers the weaker ones
+UNIT_ACTIONS = {
+    "reload": ["systemctl", "try-reload-or-restart"],
+    "start": ["systemctl", "start"],
+    "enable": ["systemctl", "enable", "--now"],
+    "restart": ["systemctl", "restart"],
+}
+SUBSUMES = {
+    "restart": ("reload", "start"),
+    "enable": ("start",),
+}
+
+# Execution order: manager reload before anything touching units, config
+# regeneration before services that read it, firewall last
+ORDER = ["daemon-reload", "regen-grub", "authselect-apply", "regen-audit-rules", "load-audit-rules",
+         "enable", "start", "restart", "reload", "reload-firewalld"]
+
+# Offline, these run on first boot instead
+DEFER_OFFLINE = ("regen-grub", "authselect-apply")
+
+_LOCK = threading.Lock()
+_QUEUE: Dict[str, List[ActionResult]] = {}
+
+def reset():
+    """Forget everything requested by a previous run"""
+    with _LOCK:
+        _QUEUE.clear()
+
+def _kind(name: str) -> str:
+    kind = name.split(":", 1)[0]
+    if kind not in ACTIONS and (kind not in UNIT_ACTIONS or ":" not in name):
+        raise ValueError(f"unknown post-action {name}")
+    return kind
+
+def request(name: str, result: ActionResult) -> bool:
+    """Queue `name` on behalf of `result`; ignored unless the result changed something"""
+    _kind(name)
+    if not result.changed:
+        return False
+    with _LOCK:
+        triggers = _QUEUE.setdefault(name, [])
+        if result not in triggers:
+            triggers.append(result)
+    return True
+
+def pending() -> List[str]:
+    with _LOCK:
+        return sorted(_QUEUE)
+
+def holds(result: ActionResult) -> bool:
+    """True while a queued action may still fail `result`"""
+    with _LOCK:
+        return any(t is result for triggers in _QUEUE.values() for t in triggers)
+
+def plan(queue: Dict[str, List[ActionResult]]) -> List[Tuple[str, List[str], List[ActionResult]]]:
+    """Deduplicated [(action, command, triggers)] in execution order"""
+    units: Dict[str, Dict[str, List[ActionResult]]] = {}
+    named: Dict[str, List[ActionResult]] = {}
+    for name, triggers in queue.items():
+        kind = _kind(name)
+        if kind in ACTIONS:
+            named[kind] = triggers
+        else:
+            units.setdefault(name.split(":", 1)[1], {})[kind] = triggers
+    # Fold weaker unit verbs into the strongest one requested for the unit
+    verbs: Dict[str, Dict[str, List[ActionResult]]] = {}
+    for unit, wanted in units.items():
+        for strong in reversed(list(UNIT_ACTIONS)):
+            if strong in wanted:
+                triggers = list(wanted[strong])
+                for weak in SUBSUMES.get(strong, ()):
+                    triggers += [t for t in wanted.get(weak, []) if t not in triggers]
+                verbs.setdefault(strong, {})[unit] = triggers
+                for weak in SUBSUMES.get(strong, ()):
+                    wanted.pop(weak, None)
+                wanted.pop(strong)
+    out = []
+    for step in ORDER:
+        if step in named:
+            out.append((step, ACTIONS[step][0], named[step]))
+        elif step in verbs:
+            for unit in sorted(verbs[step]):
+                out.append((f"{step}:{unit}", UNIT_ACTIONS[step] + [unit], verbs[step][unit]))
+    return out
+
+def _title(action: str) -> str:
+    if action in ACTIONS:
+        return ACTIONS[action][1]
+    verb, unit = action.split(":", 1)
+    return f"{verb.capitalize()} {unit}"
+
+def flush(dry_run: bool, facts: HostFacts = None) -> List[ActionResult]:
+    """
+    Run every queued action once and return one POST-* result per action.
+    A failed action also fails the results that triggered it.
+    """
+    with _LOCK:
+        queue = {k: list(v) for k, v in _QUEUE.items()}
+        _QUEUE.clear()
+    results = []
+    ex = executor.get(dry_run)
+    for action, cmd, triggers in plan(queue):
+        why = "Triggered by " + ", ".join(t.id for t in triggers)
+        rid = "POST-" + action.replace(":", "-").upper()
+        if offline():
+            kind = _kind(action)
+            if kind in DEFER_OFFLINE:
+                for t in triggers:
+                    firstboot.defer(cmd, t)
+                results.append(ActionResult(rid, _title(action), True, True, notes="Deferred to first boot\n" + why,
+                                            commands=[shlex.join(cmd)]))
+                continue
+            if kind != "enable":
+                results.append(ActionResult(rid, _title(action), False, True,
+                                            notes="Not run for an offline root; takes effect at boot\n" + why))
+                continue
+            cmd = systemctl("enable", action.split(":", 1)[1])
+        try:
+            cp = ex.run(cmd, mutating=True)
+            ok, text = cp.returncode == 0, (cp.stdout + cp.stderr).strip()
+        except OSError as e:
+            ok, text = False, str(e)
+        results.append(ActionResult(rid, _title(action), True, ok,
+                                    notes="\n".join(n for n in (text, why) if n), commands=[shlex.join(cmd)]))
+        if not ok:
+            for t in triggers:
+                t.ok = False
+                t.notes = (t.notes + "\n" if t.notes else "") + f"Post-action {action} failed"
+    if facts is not None and not dry_run and results:
+        facts.invalidate("units")
+    return results
@@ -0,0 +1,68 @@
+"""
+Installed-Package Query Layer
+Answers "which of these packages are installed?" straight from the RPM sqlite
+database (EL9 and later), falling back to one batched `rpm -q` when the database
+cannot be read. Neither path starts dnf. Both look under the target root
+(--root) when one is set.
+"""
+from typing import Iterable, Optional, Set
+from .utils import run, rooted, offline
+import os, sqlite3
+
+RPMDB_PATHS = ["/var/lib/rpm/rpmdb.sqlite", "/usr/lib/sysimage/rpm/rpmdb.sqlite"]
+
+def find_rpmdb() -> Optional[str]:
+    for path in RPMDB_PATHS:
+        if os.path.exists(rooted(path)):
+            return rooted(path)
+    return None
+
+def query_sqlite(dbpath: str, names: Iterable[str] = None) -> Set[str]:
+    """
+    Installed package names from an rpmdb.sqlite file (read-only).
+    rpm keeps a "Name" index table (key, hnum, idx) next to the header blobs,
+    so no header parsing is needed. Keys may be stored as TEXT or BLOB; both
+    are matched (a BLOB never equals a TEXT in sqlite).
+    """
+    conn = sqlite3.connect(f"file:{dbpath}?mode=ro", uri=True)
+    try:
+        if names is None:
+            rows = conn.execute("SELECT DISTINCT key FROM Name")
+        else:
+            names = list(names)
+            if not names:
+                return set()
+            keys = names + [n.encode() for n in names]
+            rows = conn.execute(f"SELECT DISTINCT key FROM Name WHERE key IN ({','.join('?' * len(keys))})", keys)
+        return {r[0] if isinstance(r[0], str) else r[0].decode() for r in rows}
+    finally:
+        conn.close()
+
+def query_rpm(names: Iterable[str] = None) -> Set[str]:
+    """Installed package names via a single rpm invocation"""
+    rpm = ["rpm"] + (["--root", rooted("/")] if offline() else [])
+    if names is None:
+        cp = run(rpm + ["-qa", "--qf", "%{NAME}\n"])
+    else:
+        names = list(names)
+        if not names:
+            return set()
+        cp = run(rpm + ["-q", "--qf", "%{NAME}\n"] + names)
+    # Missing packages are reported as "package X is not installed"
+    return {ln.strip() for ln in cp.stdout.splitlines() if ln.strip() and " " not in ln.strip()}
+
+def installed(names: Iterable[str] = None, dbpath: str = None) -> Set[str]:
+    """
+    Subset of `names` that is installed (all installed names when names is None).
+    dbpath overrides the rpmdb location, e.g. a fixture database.
+    """
+    dbpath = dbpath or find_rpmdb()
+    if dbpath:
+        try:
+            return query_sqlite(dbpath, names)
+        except sqlite3.Error:
+            pass
+    try:
+        return query_rpm(names)
+    except OSError:
+        return set()
@@ -0,0 +1,96 @@
+"""
+Dependency-aware module scheduler
+Runs independent hardening modules concurrently on a bounded worker pool while
+serializing modules whose declared resources conflict.
+
+Each module may declare:
+  READS   - resources the module inspects
+  WRITES  - resources the module modifies
+  DEPENDS - module names that must finish before this one starts
+
+Resources are plain strings such as "pkg:aide", "unit:auditd.service",
+"file:/etc/sysctl.d/99-cis-hardening.conf" or "sysctl". A "file:" resource
+ending in "/" covers everything below that directory. Modules that declare
+nothing are treated as touching every resource and are never overlapped.
+"""
+from typing import List, Dict, Any, Callable, Set, Tuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import logging
+
+logger = logging.getLogger(__name__)
+
+ANY = "*"
+
+def resources(mod: Any) -> Tuple[Set[str], Set[str]]:
+    """Return (reads, writes) declared by a module"""
+    if not hasattr(mod, "WRITES") and not hasattr(mod, "READS"):
+        return {ANY}, {ANY}
+    writes = set(getattr(mod, "WRITES", []))
+    reads = set(getattr(mod, "READS", [])) | writes
+    return reads, writes
+
+def _overlap(a: str, b: str) -> bool:
+    if a == ANY or b == ANY or a == b:
+        return True
+    if a.startswith("file:") and b.startswith("file:"):
+        return (a.endswith("/") and b.startswith(a)) or (b.endswith("/") and a.startswith(b))
+    return False
+
+def conflicts(a: Any, b: Any) -> bool:
+    """True when one module writes something the other reads or writes"""
+    ra, wa = resources(a)
+    rb, wb = resources(b)
+    return any(_overlap(x, y) for x in wa for y in rb) or any(_overlap(x, y) for x in wb for y in ra)
+
+def order(modnames: List[str], mods: Dict[str, Any]) -> List[str]:
+    """Stable topological order of modnames honouring DEPENDS, profile order otherwise"""
+    deps = {m: [d for d in getattr(mods[m], "DEPENDS", []) if d in mods] for m in modnames}
+    done: List[str] = []
+    pending = list(modnames)
+    while pending:
+        for m in pending:
+            if all(d in done for d in deps[m]):
+                done.append(m)
+                pending.remove(m)
+                break
+        else:
+            raise ValueError(f"Circular module dependencies among: {', '.join(pending)}")
+    return done
+
+def plan(modnames: List[str], mods: Dict[str, Any]) -> Dict[str, Set[str]]:
+    """
+    Map each module to the set of modules that must complete before it starts:
+    its explicit DEPENDS plus every conflicting module ordered before it
+    """
+    seq = order(modnames, mods)
+    preds: Dict[str, Set[str]] = {m: set() for m in seq}
+    for i, m in enumerate(seq):
+        preds[m].update(d for d in getattr(mods[m], "DEPENDS", []) if d in mods)
+        for earlier in seq[:i]:
+            if conflicts(mods[earlier], mods[m]):
+                preds[m].add(earlier)
+    return preds
+
+def run(modnames: List[str], mods: Dict[str, Any], fn: Callable[[str, Any], Any], jobs: int = 1) -> Dict[str, Tuple[Any, Exception]]:
+    """
+    Execute fn(name, module) for every module on at most `jobs` workers.
+    Returns {name: (value, error)}; callers assemble output in profile order.
+    """
+    preds = plan(modnames, mods)
+    seq = order(modnames, mods)
+    outcome: Dict[str, Tuple[Any, Exception]] = {}
+    running = {}
+    with ThreadPoolExecutor(max_workers=max(1, int(jobs))) as pool:
+        while len(outcome) < len(seq):
+            for m in seq:
+                if m in outcome or m in running.values():
+                    continue
+                if preds[m] <= set(outcome):
+                    logger.debug(f"Scheduling module: {m}")
+                    running[pool.submit(fn, m, mods[m])] = m
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for fut in done:
+                m = running.pop(fut)
+                err = fut.exception()
+                outcome[m] = (None, err) if err else (fut.result(), None)
+    return outcome
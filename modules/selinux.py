@@ -1,18 +1,33 @@
 from typing import List, Dict, Any
-from .utils import ActionResult, run
+from .utils import ActionResult, rooted
+from .facts import HostFacts
+from . import executor
 import shlex
 
-def apply(cfg: Dict[str,Any], dry_run: bool, profile: str):
+READS = ["selinux"]
+WRITES = ["file:/etc/selinux/config", "selinux"]
+DEPENDS = []
+
+def apply(cfg: Dict[str,Any], dry_run: bool, profile: str, facts: HostFacts=None):
     enforce=bool(cfg.get("enforce", True))
     if not enforce:
         return [ActionResult("SEL-0","SELinux enforcement (skipped by config)", False, True, notes="selinux.enforce=false")]
-    cmds=[["getenforce"],["bash","-lc","sed -ri 's/^SELINUX=.*/SELINUX=enforcing/' /etc/selinux/config"],["setenforce","1"]]
-    if dry_run:
-        return [ActionResult("SEL-1","Ensure SELinux is enforcing", False, True,
-                             notes="DRY-RUN: would set /etc/selinux/config and run setenforce 1",
-                             commands=[shlex.join(c) for c in cmds], files=["/etc/selinux/config"])]
+    facts = facts or HostFacts()
+    mode, configured = facts.selinux_mode, facts.selinux_config
+    notes=[f"runtime: {mode}, configured: {configured or 'unset'}"]
+    cmds=[]
+    if configured!="enforcing":
+        cmds.append(["bash","-lc","sed -ri 's/^SELINUX=.*/SELINUX=enforcing/' "+shlex.quote(rooted("/etc/selinux/config"))])
+    if mode=="permissive":
+        cmds.append(["setenforce","1"])
+    elif mode=="disabled":
+        notes.append("SELinux is disabled at runtime; enforcing takes effect after relabel and reboot")
+    if not cmds:
+        return [ActionResult("SEL-1","Ensure SELinux is enforcing", False, True, notes="\n".join(notes),
+                             files=["/etc/selinux/config"])]
+    ex=executor.get(dry_run)
     out=[]; ok=True
     for c in cmds:
-        cp=run(c); out.append((cp.stdout+cp.stderr).strip()); ok = ok and (cp.returncode==0)
-    return [ActionResult("SEL-1","Ensure SELinux is enforcing", True, ok, notes="\n".join(o for o in out if o),
+        cp=ex.run(c, mutating=True); out.append((cp.stdout+cp.stderr).strip()); ok = ok and (cp.returncode==0)
+    return [ActionResult("SEL-1","Ensure SELinux is enforcing", True, ok, notes="\n".join(notes+[o for o in out if o]),
                          commands=[shlex.join(c) for c in cmds], files=["/etc/selinux/config"])]
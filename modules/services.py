@@ -3,8 +3,11 @@ Service Hardening and Management
 CIS Reference: 2.2.x - Services Configuration
 """
 from typing import List, Dict, Any
-from .utils import ensure_service_enabled, ensure_pkg, run, ActionResult
-import os
+from .utils import ensure_pkg, run, ActionResult, rooted, offline
+from .units import ensure_units
+from .facts import HostFacts
+from . import firstboot
+import os, shlex
 
 # Services that should be masked/disabled for CIS compliance
 UNWANTED = [
@@ -31,7 +34,15 @@ REQUIRED = {
     "auditd": "Audit daemon for security logging",
 }
 
-def apply(cfg: Dict[str, Any], dry_run: bool, profile: str) -> List[ActionResult]:
+PKG_INSTALL = {"SVC-AIDE-PKG": ["aide"]}
+
+READS = ["pkg:aide", "file:/var/lib/aide/"]
+WRITES = ["unit:" + (s if "." in s else s + ".service") for s in UNWANTED] + \
+         ["unit:" + (s if "." in s else s + ".service") for s in REQUIRED] + \
+         ["file:/var/lib/aide/"]
+DEPENDS = ["audit"]
+
+def apply(cfg: Dict[str, Any], dry_run: bool, profile: str, facts: HostFacts=None) -> List[ActionResult]:
     """
     Apply service hardening:
     - Disable unnecessary/dangerous services
@@ -39,13 +50,14 @@ def apply(cfg: Dict[str, Any], dry_run: bool, profile: str) -> List[ActionResult
     - Manage systemd-journal-remote
     """
     results = []
+    facts = facts or HostFacts()
     
-    # Disable unwanted services
-    for svc in UNWANTED:
-        ensure_service_enabled(svc, dry_run, results, f"SVC-{svc}", f"Disable service: {svc}", state="mask")
+    # Disable unwanted services (one state query, one systemctl mask for all)
+    ensure_units([(svc, "mask", f"SVC-{svc}", f"Disable service: {svc}") for svc in UNWANTED],
+                 dry_run, results, facts=facts)
     
     # Ensure AIDE package is installed
-    ensure_pkg(["aide"], dry_run, results, "SVC-AIDE-PKG", "Ensure aide package is installed")
+    ensure_pkg(["aide"], dry_run, results, "SVC-AIDE-PKG", "Ensure aide package is installed", facts=facts)
     
     # Initialize AIDE database if needed
     control_id = "SVC-AIDE-INIT"
@@ -62,11 +74,17 @@ def apply(cfg: Dict[str, Any], dry_run: bool, profile: str) -> List[ActionResult
         aide_new_db = "/var/lib/aide/aide.db.new.gz"
         
         # Check if AIDE database exists, initialize if not
-        db_exists = os.path.exists(aide_db) or os.path.exists(aide_gz_db) or os.path.exists(aide_new_db)
+        db_exists = any(os.path.exists(rooted(db)) for db in (aide_db, aide_gz_db, aide_new_db))
         
         if not db_exists:
             notes = "AIDE database not found, initializing..."
-            if not dry_run:
+            if offline():
+                # Same command as AIDE-2 so the first-boot script runs it once
+                cmd = ["bash", "-lc", "aide --init 2>&1 && mv -f /var/lib/aide/aide.db.new.gz /var/lib/aide/aide.db.gz 2>/dev/null || true"]
+                commands.append(shlex.join(cmd))
+                changed = True
+                notes = "Deferred to first boot: " + shlex.join(cmd)
+            elif not dry_run:
                 # Check if aide.conf exists and is readable
                 aide_conf = "/etc/aide.conf"
                 if not os.path.exists(aide_conf):
@@ -76,7 +94,7 @@ def apply(cfg: Dict[str, Any], dry_run: bool, profile: str) -> List[ActionResult
                     # Use standard aide init command
                     cmd = ["bash", "-c", "aide --init 2>&1 && mv /var/lib/aide/aide.db.new.gz /var/lib/aide/aide.db.gz 2>/dev/null || true"]
                 
-                cp = run(cmd)
+                cp = run(cmd, mutating=True)
                 commands.append(" ".join(cmd))
                 
                 # Check if database was created successfully
@@ -91,6 +109,7 @@ def apply(cfg: Dict[str, Any], dry_run: bool, profile: str) -> List[ActionResult
                     ok = False
                     notes = f"AIDE initialization issue (may proceed anyway). Output: {(cp.stdout + cp.stderr)[:200]}"
             else:
+                changed = True
                 notes = "DRY-RUN: Would initialize AIDE database"
                 commands.append("aide --init && mv /var/lib/aide/aide.db.new.gz /var/lib/aide/aide.db.gz")
         else:
@@ -100,7 +119,7 @@ def apply(cfg: Dict[str, Any], dry_run: bool, profile: str) -> List[ActionResult
         ok = True  # Don't fail the entire operation if AIDE init has issues
         notes = f"AIDE initialization skipped: {str(e)}"
     
-    results.append(ActionResult(
+    result = ActionResult(
         id=control_id,
         title=title,
         changed=changed,
@@ -108,81 +127,31 @@ def apply(cfg: Dict[str, Any], dry_run: bool, profile: str) -> List[ActionResult
         notes=notes,
         commands=commands,
         files=files
-    ))
+    )
+    if offline() and changed:
+        firstboot.defer(cmd, result)
+    results.append(result)
     
-    # Enable and start AIDE services/timers
+    # Enable and start AIDE services/timers and auditd
+    wanted = []
     for service, description in REQUIRED.items():
-        if service in ["aidecheck.service", "aidecheck.timer"]:
-            # Check if these services exist before trying to enable them
-            try:
-                cmd = ["systemctl", "list-unit-files", service]
-                cp = run(cmd)
-                if cp.returncode == 0 and service in cp.stdout:
-                    ensure_service_enabled(service, dry_run, results, f"SVC-{service}", f"Enable {description}", state="enable")
-                else:
-                    results.append(ActionResult(
-                        id=f"SVC-{service}",
-                        title=f"Enable {description}",
-                        changed=False,
-                        ok=True,
-                        notes=f"{service} not available on this system",
-                        commands=[],
-                        files=[]
-                    ))
-            except Exception as e:
-                results.append(ActionResult(
-                    id=f"SVC-{service}",
-                    title=f"Enable {description}",
-                    changed=False,
-                    ok=False,
-                    notes=f"Error checking service: {str(e)}",
-                    commands=[],
-                    files=[]
-                ))
-        else:
-            ensure_service_enabled(service, dry_run, results, f"SVC-{service}", f"Enable {description}", state="enable")
-    
-    # Ensure systemd-journal-remote is disabled
-    control_id = "SVC-JOURNAL-REMOTE"
-    title = "Ensure systemd-journal-remote is disabled"
-    changed = False
-    ok = True
-    notes = ""
-    commands = []
-    files = []
-    
-    try:
-        # Check if systemd-journal-remote.service is disabled
-        cmd = ["systemctl", "is-enabled", "systemd-journal-remote.service"]
-        cp = run(cmd)
-        
-        if "disabled" not in cp.stdout and "masked" not in cp.stdout:
-            if not dry_run:
-                # Disable and mask the service
-                run(["systemctl", "disable", "systemd-journal-remote.service"])
-                run(["systemctl", "mask", "systemd-journal-remote.service"])
-                changed = True
-                notes = "systemd-journal-remote.service disabled and masked"
-                commands.append("systemctl disable systemd-journal-remote.service")
-                commands.append("systemctl mask systemd-journal-remote.service")
-            else:
-                notes = "DRY-RUN: Would disable and mask systemd-journal-remote.service"
-                commands.append("systemctl disable systemd-journal-remote.service")
-                commands.append("systemctl mask systemd-journal-remote.service")
-        else:
-            notes = "systemd-journal-remote.service already disabled"
-    except Exception as e:
-        ok = False
-        notes = f"Error: {str(e)}"
+        if service in ["aidecheck.service", "aidecheck.timer"] and not facts.unit_state(service):
+            # aidecheck units are not shipped on every release
+            results.append(ActionResult(
+                id=f"SVC-{service}",
+                title=f"Enable {description}",
+                changed=False,
+                ok=True,
+                notes=f"{service} not available on this system",
+                commands=[],
+                files=[]
+            ))
+            continue
+        wanted.append((service, "enable", f"SVC-{service}", f"Enable {description}"))
+    ensure_units(wanted, dry_run, results, facts=facts)
     
-    results.append(ActionResult(
-        id=control_id,
-        title=title,
-        changed=changed,
-        ok=ok,
-        notes=notes,
-        commands=commands,
-        files=files
-    ))
+    # Ensure systemd-journal-remote is disabled (already masked above on a compliant host)
+    ensure_units([("systemd-journal-remote.service", "mask", "SVC-JOURNAL-REMOTE", "Ensure systemd-journal-remote is disabled")],
+                 dry_run, results, facts=facts)
     
     return results
@@ -1,8 +1,14 @@
 from typing import List, Dict, Any
-from .utils import ActionResult, run
-import os, shlex
+from .utils import ActionResult, run, write_file, offline
+from .facts import HostFacts
+from . import postactions
+import shlex
 
-def apply(cfg: Dict[str,Any], dry_run: bool, profile: str):
+READS = ["file:/etc/ssh/sshd_config"]
+WRITES = ["file:/etc/ssh/sshd_config.d/", "unit:sshd.service"]
+DEPENDS = []
+
+def apply(cfg: Dict[str,Any], dry_run: bool, profile: str, facts: HostFacts=None):
     dropin="/etc/ssh/sshd_config.d/99-cis-hardening.conf"
     permit_root=str(cfg.get("permit_root_login","no"))
     password_auth=str(cfg.get("password_authentication","no"))
@@ -39,22 +45,24 @@ def apply(cfg: Dict[str,Any], dry_run: bool, profile: str):
     if macs: lines.append(f"MACs {macs}")
     if kex: lines.append(f"KexAlgorithms {kex}")
     content="\n".join(lines)+"\n"
-    changed=True
-    if os.path.exists(dropin):
-        with open(dropin,"r",encoding="utf-8",errors="ignore") as f:
-            changed = (f.read()!=content)
-    cmds=[["bash","-lc", f"mkdir -p /etc/ssh/sshd_config.d && cat > {shlex.quote(dropin)} <<'EOF'\n{content}EOF\nchmod 600 {shlex.quote(dropin)}"],
-          ["sshd","-t"],
-          ["systemctl","restart","sshd"]]
+    changed, note = write_file(dropin, content, mode=0o600, dry_run=dry_run)
+    cmd=["sshd","-t"]
+    if not changed:
+        return [ActionResult("SSH-1","Harden SSH daemon configuration", False, True, notes=note, files=[dropin])]
     if dry_run:
-        return [ActionResult("SSH-1","Harden SSH daemon configuration", changed, True,
-                             notes="DRY-RUN: would write drop-in, validate (sshd -t), restart sshd",
-                             commands=[shlex.join(c) for c in cmds], files=[dropin])]
-    out=[]; ok=True
-    for c in cmds:
-        cp=run(c); out.append((cp.stdout+cp.stderr).strip()); ok = ok and (cp.returncode==0)
-        if c[:2]==["sshd","-t"] and cp.returncode!=0:
-            ok=False; break
-    return [ActionResult("SSH-1","Harden SSH daemon configuration", True if changed else False, ok,
-                         notes="\n".join(o for o in out if o),
-                         commands=[shlex.join(c) for c in cmds], files=[dropin])]
+        result=ActionResult("SSH-1","Harden SSH daemon configuration", True, True,
+                            notes=note+"\nDRY-RUN: would validate (sshd -t) and reload sshd",
+                            commands=[shlex.join(cmd)], files=[dropin])
+    elif offline():
+        # sshd -t would read the build host's Include files, not the image's
+        result=ActionResult("SSH-1","Harden SSH daemon configuration", True, True,
+                            notes=note+"\nNot validated (offline root); sshd checks it when it starts", files=[dropin])
+    else:
+        cp=run(cmd)
+        result=ActionResult("SSH-1","Harden SSH daemon configuration", True, cp.returncode==0,
+                            notes="\n".join(o for o in (note, (cp.stdout+cp.stderr).strip()) if o),
+                            commands=[shlex.join(cmd)], files=[dropin])
+    # Never reload sshd onto a configuration it rejects
+    if result.ok:
+        postactions.request("reload:sshd", result)
+    return [result]
@@ -0,0 +1,224 @@
+"""
+Incremental Run State
+Remembers, per module and mode, a fingerprint of everything the module's
+outcome depends on, together with the results it produced:
+
+  - the module's config section and the profile
+  - the module's source code and that of the modules/ files it imports
+  - stat() of every file listed in its results' ActionResult.files
+  - stat() of every file it declares in READS/WRITES, and for a declared
+    directory the stat() of each entry in it, so adding or removing a file
+    there is noticed even when no result names it
+  - the host state behind its declared resources (unit states, installed
+    packages, loaded kernel modules, mounts, crypto policy, SELinux mode)
+  - live values of the sysctl keys it registered
+
+When the fingerprint is unchanged the cached results are reused instead of
+running the module. Results that failed, or that changed the host during an
+apply, are never cached, so the next run re-checks them. Modules can list
+result IDs whose state cannot be fingerprinted cheaply in VOLATILE; a module
+producing any of them is always run.
+"""
+from typing import List, Dict, Any, Iterable, Tuple
+from .utils import ActionResult, atomic_write, rooted
+from .facts import HostFacts
+from . import accounting, scheduler
+import os, ast, json, hashlib, threading, logging
+
+logger = logging.getLogger(__name__)
+
+STATE_DIR = "/var/lib/cis_apply"
+STATE_FILE = os.path.join(STATE_DIR, "state.json")
+FORMAT = 2
+
+# Timing is per run, so it is neither stored nor replayed
+_RESULT_FIELDS = [f for f in ActionResult.FIELDS if f not in accounting.FIELDS]
+
+def _digest(obj: Any) -> str:
+    return hashlib.sha256(json.dumps(obj, sort_keys=True, default=str).encode()).hexdigest()
+
+# path -> (sha256 of the file, sibling modules it imports); source does not change during a run
+_SOURCES: Dict[str, Tuple[str, List[str]]] = {}
+
+def _source(path: str) -> Tuple[str, List[str]]:
+    """sha256 of a file and the sibling modules it imports relatively (from . import x, from .x import y)"""
+    if path in _SOURCES:
+        return _SOURCES[path]
+    with open(path, "rb") as f:
+        data = f.read()
+    tree = ast.parse(data, path)
+    names = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ImportFrom) and node.level == 1:
+            if node.module:
+                names.append(node.module.split(".")[0])
+            else:
+                names += [a.name for a in node.names]
+    here = os.path.dirname(path)
+    _SOURCES[path] = (hashlib.sha256(data).hexdigest(),
+                      [p for p in (os.path.join(here, n + ".py") for n in names) if os.path.isfile(p)])
+    return _SOURCES[path]
+
+def source_hash(mod: Any) -> str:
+    """The module's code and the code of every modules/ file it imports, directly or not"""
+    try:
+        todo, files = [mod.__file__], set()
+        while todo:
+            path = todo.pop()
+            if path not in files:
+                files.add(path)
+                todo += _source(path)[1]
+        return _digest({os.path.basename(p): _source(p)[0] for p in files})
+    except (OSError, SyntaxError, AttributeError, TypeError):
+        return ""
+
+def _stat(path: str):
+    try:
+        st = os.stat(rooted(path))
+    except OSError:
+        return None
+    return [st.st_ino, st.st_size, st.st_mtime_ns, st.st_mode, st.st_uid, st.st_gid]
+
+def _listing(path: str):
+    """{name: stat} for the entries of a directory (links not followed), None if it is not one"""
+    try:
+        with os.scandir(rooted(path)) as it:
+            entries = {}
+            for e in it:
+                try:
+                    st = e.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                entries[e.name] = [st.st_ino, st.st_size, st.st_mtime_ns, st.st_mode, st.st_uid, st.st_gid]
+            return entries
+    except OSError:
+        return None
+
+# Kernel state is observed through HostFacts sections, not stat()
+_PSEUDO = ("/proc/", "/sys/")
+
+def to_dict(r: ActionResult) -> Dict[str, Any]:
+    return {k: getattr(r, k) for k in _RESULT_FIELDS}
+
+def from_dict(d: Dict[str, Any]) -> ActionResult:
+    return ActionResult(**{k: d.get(k) for k in _RESULT_FIELDS if k in d})
+
+def probes(mod: Any, results: List[ActionResult], sysctl_keys: Iterable[str] = ()) -> Dict[str, List[str]]:
+    """What to observe next time to tell whether this module's inputs changed"""
+    reads, _ = scheduler.resources(mod)
+    units, packages, sections, paths = [], [], [], []
+    for res in sorted(reads):
+        kind, _, arg = res.partition(":")
+        if kind == "file":
+            if not arg.startswith(_PSEUDO):
+                paths.append(arg)
+        elif kind == "unit":
+            units.append(arg)
+        elif kind == "pkg":
+            packages.append(arg)
+        elif kind in ("kmod", "mount", "crypto", "selinux", "cmdline"):
+            sections.append(kind)
+    return {
+        "files": sorted({f for r in results for f in (r.files or [])}),
+        "paths": paths,
+        "units": units,
+        "packages": packages,
+        "sections": sorted(set(sections)),
+        "sysctl": sorted(sysctl_keys),
+    }
+
+def observe(p: Dict[str, List[str]], facts: HostFacts) -> Dict[str, Any]:
+    obs: Dict[str, Any] = {
+        "files": {f: _stat(f) for f in p.get("files", [])},
+        "paths": {f: _listing(f) if f.endswith("/") else _stat(f) for f in p.get("paths", [])},
+        "units": {u: dict(st) for u, st in facts.unit_status(*p["units"]).items()} if p.get("units") else {},
+        "packages": sorted(x for x in p.get("packages", []) if facts.installed(x)),
+        "sysctl": {k: facts.sysctl(k) for k in p.get("sysctl", [])},
+    }
+    for s in p.get("sections", []):
+        if s == "kmod":
+            obs[s] = sorted(facts.kmods)
+        elif s == "mount":
+            obs[s] = list(facts.mounts)
+        elif s == "crypto":
+            obs[s] = facts.crypto_policy
+        elif s == "selinux":
+            obs[s] = [facts.selinux_mode, facts.selinux_config]
+        elif s == "cmdline":
+            obs[s] = facts.cmdline
+    return obs
+
+class StateStore:
+    def __init__(self, path: str = None):
+        # The state describes the target, so with --root it lives in the image
+        self.path = path or rooted(STATE_FILE)
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self.reused: List[str] = []
+
+    def load(self) -> "StateStore":
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("format") == FORMAT:
+                self._entries = data.get("modules", {})
+        except (OSError, ValueError) as e:
+            if os.path.exists(self.path):
+                logger.warning(f"Ignoring unreadable state file {self.path}: {e}")
+        return self
+
+    def save(self):
+        with self._lock:
+            content = json.dumps({"format": FORMAT, "modules": self._entries}, indent=1, sort_keys=True, default=str)
+        atomic_write(self.path, content + "\n", 0o600)
+
+    @staticmethod
+    def key(modname: str, dry_run: bool) -> str:
+        return f"{modname}:{'check' if dry_run else 'apply'}"
+
+    @staticmethod
+    def inputs(mod: Any, cfg: Dict[str, Any], profile: str) -> str:
+        return _digest({"cfg": cfg, "profile": profile, "code": source_hash(mod)})
+
+    def lookup(self, modname: str, mod: Any, cfg: Dict[str, Any], profile: str, dry_run: bool,
+               facts: HostFacts) -> Tuple[List[ActionResult], Dict[str, Dict[str, str]]]:
+        """(cached results, {result id: registered sysctl kv}) if nothing changed, else (None, {})"""
+        with self._lock:
+            entry = self._entries.get(self.key(modname, dry_run))
+        if not entry or entry.get("inputs") != self.inputs(mod, cfg, profile):
+            return None, {}
+        if entry.get("observed") != _digest(observe(entry["probes"], facts)):
+            return None, {}
+        with self._lock:
+            self.reused.append(modname)
+        return [from_dict(d) for d in entry["results"]], entry.get("sysctl", {})
+
+    def record(self, modname: str, mod: Any, cfg: Dict[str, Any], profile: str, dry_run: bool,
+               results: List[ActionResult], returned: List[Dict[str, Any]],
+               sysctl_kv: Dict[str, Dict[str, str]], facts: HostFacts):
+        """
+        Remember a fresh outcome, or forget the module if it is not reusable.
+        `results` are the final results (after the sysctl and post-action
+        flushes); `returned` is what apply() itself returned, which is what a
+        reuse replays so the run-wide flushes finalize it again.
+        """
+        k = self.key(modname, dry_run)
+        volatile = set(getattr(mod, "VOLATILE", []))
+        reusable = (scheduler.ANY not in scheduler.resources(mod)[0]
+                    and all(r.ok for r in results)
+                    and (dry_run or not any(r.changed for r in results))
+                    and not any(r.id in volatile for r in results))
+        if not reusable:
+            with self._lock:
+                self._entries.pop(k, None)
+            return
+        p = probes(mod, results, [key for kv in sysctl_kv.values() for key in kv])
+        entry = {
+            "inputs": self.inputs(mod, cfg, profile),
+            "probes": p,
+            "observed": _digest(observe(p, facts)),
+            "results": returned,
+            "sysctl": sysctl_kv,
+        }
+        with self._lock:
+            self._entries[k] = entry
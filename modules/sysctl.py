@@ -1,6 +1,16 @@
-from typing import List, Dict, Any
-from .utils import ActionResult, run
-import os, shlex
+from typing import List, Dict, Any, Tuple
+from .utils import ActionResult, write_file, rooted, offline
+from .facts import HostFacts, sysctl_path, read_sysctl
+from . import facts as facts_mod
+from . import accounting
+import os, threading
+
+# Keys are applied by flush() at the end of the run, so registering never conflicts
+READS = []
+WRITES = []
+DEPENDS = []
+# Per-interface values are not fingerprinted, so incremental runs always re-check them
+VOLATILE = ["SYSCTL-IF"]
 
 L1 = {
  "kernel.randomize_va_space": "2",
@@ -35,31 +45,205 @@ L2 = {
  "net.ipv4.tcp_rfc1337": "1",
 }
 
+CONF = "/etc/sysctl.d/99-cis-hardening.conf"
+
+# Run-wide desired state: any module registers keys, flush() applies them once
+_LOCK = threading.Lock()
+_REGISTRY: Dict[str, Tuple[str, str]] = {}
+_PENDING: List[Tuple[ActionResult, Dict[str, str]]] = []
+
 def _content(kv: dict) -> str:
     lines=["# Generated by cis hardening scripts"]
     for k,v in sorted(kv.items()):
         lines.append(f"{k} = {v}")
     return "\n".join(lines)+"\n"
 
-def apply(cfg: Dict[str,Any], dry_run: bool, profile: str):
+def _parse(content: str) -> Dict[str, str]:
+    kv={}
+    for ln in content.splitlines():
+        ln=ln.strip()
+        if ln and not ln.startswith(("#",";")) and "=" in ln:
+            k,v=ln.split("=",1)
+            kv[k.strip()]=" ".join(v.split())
+    return kv
+
+def write_live(key: str, value: str):
+    with open(sysctl_path(key), "w") as f:
+        f.write(value)
+    accounting.add(bytes_written=len(value))
+
+def reset():
+    """Forget everything registered by a previous run"""
+    with _LOCK:
+        _REGISTRY.clear()
+        del _PENDING[:]
+
+def registrations() -> Dict[str, Dict[str, str]]:
+    """{result id: kv} registered so far in this run"""
+    with _LOCK:
+        return {r.id: dict(kv) for r, kv in _PENDING}
+
+def holds(result: ActionResult) -> bool:
+    """True while `result` waits for flush() to finalize it"""
+    with _LOCK:
+        return any(r is result for r, _ in _PENDING)
+
+def register(result: ActionResult, kv: Dict[str, str]) -> ActionResult:
+    """
+    Add kv to the run-wide desired state on behalf of `result`.
+    The result is finalized in place by flush(): changed/ok/notes reflect
+    exactly the runtime and file changes made for its keys.
+    """
+    with _LOCK:
+        for k,v in kv.items():
+            prev=_REGISTRY.get(k)
+            if prev and prev[0]!=v:
+                result.ok=False
+                result.notes=(result.notes+"\n" if result.notes else "")+f"{k} = {v} conflicts with {prev[1]} ({prev[0]})"
+                continue
+            _REGISTRY[k]=(v, result.id)
+        _PENDING.append((result, dict(kv)))
+    if CONF not in (result.files or []):
+        result.files=(result.files or [])+[CONF]
+    return result
+
+def flush(dry_run: bool, facts: HostFacts=None) -> bool:
+    """Render the drop-in once and write only deviating runtime values; returns overall ok"""
+    with _LOCK:
+        desired={k:v for k,(v,_) in _REGISTRY.items()}
+        pending=list(_PENDING)
+        del _PENDING[:]
+    if not pending:
+        return True
+    live = facts.sysctl if facts is not None else read_sysctl
+
+    # Runtime: only touch keys whose live value deviates; an offline root
+    # has no running kernel, the drop-in takes effect when it boots
+    runtime={}
+    for k,v in ([] if offline() else sorted(desired.items())):
+        cur=live(k)
+        if cur is None:
+            runtime[k]=(True, f"{k}: not available on this kernel")
+        elif cur == " ".join(v.split()):
+            continue
+        elif dry_run:
+            runtime[k]=(True, f"DRY-RUN: would set {k} = {v} (live {cur})")
+        else:
+            try:
+                write_live(k, v)
+                runtime[k]=(True, f"Set {k} = {v} (was {cur})")
+            except OSError as e:
+                runtime[k]=(False, f"Failed to set {k} = {v}: {e}")
+    if facts is not None and not dry_run and runtime:
+        facts.invalidate("sysctl")
+
+    # Persistent: rewrite the drop-in only when its content differs
+    existing=""
+    if os.path.exists(rooted(CONF)):
+        with open(rooted(CONF),"r",encoding="utf-8",errors="ignore") as f:
+            existing=f.read()
+    on_disk=_parse(existing)
+    file_changed, file_note = write_file(CONF, _content(desired), mode=0o644, dry_run=dry_run)
+
+    ok_all=True
+    for i,(result,keys) in enumerate(pending):
+        notes=[]; changed=False
+        for k in keys:
+            if k in runtime:
+                ok, note = runtime[k]
+                result.ok = result.ok and ok
+                notes.append(note)
+                changed = changed or "not available" not in note
+        stale=[k for k in keys if on_disk.get(k)!=" ".join(desired.get(k,"").split())]
+        # Stray keys from earlier runs are attributed to the first registrant
+        if file_changed and (stale or i==0):
+            changed=True
+            notes.append(file_note)
+        if not notes:
+            notes.append(f"All {len(keys)} values already compliant")
+        result.changed = result.changed or changed
+        result.notes = "\n".join(([result.notes] if result.notes else []) + notes)
+        ok_all = ok_all and result.ok
+    return ok_all
+
+def interface_params(kv: Dict[str, str]) -> Dict[str, Dict[str, str]]:
+    """{family: {param: value}} from net.ipv{4,6}.conf.all.* / default.* keys"""
+    params: Dict[str, Dict[str, str]] = {}
+    for k,v in kv.items():
+        parts=k.split(".")
+        if len(parts)==5 and parts[0]=="net" and parts[2]=="conf" and parts[3] in ("all","default"):
+            params.setdefault(parts[1], {})[parts[4]]=" ".join(v.split())
+    return params
+
+def enforce_interfaces(kv: Dict[str, str], dry_run: bool, exclude: List[str]=()) -> ActionResult:
+    """
+    Check every per-interface copy of the conf.all/default keys under
+    /proc/sys/net/ipv{4,6}/conf/<if>/ and write back only deviating values.
+    Reports one aggregated result instead of one entry per interface.
+    """
+    title="Apply CIS sysctl hardening to every network interface"
+    checked=deviating=fixed=nread=nwritten=0
+    interfaces=set(); failures=[]; sample=[]
+    for family, params in sorted(interface_params(kv).items()):
+        base=os.path.join(facts_mod.PROC_SYS, "net", family, "conf")
+        try:
+            entries=[e for e in os.scandir(base) if e.is_dir() and e.name not in ("all","default")]
+        except OSError:
+            continue
+        for e in entries:
+            if any(e.name.startswith(x) for x in exclude):
+                continue
+            interfaces.add(e.name)
+            for param, want in params.items():
+                path=os.path.join(e.path, param)
+                try:
+                    fd=os.open(path, os.O_RDONLY)
+                    try:
+                        raw=os.read(fd, 64)
+                        nread+=len(raw)
+                        cur=raw.decode().strip()
+                    finally:
+                        os.close(fd)
+                except OSError:
+                    continue
+                checked+=1
+                if cur==want:
+                    continue
+                deviating+=1
+                if len(sample)<10:
+                    sample.append(f"{family}/{e.name}/{param}={cur}")
+                if dry_run:
+                    continue
+                try:
+                    fd=os.open(path, os.O_WRONLY)
+                    try:
+                        nwritten+=os.write(fd, want.encode())
+                    finally:
+                        os.close(fd)
+                    fixed+=1
+                except OSError as err:
+                    failures.append(f"{family}/{e.name}/{param}: {err.strerror}")
+    accounting.add(bytes_read=nread, bytes_written=nwritten)
+    notes=[f"{len(interfaces)} interfaces, {checked} values checked, {deviating} deviating"]
+    if sample:
+        notes.append("e.g. " + ", ".join(sample))
+    if dry_run and deviating:
+        notes.append(f"DRY-RUN: would set {deviating} values")
+    elif fixed:
+        notes.append(f"Set {fixed} values")
+    if failures:
+        notes.append(f"{len(failures)} failed, e.g. " + "; ".join(failures[:10]))
+    return ActionResult("SYSCTL-IF", title, deviating>0 and (dry_run or fixed>0), not failures,
+                        notes="\n".join(notes), commands=[])
+
+def apply(cfg: Dict[str,Any], dry_run: bool, profile: str, facts: HostFacts=None):
     kv=dict(L1)
     if profile.startswith("l2"):
         kv.update(L2)
-    path="/etc/sysctl.d/99-cis-hardening.conf"
-    content=_content(kv)
-    changed=True
-    if os.path.exists(path):
-        with open(path,"r",encoding="utf-8",errors="ignore") as f:
-            changed = (f.read()!=content)
-    cmds=[["bash","-lc", f"cat > {shlex.quote(path)} <<'EOF'\n{content}EOF\nchmod 644 {shlex.quote(path)}"],
-          ["sysctl","--system"]]
-    if dry_run:
-        return [ActionResult("SYSCTL-1","Apply CIS sysctl hardening", changed, True,
-                             notes="DRY-RUN: would write sysctl conf and run sysctl --system",
-                             commands=[shlex.join(c) for c in cmds], files=[path])]
-    out=[]; ok=True
-    for c in cmds:
-        cp=run(c); out.append((cp.stdout+cp.stderr).strip()); ok = ok and (cp.returncode==0)
-    return [ActionResult("SYSCTL-1","Apply CIS sysctl hardening", True if changed else False, ok,
-                         notes="\n".join(o for o in out if o),
-                         commands=[shlex.join(c) for c in cmds], files=[path])]
+    results=[register(ActionResult("SYSCTL-1","Apply CIS sysctl hardening", False, True, commands=[]), kv)]
+    if bool(cfg.get("per_interface", False)) and offline():
+        results.append(ActionResult("SYSCTL-IF", "Apply CIS sysctl hardening to every network interface", False, True,
+                                    notes="Not checked for an offline root; interfaces inherit conf.default at boot", commands=[]))
+    elif bool(cfg.get("per_interface", False)):
+        results.append(enforce_interfaces(kv, dry_run, exclude=list(cfg.get("interface_exclude", []))))
+    return results
@@ -3,10 +3,15 @@ TCP Wrappers Configuration
 CIS Reference: 3.4.x series - TCP Wrappers
 """
 from typing import List, Dict, Any
-from .utils import ActionResult, run
+from .utils import ActionResult, run, rooted
+from .facts import HostFacts
 import os
 
-def apply(cfg: Dict[str, Any], dry_run: bool, profile: str) -> List[ActionResult]:
+READS = []
+WRITES = ["file:/etc/hosts.allow", "file:/etc/hosts.deny"]
+DEPENDS = []
+
+def apply(cfg: Dict[str, Any], dry_run: bool, profile: str, facts: HostFacts=None) -> List[ActionResult]:
     """
     Apply TCP Wrappers hardening:
     - Configure /etc/hosts.allow (explicit allow list)
@@ -60,28 +65,29 @@ def apply(cfg: Dict[str, Any], dry_run: bool, profile: str) -> List[ActionResult
         content = "\n".join(lines) + "\n"
         
         # Check if file needs updating
-        file_exists = os.path.exists(hosts_allow)
+        file_exists = os.path.exists(rooted(hosts_allow))
         current_content = ""
         
         if file_exists:
-            with open(hosts_allow, "r", encoding="utf-8") as f:
+            with open(rooted(hosts_allow), "r", encoding="utf-8") as f:
                 current_content = f.read()
         
         if current_content != content:
             if not dry_run:
                 # Backup existing file
                 if file_exists:
-                    run(["cp", hosts_allow, f"{hosts_allow}.backup"])
+                    run(["cp", rooted(hosts_allow), rooted(f"{hosts_allow}.backup")], mutating=True)
                 
                 # Write new file
-                with open(hosts_allow, "w", encoding="utf-8") as f:
+                with open(rooted(hosts_allow), "w", encoding="utf-8") as f:
                     f.write(content)
                 
-                os.chmod(hosts_allow, 0o644)
+                os.chmod(rooted(hosts_allow), 0o644)
                 changed = True
                 notes = "Created/updated /etc/hosts.allow"
             else:
-                notes = "Would create/update /etc/hosts.allow"
+                changed = True
+                notes = "DRY-RUN: Would create/update /etc/hosts.allow"
             
             commands.append(f"cat > {hosts_allow} << 'EOF'")
             files.append(hosts_allow)
@@ -132,28 +138,29 @@ def apply(cfg: Dict[str, Any], dry_run: bool, profile: str) -> List[ActionResult
         content = "\n".join(lines) + "\n"
         
         # Check if file needs updating
-        file_exists = os.path.exists(hosts_deny)
+        file_exists = os.path.exists(rooted(hosts_deny))
         current_content = ""
         
         if file_exists:
-            with open(hosts_deny, "r", encoding="utf-8") as f:
+            with open(rooted(hosts_deny), "r", encoding="utf-8") as f:
                 current_content = f.read()
         
         if current_content != content:
             if not dry_run:
                 # Backup existing file
                 if file_exists:
-                    run(["cp", hosts_deny, f"{hosts_deny}.backup"])
+                    run(["cp", rooted(hosts_deny), rooted(f"{hosts_deny}.backup")], mutating=True)
                 
                 # Write new file
-                with open(hosts_deny, "w", encoding="utf-8") as f:
+                with open(rooted(hosts_deny), "w", encoding="utf-8") as f:
                     f.write(content)
                 
-                os.chmod(hosts_deny, 0o644)
+                os.chmod(rooted(hosts_deny), 0o644)
                 changed = True
                 notes = "Created/updated /etc/hosts.deny with deny-all rule"
             else:
-                notes = "Would create/update /etc/hosts.deny"
+                changed = True
+                notes = "DRY-RUN: Would create/update /etc/hosts.deny"
             
             commands.append(f"cat > {hosts_deny} << 'EOF'")
             files.append(hosts_deny)
@@ -192,9 +199,9 @@ def apply(cfg: Dict[str, Any], dry_run: bool, profile: str) -> List[ActionResult
     
     try:
         # Check if tcp_wrappers library is installed
-        cmd_result = run(["ldd", "/usr/sbin/sshd"], capture_output=True)
+        cmd_result = run(["ldd", rooted("/usr/sbin/sshd")])
         
-        if cmd_result and "libwrap" in cmd_result:
+        if "libwrap" in cmd_result.stdout:
             notes = "SSH daemon compiled with TCP Wrappers support (libwrap)"
             commands.append("ldd /usr/sbin/sshd | grep libwrap")
         else:
@@ -0,0 +1,91 @@
+"""
+Trace-Event Recorder
+Collects spans in Chrome trace-event format (load the file in Perfetto or
+chrome://tracing) when enabled with --trace. Each span is a complete ("X")
+event on the thread that ran it:
+
+    with trace.span("ssh", "module"):
+        ...
+
+    @trace.traced("file", arg="path")
+    def write_file(path, ...): ...
+
+Commands are recorded by the executor from its CommandRecords, so their spans
+cover the process lifetime and note how long they queued for a slot.
+Recording is off by default and then costs a single flag check.
+"""
+from typing import List, Dict, Any, Callable
+from contextlib import contextmanager
+import os, json, functools, threading, time
+
+_LOCK = threading.Lock()
+_EVENTS: List[Dict[str, Any]] = []
+_THREADS: Dict[int, str] = {}
+_ENABLED = False
+
+def enable():
+    global _ENABLED
+    reset()
+    _ENABLED = True
+
+def enabled() -> bool:
+    return _ENABLED
+
+def reset():
+    with _LOCK:
+        _EVENTS.clear()
+        _THREADS.clear()
+
+def complete(name: str, cat: str, start: float, duration: float, args: Dict[str, Any] = None):
+    """Record a finished span; start is a time.time() value, duration in seconds"""
+    if not _ENABLED:
+        return
+    tid = threading.get_native_id()
+    ev = {"name": name, "cat": cat, "ph": "X", "pid": os.getpid(), "tid": tid,
+          "ts": round(start * 1e6, 3), "dur": round(max(duration, 0) * 1e6, 3)}
+    if args:
+        ev["args"] = args
+    with _LOCK:
+        _EVENTS.append(ev)
+        if tid not in _THREADS:
+            _THREADS[tid] = threading.current_thread().name
+
+@contextmanager
+def span(name: str, cat: str, **args):
+    """Record the enclosed block; yields the args dict so the block can add to it"""
+    if not _ENABLED:
+        yield args
+        return
+    t0, m0 = time.time(), time.monotonic()
+    try:
+        yield args
+    finally:
+        complete(name, cat, t0, time.monotonic() - m0, args)
+
+def traced(cat: str, arg: str = None) -> Callable:
+    """Decorator: one span per call, named after the function; `arg` names the first parameter to record"""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def inner(*a, **kw):
+            if not _ENABLED:
+                return fn(*a, **kw)
+            detail = {}
+            if arg is not None:
+                detail[arg] = kw[arg] if arg in kw else (a[0] if a else None)
+            with span(fn.__name__, cat, **detail):
+                return fn(*a, **kw)
+        return inner
+    return wrap
+
+def events() -> List[Dict[str, Any]]:
+    """Recorded events plus thread-name metadata, sorted by start time"""
+    with _LOCK:
+        evs = sorted(_EVENTS, key=lambda e: e["ts"])
+        meta = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": n}}
+                for tid, n in sorted(_THREADS.items())]
+    return meta + evs
+
+def save(path: str):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events(), "displayTimeUnit": "ms"}, f, default=str)
@@ -0,0 +1,137 @@
+"""
+Batched systemd Unit State Engine
+Reads LoadState/UnitFileState/ActiveState for all units of interest with one
+`systemctl show`, works out the minimal change set and applies it with one
+`systemctl <action> --now` call per action.
+
+For an offline root (--root) states come from `systemctl --root list-unit-files`
+and changes are made with `systemctl --root <action>`; nothing is running, so
+an enabled unit counts as satisfied and starts when the image boots.
+"""
+from typing import List, Dict, Iterable, Tuple
+from .utils import ActionResult, run, offline, rooted
+import shlex
+
+PROPERTIES = ["LoadState", "UnitFileState", "ActiveState"]
+ENABLED = ("enabled", "enabled-runtime", "static", "alias", "indirect", "generated")
+RUNNING = ("active", "activating", "reloading")
+ACTIONS = ("mask", "disable", "enable")
+DONE = {"mask": "masked", "disable": "disabled", "enable": "enabled"}
+
+def unit_name(name: str) -> str:
+    """Canonical unit name (bare service names get a .service suffix)"""
+    return name if "." in name else name + ".service"
+
+def systemctl(*args: str) -> List[str]:
+    return ["systemctl"] + ([f"--root={rooted('/')}"] if offline() else []) + list(args)
+
+def show_offline(names: List[str]) -> Dict[str, Dict[str, str]]:
+    """Unit-file states under the target root (one list-unit-files call)"""
+    states = {u: {"LoadState": "not-found", "UnitFileState": "", "ActiveState": "inactive"} for u in names}
+    try:
+        cp = run(systemctl("list-unit-files", "--no-legend", "--no-pager") + names)
+    except OSError:
+        return {u: {"LoadState": "unknown", "UnitFileState": "", "ActiveState": "unknown"} for u in names}
+    for ln in cp.stdout.splitlines():
+        parts = ln.split()
+        if len(parts) >= 2 and parts[0] in states:
+            states[parts[0]].update(LoadState="masked" if parts[1] == "masked" else "loaded", UnitFileState=parts[1])
+    return states
+
+def show(units: Iterable[str]) -> Dict[str, Dict[str, str]]:
+    """Query unit states with a single systemctl call"""
+    names = [unit_name(u) for u in units]
+    # "unknown" until systemd answers, so an unreachable manager never looks compliant
+    states = {u: {"LoadState": "unknown", "UnitFileState": "", "ActiveState": "unknown"} for u in names}
+    if not names:
+        return states
+    if offline():
+        return show_offline(names)
+    try:
+        cp = run(["systemctl", "show", "--no-pager", "-p", ",".join(PROPERTIES)] + names)
+    except OSError:
+        return states
+    # One block of properties per requested unit, in argument order
+    blocks = [b for b in cp.stdout.split("\n\n") if b.strip()]
+    for name, block in zip(names, blocks):
+        for ln in block.splitlines():
+            if "=" in ln:
+                k, v = ln.split("=", 1)
+                states[name][k] = v
+    return states
+
+def satisfied(state: Dict[str, str], desired: str) -> bool:
+    load, ufs, active = state.get("LoadState", ""), state.get("UnitFileState", ""), state.get("ActiveState", "")
+    if load == "unknown":
+        return False
+    if desired == "enable":
+        return load == "loaded" and ufs in ENABLED and (active in RUNNING or offline())
+    if load == "not-found":
+        return True  # nothing to disable or mask
+    if desired == "mask":
+        return load == "masked" and active not in RUNNING
+    if desired == "disable":
+        return ufs not in ("enabled", "enabled-runtime") and active not in RUNNING
+    raise ValueError("state")
+
+def plan(desired: Dict[str, str], states: Dict[str, Dict[str, str]]) -> Dict[str, List[str]]:
+    """Minimal {action: [units]} needed to reach the desired states"""
+    todo: Dict[str, List[str]] = {a: [] for a in ACTIONS}
+    for unit, want in desired.items():
+        if not satisfied(states[unit], want):
+            todo[want].append(unit)
+    return {a: u for a, u in todo.items() if u}
+
+def ensure_units(specs: List[Tuple[str, str, str, str]], dry_run: bool, results: List[ActionResult], facts=None):
+    """
+    Bring units to their desired state in one batch
+    specs: [(unit, "enable"|"disable"|"mask", control_id, title), ...]
+    Appends one ActionResult per spec, in order.
+    """
+    desired = {}
+    for unit, want, _, _ in specs:
+        if want not in ACTIONS:
+            raise ValueError("state")
+        desired[unit_name(unit)] = want
+    if facts is not None:
+        states = facts.unit_status(*desired)
+    else:
+        states = show(desired)
+    todo = plan(desired, states)
+    cmds = {a: systemctl(a) + ([] if offline() else ["--now"]) + u for a, u in todo.items()}
+
+    outcome: Dict[str, Tuple[bool, str]] = {}
+    if dry_run:
+        for a, c in cmds.items():
+            for u in todo[a]:
+                outcome[u] = (True, "DRY-RUN: would run " + shlex.join(c))
+    elif cmds:
+        out = {}
+        for a, c in cmds.items():
+            cp = run(c, mutating=True)
+            out[a] = (cp.returncode == 0, (cp.stdout + cp.stderr).strip())
+        if facts is not None:
+            facts.invalidate("units")
+        # Re-check only if a batch failed, to attribute the failure to units
+        after = show([u for a, (ok, _) in out.items() if not ok for u in todo[a]])
+        for a, units in todo.items():
+            ok, text = out[a]
+            for u in units:
+                reached = ok or satisfied(after[u], a)
+                outcome[u] = (reached, text)
+
+    for unit, want, rid, title in specs:
+        name = unit_name(unit)
+        st = states[name]
+        if name in outcome:
+            ok, text = outcome[name]
+            changed = True if dry_run else ok
+            results.append(ActionResult(rid, title, changed, ok, notes=text, commands=[shlex.join(cmds[want])]))
+        elif want == "enable" and st["LoadState"] in ("not-found", "unknown"):
+            # In dry-run the package providing the unit may not be installed yet
+            ok = True if dry_run else False
+            results.append(ActionResult(rid, title, False, ok, notes=f"{name} is not installed", commands=[]))
+        else:
+            results.append(ActionResult(rid, title, False, True,
+                                        notes=f"{name} already {DONE[want]} ({st['UnitFileState'] or st['LoadState']}, {st['ActiveState']})",
+                                        commands=[]))
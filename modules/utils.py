@@ -1,74 +1,222 @@
 
-import os, subprocess, shlex, re, stat
-from dataclasses import dataclass
+import os, subprocess, shlex, re, stat, errno, tempfile, glob
 from typing import List, Dict, Tuple, Any
+from . import accounting, executor, trace
+
+NOTES_MAX = 4096  # characters of notes kept per result; long command output keeps its head and tail
 
-@dataclass
 class ActionResult:
-    id: str
-    title: str
-    changed: bool
-    ok: bool
-    notes: str = ""
-    commands: List[str] = None
-    files: List[str] = None
+    """
+    Outcome of one control. A plain __slots__ class rather than a dataclass:
+    runs produce thousands of these, so each one costs a fixed handful of
+    slots and no per-instance dict, and notes are capped at NOTES_MAX.
+    """
+    # Constructor arguments, in order
+    FIELDS = ("id", "title", "changed", "ok", "notes", "commands", "files",
+              "started", "duration", "subprocesses", "bytes_read", "bytes_written")
+    __slots__ = ("id", "title", "changed", "ok", "_notes", "commands", "files", "started", "duration",
+                 "subprocesses", "bytes_read", "bytes_written", "cis_control")
+
+    def __init__(self, id: str, title: str, changed: bool, ok: bool, notes: str = "",
+                 commands: List[str] = None, files: List[str] = None, started: float = None,
+                 duration: float = 0.0, subprocesses: int = 0, bytes_read: int = 0, bytes_written: int = 0,
+                 cis_control: str = None):
+        self.id = id
+        self.title = title
+        self.changed = changed
+        self.ok = ok
+        self.notes = notes
+        self.commands = commands
+        self.files = files
+        self.started = started
+        self.duration = duration
+        self.subprocesses = subprocesses
+        self.bytes_read = bytes_read
+        self.bytes_written = bytes_written
+        self.cis_control = cis_control
+        # Charge the work done since the previous result of this module to this control
+        if started is None:
+            c = accounting.current()
+            if c is not None:
+                for k, v in c.take().items():
+                    setattr(self, k, v)
+
+    @property
+    def notes(self) -> str:
+        return self._notes
+
+    @notes.setter
+    def notes(self, value: str):
+        if value and len(value) > NOTES_MAX:
+            keep = NOTES_MAX // 2
+            value = f"{value[:keep]}\n[... {len(value) - 2 * keep} characters omitted ...]\n{value[-keep:]}"
+        self._notes = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Report form; cis_control only appears once a control has been mapped"""
+        d = {k: getattr(self, k) for k in self.FIELDS}
+        if self.cis_control is not None:
+            d["cis_control"] = self.cis_control
+        return d
+
+    def __repr__(self) -> str:
+        return f"ActionResult(id={self.id!r}, changed={self.changed!r}, ok={self.ok!r})"
+
+# Target root: "/" is the live host; anything else is an offline image or
+# chroot (--root). Modules keep using absolute host paths and the file helpers
+# below resolve them under ROOT.
+ROOT = "/"
 
-def run(cmd: List[str], check: bool=False) -> subprocess.CompletedProcess:
-    return subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=check)
+MAXSYMLINKS = 40  # as the kernel's path walk
+
+def set_root(path: str):
+    global ROOT
+    ROOT = os.path.realpath(path)
+
+def offline() -> bool:
+    """True when hardening an alternate root, where nothing is running"""
+    return ROOT != "/"
+
+def rooted(path: str, follow: bool = True) -> str:
+    """
+    Where the absolute host path `path` lives under the target root.
+    Symlinks inside the target are resolved chroot-style: an absolute link
+    target starts again at ROOT and `..` stops at ROOT, so an image's
+    /etc/pam.d/system-auth -> /etc/authselect/system-auth never reaches the
+    build host's files. With follow=False a link in the last component is
+    not resolved (for O_NOFOLLOW/lstat callers).
+    """
+    if ROOT == "/":
+        return path
+    todo = [p for p in reversed(path.split("/")) if p and p != "."]
+    done: List[str] = []
+    links = 0
+    while todo:
+        name = todo.pop()
+        if name == "..":
+            if done:
+                done.pop()
+            continue
+        cur = os.path.join(ROOT, *done, name)
+        if (todo or follow) and os.path.islink(cur):
+            links += 1
+            if links > MAXSYMLINKS:
+                raise OSError(errno.ELOOP, "Too many levels of symbolic links", path)
+            target = os.readlink(cur)
+            if target.startswith("/"):
+                done = []
+            todo += [p for p in reversed(target.split("/")) if p and p != "."]
+            continue
+        done.append(name)
+    real = os.path.join(ROOT, *done)
+    return real + "/" if path.endswith("/") and done else real
+
+def root_glob(pattern: str) -> List[str]:
+    """glob.glob() under the target root; matches are returned as paths inside the target"""
+    if ROOT == "/":
+        return glob.glob(pattern)
+    return ["/" + os.path.relpath(p, ROOT) for p in glob.glob(rooted(pattern))]
+
+def dnf_cmd(*args: str) -> List[str]:
+    return ["dnf"] + ([f"--installroot={ROOT}"] if offline() else []) + list(args)
+
+def run(cmd: List[str], check: bool=False, input: str=None, timeout: float=None, mutating: bool=False) -> subprocess.CompletedProcess:
+    """Run through the run-wide executor (timeouts, concurrency limit, output caps, timing)"""
+    return executor.get().run(cmd, check=check, input=input, timeout=timeout, mutating=mutating)
 
 def is_root() -> bool:
     return os.geteuid() == 0
 
-def ensure_pkg(pkgs: List[str], dry_run: bool, results: List[ActionResult], rid: str, title: str):
-    cmd = ["dnf","-y","install"] + pkgs
-    if dry_run:
-        results.append(ActionResult(rid, title, False, True, notes="DRY-RUN: would run " + shlex.join(cmd), commands=[shlex.join(cmd)]))
+def ensure_pkg(pkgs: List[str], dry_run: bool, results: List[ActionResult], rid: str, title: str, facts=None):
+    from . import pkgplan
+    plan = pkgplan.active()
+    if plan is not None and plan.covers(pkgs):
+        changed, ok, notes = plan.outcome(pkgs, "install", dry_run)
+        results.append(ActionResult(rid, title, changed, ok, notes=notes, commands=plan.commands if changed else []))
         return
-    cp = run(cmd)
+    if facts is not None:
+        present = {p for p in pkgs if facts.installed(p)}
+    else:
+        from .rpmdb import installed
+        present = installed(pkgs)
+    missing = [p for p in pkgs if p not in present]
+    if not missing:
+        results.append(ActionResult(rid, title, False, True, notes="Already installed: " + " ".join(pkgs), commands=[]))
+        return
+    cmd = dnf_cmd("-y","install", *missing)
+    cp = executor.get(dry_run).run(cmd, mutating=True)
     ok = (cp.returncode==0)
     results.append(ActionResult(rid, title, True if ok else False, ok, notes=(cp.stdout+cp.stderr).strip(), commands=[shlex.join(cmd)]))
 
-def ensure_service_enabled(service: str, dry_run: bool, results: List[ActionResult], rid: str, title: str, state: str="enable"):
-    if state=="enable":
-        cmds=[["systemctl","enable","--now",service]]
-    elif state=="disable":
-        cmds=[["systemctl","disable","--now",service]]
-    elif state=="mask":
-        cmds=[["systemctl","mask","--now",service]]
-    else:
-        raise ValueError("state")
-    if dry_run:
-        results.append(ActionResult(rid, title, False, True, notes="DRY-RUN: would run "+ " && ".join(shlex.join(c) for c in cmds), commands=[shlex.join(c) for c in cmds]))
-        return
-    out=[]
-    ok=True
-    for c in cmds:
-        cp=run(c)
-        out.append((cp.stdout+cp.stderr).strip())
-        ok = ok and (cp.returncode==0)
-    results.append(ActionResult(rid, title, True if ok else False, ok, notes="\n".join(out), commands=[shlex.join(c) for c in cmds]))
+def ensure_service_enabled(service: str, dry_run: bool, results: List[ActionResult], rid: str, title: str, state: str="enable", facts=None):
+    from .units import ensure_units
+    ensure_units([(service, state, rid, title)], dry_run, results, facts=facts)
+
+@trace.traced("file", arg="path")
+def atomic_write(path: str, content: str, mode: int=None):
+    """
+    Replace path with content via a temp file in the same directory, fsync and
+    rename. An existing file's mode, owner and SELinux context are preserved
+    unless an explicit mode is given; new files default to 0644.
+    path is taken as is (not resolved under the target root). A symlink is
+    followed and the file it points to is replaced, so links such as the
+    authselect-managed /etc/pam.d/system-auth stay links.
+    """
+    path = os.path.realpath(path)
+    d = os.path.dirname(path) or "."
+    os.makedirs(d, exist_ok=True)
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        st = None
+    fd, tmp = tempfile.mkstemp(prefix="." + os.path.basename(path) + ".", dir=d)
+    try:
+        data = content.encode("utf-8")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        accounting.add(bytes_written=len(data))
+        os.chmod(tmp, mode if mode is not None else (stat.S_IMODE(st.st_mode) if st else 0o644))
+        if st is not None:
+            try:
+                os.chown(tmp, st.st_uid, st.st_gid)
+            except PermissionError:
+                pass
+            try:
+                os.setxattr(tmp, "security.selinux", os.getxattr(path, "security.selinux"))
+            except OSError:
+                pass
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+    dfd = os.open(d, os.O_RDONLY)
+    try:
+        os.fsync(dfd)
+    finally:
+        os.close(dfd)
 
+@trace.traced("file", arg="path")
 def write_file(path: str, content: str, mode: int=0o644, dry_run: bool=False) -> Tuple[bool,str]:
     existing=None
-    if os.path.exists(path):
-        with open(path,"r",encoding="utf-8",errors="ignore") as f:
+    real=rooted(path)
+    if os.path.exists(real):
+        with open(real,"r",encoding="utf-8",errors="ignore") as f:
             existing=f.read()
+        accounting.add(bytes_read=len(existing))
     if existing == content:
         return False, "No change"
     if dry_run:
         return True, "DRY-RUN: would write " + path
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path,"w",encoding="utf-8") as f:
-        f.write(content)
-    os.chmod(path, mode)
+    atomic_write(real, content, mode)
     return True, "Wrote " + path
 
-def ensure_kv_in_file(path: str, key: str, value: str, sep: str=" ", comment_prefix: str="#", dry_run: bool=False) -> Tuple[bool,str]:
-    lines=[]
+def set_kv(content: str, key: str, value: str, sep: str=" ", comment_prefix: str="#") -> Tuple[str, bool]:
+    """Set every uncommented `key` line to key+sep+value (appending if absent); returns (content, changed)"""
+    lines=content.splitlines()
     changed=False
-    if os.path.exists(path):
-        with open(path,"r",encoding="utf-8",errors="ignore") as f:
-            lines=f.read().splitlines()
     pat=re.compile(r'^\s*' + re.escape(key) + r'\b')
     new_lines=[]
     found=False
@@ -83,20 +231,22 @@ def ensure_kv_in_file(path: str, key: str, value: str, sep: str=" ", comment_pre
     if not found:
         new_lines.append(f"{key}{sep}{value}")
         changed=True
-    new_content="\n".join(new_lines).rstrip()+"\n"
     if not changed:
-        return False, "No change"
-    if dry_run:
-        return True, f"DRY-RUN: would update {path}: {key}"
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path,"w",encoding="utf-8") as f:
-        f.write(new_content)
-    return True, f"Updated {path}: {key}"
+        return content, False
+    return "\n".join(new_lines).rstrip()+"\n", True
+
+@trace.traced("file", arg="path")
+def ensure_kv_in_file(path: str, key: str, value: str, sep: str=" ", comment_prefix: str="#", dry_run: bool=False) -> Tuple[bool,str]:
+    from .filetx import FileTransaction
+    with FileTransaction(dry_run) as tx:
+        return tx.set_kv(path, key, value, sep=sep, comment_prefix=comment_prefix)
 
+@trace.traced("file", arg="path")
 def ensure_perm(path: str, mode: int, owner_uid: int=0, owner_gid: int=0, dry_run: bool=False) -> Tuple[bool,str]:
-    if not os.path.exists(path):
+    real=rooted(path)
+    if not os.path.exists(real):
         return False, f"Not found: {path}"
-    st=os.stat(path)
+    st=os.stat(real)
     changed=False
     notes=[]
     if stat.S_IMODE(st.st_mode) != mode:
@@ -109,9 +259,9 @@ def ensure_perm(path: str, mode: int, owner_uid: int=0, owner_gid: int=0, dry_ru
         return False, "No change"
     if dry_run:
         return True, "DRY-RUN: would set " + path + " " + ", ".join(notes)
-    os.chmod(path, mode)
+    os.chmod(real, mode)
     try:
-        os.chown(path, owner_uid, owner_gid)
+        os.chown(real, owner_uid, owner_gid)
     except PermissionError:
         pass
     return True, "Set " + path + " " + ", ".join(notes)
@@ -0,0 +1,46 @@
+import os, sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules import filetx, firstboot, postactions, sysctl, utils
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+@pytest.fixture(autouse=True)
+def _clean_state():
+    """Every test starts on the live root with empty run-wide registries"""
+    utils.set_root("/")
+    for registry in (postactions, sysctl, firstboot):
+        registry.reset()
+    with filetx._CACHE_LOCK:
+        filetx._CACHE.clear()
+    yield
+    utils.set_root("/")
+
+@pytest.fixture
+def root(tmp_path):
+    """An empty offline target root (--root)"""
+    utils.set_root(str(tmp_path))
+    return tmp_path
+
+@pytest.fixture
+def deep_tree():
+    """Builds a chain of nested directories and removes it without recursion"""
+    made = []
+    def build(top, depth):
+        fd = os.open(top, os.O_RDONLY)
+        for _ in range(depth):
+            os.mkdir("d", dir_fd=fd)
+            sub = os.open("d", os.O_RDONLY, dir_fd=fd)
+            os.close(fd)
+            fd = sub
+        os.close(fd)
+        made.append(os.path.join(top, "d"))
+    yield build
+    for top in made:
+        while os.path.isdir(os.path.join(top, "d")):
+            os.rename(os.path.join(top, "d"), top + ".next")
+            os.rmdir(top)
+            os.rename(top + ".next", top)
+        os.rmdir(top)
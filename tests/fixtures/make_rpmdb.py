@@ -0,0 +1,58 @@
+"""
+Builds tests/fixtures/rpmdb.sqlite, a small database in the layout rpm 4.16+
+uses on EL9: header blobs in Packages and (key, hnum, idx) index tables.
+rpm stores some index keys as BLOBs, so a few names are written that way.
+
+    python3 tests/fixtures/make_rpmdb.py
+"""
+import os, sqlite3, struct
+
+PACKAGES = [
+    ("bash", "5.1.8", "9.el9", "x86_64", ["bash", "/bin/sh"]),
+    ("audit", "3.1.2", "2.el9", "x86_64", ["audit"]),
+    ("aide", "0.16", "102.el9", "x86_64", ["aide"]),
+    ("kernel", "5.14.0", "427.el9", "x86_64", ["kernel"]),
+    ("kernel", "5.14.0", "503.el9", "x86_64", ["kernel"]),
+    ("sudo", "1.9.5p2", "10.el9", "x86_64", ["sudo"]),
+    ("rsyslog", "8.2310.0", "4.el9", "x86_64", ["rsyslog", "syslog"]),
+]
+BLOB_KEYS = {"sudo", "rsyslog"}
+
+STRING, STRING_ARRAY = 6, 8
+NAME, VERSION, RELEASE, ARCH, PROVIDENAME = 1000, 1001, 1002, 1022, 1047
+
+def header(tags):
+    """An rpm header blob: entry count, data size, index entries, data"""
+    index, data = b"", b""
+    for tag, typ, values in sorted(tags):
+        index += struct.pack(">iiii", tag, typ, len(data), len(values))
+        data += b"".join(v.encode() + b"\0" for v in values)
+    return struct.pack(">ii", len(tags), len(data)) + index + data
+
+def build(path):
+    if os.path.exists(path):
+        os.unlink(path)
+    db = sqlite3.connect(path)
+    db.executescript("""
+        CREATE TABLE 'Packages' (hnum INTEGER PRIMARY KEY AUTOINCREMENT, blob BLOB NOT NULL);
+        CREATE TABLE 'Name' (key 'TEXT' NOT NULL, hnum INTEGER NOT NULL, idx INTEGER NOT NULL,
+                             FOREIGN KEY (hnum) REFERENCES 'Packages'(hnum));
+        CREATE TABLE 'Providename' (key 'TEXT' NOT NULL, hnum INTEGER NOT NULL, idx INTEGER NOT NULL,
+                                    FOREIGN KEY (hnum) REFERENCES 'Packages'(hnum));
+        CREATE INDEX 'Name_key_idx' ON 'Name'(key ASC);
+        CREATE INDEX 'Providename_key_idx' ON 'Providename'(key ASC);
+    """)
+    for name, version, release, arch, provides in PACKAGES:
+        blob = header([(NAME, STRING, [name]), (VERSION, STRING, [version]), (RELEASE, STRING, [release]),
+                       (ARCH, STRING, [arch]), (PROVIDENAME, STRING_ARRAY, provides)])
+        hnum = db.execute("INSERT INTO Packages (blob) VALUES (?)", (blob,)).lastrowid
+        db.execute("INSERT INTO Name VALUES (?, ?, 0)",
+                   (name.encode() if name in BLOB_KEYS else name, hnum))
+        db.executemany("INSERT INTO Providename VALUES (?, ?, ?)",
+                       [(p, hnum, i) for i, p in enumerate(provides)])
+    db.commit()
+    db.execute("VACUUM")
+    db.close()
+
+if __name__ == "__main__":
+    build(os.path.join(os.path.dirname(os.path.abspath(__file__)), "rpmdb.sqlite"))
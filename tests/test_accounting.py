@@ -0,0 +1,23 @@
+import sys
+from modules import accounting, executor
+from modules.utils import ActionResult
+
+def test_commands_run_concurrently_count_in_the_callers_scope():
+    ex = executor.Executor()
+    with accounting.scope() as acc:
+        cps = ex.run_many([[sys.executable, "-c", f"print({i})"] for i in range(3)])
+        ex.run([sys.executable, "-c", "pass"])
+        r = ActionResult("X-1", "x", False, True)
+    assert [cp.stdout for cp in cps] == ["0\n", "1\n", "2\n"]
+    assert acc.subprocesses == 4 and r.subprocesses == 4
+
+def test_nested_scopes_roll_up():
+    with accounting.scope() as outer:
+        accounting.add(bytes_read=10)
+        with accounting.scope() as inner:
+            accounting.add(subprocesses=1, bytes_written=5)
+        first = ActionResult("X-1", "x", False, True)
+        second = ActionResult("X-2", "x", False, True)
+    assert (inner.subprocesses, inner.bytes_written) == (1, 5)
+    assert (outer.subprocesses, outer.bytes_read, outer.bytes_written) == (1, 10, 5)
+    assert (first.subprocesses, first.bytes_read, second.bytes_read) == (1, 10, 0)
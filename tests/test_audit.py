@@ -0,0 +1,97 @@
+from modules import audit
+
+RULES_D = """\
+-D
+-b 8192
+-a always,exit -F arch=b64 -S adjtimex -S settimeofday -k time-change
+-w /etc/localtime -p wa -k time-change
+-a always,exit -F arch=b64 -S clock_settime -k time-change
+-a always,exit -F arch=b64 -S chmod,fchmod -F auid>=1000 -F auid!=unset -k perm_mod
+-a always,exit -F arch=b64 -S chmod,fchmod -F auid>=1000 -F auid!=unset -k perm_mod
+-w /etc/localtime -p r -k time-change
+-e 2
+"""
+
+# What `auditctl -l` prints once the compiled file above is loaded: keys as
+# -F key=, unset ids as -1, syscalls in table order and no control lines
+AUDITCTL_L = """\
+-w /etc/localtime -p rwa -k time-change
+-a always,exit -F arch=b64 -S adjtimex,settimeofday,clock_settime -F key=time-change
+-a always,exit -F arch=b64 -S chmod,fchmod -F auid>=1000 -F auid!=-1 -F key=perm_mod
+"""
+
+def test_compile_merges_and_dedupes():
+    text, report = audit.compile_rules(RULES_D)
+    lines = text.splitlines()[1:]
+    assert lines == [
+        "-D",
+        "-b 8192",
+        "-w /etc/localtime -p rwa -k time-change",
+        "-a always,exit -F arch=b64 -S adjtimex,clock_settime,settimeofday -k time-change",
+        "-a always,exit -F arch=b64 -S chmod,fchmod -F auid>=1000 -F auid!=4294967295 -k perm_mod",
+        "-e 2",
+    ]
+    assert report[0] == "9 rules compiled to 6: 3 merged or duplicate, 0 dropped"
+
+def test_compiled_rules_match_auditctl_listing():
+    compiled, _ = audit.compile_rules(RULES_D)
+    assert audit.canonical(compiled) == audit.canonical(AUDITCTL_L)
+
+def test_cis_rules_compile_to_a_fixed_point():
+    once, _ = audit.compile_rules(audit.RULES)
+    assert audit.compile_rules(once)[0] == once
+    assert audit.canonical(once) == audit.canonical(audit.compile_rules(once)[0])
+
+def test_listing_differs_when_a_rule_is_missing():
+    compiled, _ = audit.compile_rules(RULES_D)
+    listed = "\n".join(AUDITCTL_L.splitlines()[:-1])
+    assert audit.canonical(compiled) != audit.canonical(listed)
+
+def test_no_merge_across_a_never_rule():
+    text, _ = audit.compile_rules(
+        "-a always,exit -F arch=b64 -S open -F auid>=1000 -k x\n"
+        "-a never,exit -F arch=b64 -S openat -F path=/tmp/x\n"
+        "-a always,exit -F arch=b64 -S openat -F auid>=1000 -k x\n")
+    assert text.splitlines()[1:] == [
+        "-a always,exit -F arch=b64 -S open -F auid>=1000 -k x",
+        "-a never,exit -F arch=b64 -S openat -F path=/tmp/x",
+        "-a always,exit -F arch=b64 -S openat -F auid>=1000 -k x",
+    ]
+
+def test_syscalls_missing_from_the_arch_are_dropped():
+    text, report = audit.compile_rules(
+        "-a always,exit -F arch=b32 -S stime,clock_settime -k time-change\n"
+        "-a always,exit -F arch=b64 -S stime -k time-change\n")
+    assert text.splitlines()[1:] == ["-a always,exit -F arch=b32 -S clock_settime,stime -k time-change"]
+    assert "not on b64: stime (dropped from time-change)" in report
+    assert report[0].endswith("1 dropped")
+
+class Completed:
+    def __init__(self, stdout, returncode=0):
+        self.stdout, self.stderr, self.returncode = stdout, "", returncode
+
+class Auditctl:
+    """Answers `auditctl -l` and `-s` for a kernel with immutable rules"""
+    def __init__(self, listed):
+        self.listed = listed
+    def run(self, cmd, mutating=False):
+        return Completed(self.listed if cmd[-1] == "-l" else "enabled 2\nfailure 1\n")
+
+def immutable_host(root, monkeypatch, merged):
+    (root / "etc/audit/rules.d").mkdir(parents=True)
+    (root / "etc/audit/rules.d/99-cis-hardening.rules").write_text(audit.compile_rules(RULES_D)[0])
+    (root / "etc/audit/audit.rules").write_text(merged)
+    monkeypatch.setattr(audit, "offline", lambda: False)
+    monkeypatch.setattr(audit.executor, "get", lambda dry_run: Auditctl(AUDITCTL_L.splitlines()[0] + "\n"))
+
+def test_immutable_kernel_is_pending_reboot_not_compliant(root, monkeypatch):
+    immutable_host(root, monkeypatch, audit.compile_rules(RULES_D)[0])
+    r = audit.ensure_rules_loaded({}, dry_run=False)
+    assert (r.changed, r.ok) == (True, True) and "Pending reboot" in r.notes
+    assert audit.postactions.pending() == []
+
+def test_immutable_kernel_still_regenerates_stale_audit_rules(root, monkeypatch):
+    immutable_host(root, monkeypatch, "")
+    r = audit.ensure_rules_loaded({}, dry_run=False)
+    assert (r.changed, r.ok) == (True, True) and "Pending reboot" in r.notes
+    assert audit.postactions.pending() == ["regen-audit-rules"]
@@ -0,0 +1,31 @@
+import subprocess, sys, time
+import pytest
+from modules import executor
+
+def test_dry_run_skips_mutating_commands():
+    ex = executor.Executor(dry_run=True)
+    cp = ex.run(["/nonexistent/grub2-mkconfig"], mutating=True)
+    assert cp.returncode == 0 and "grub2-mkconfig" in cp.stdout
+    assert ex.run([sys.executable, "-c", "print('read')"]).stdout == "read\n"
+
+def test_missing_binary_raises_oserror():
+    with pytest.raises(OSError):
+        executor.Executor().run(["/nonexistent/auditctl", "-l"])
+
+def test_timeout_kills_the_command():
+    t0 = time.monotonic()
+    cp = executor.Executor(timeout=0.5).run([sys.executable, "-c", "import time; time.sleep(30)"])
+    assert cp.returncode == executor.TIMEOUT_RC
+    assert time.monotonic() - t0 < 10
+
+def test_output_is_capped():
+    cp = executor.Executor(max_output=1000).run([sys.executable, "-c", "print('x' * 100000)"])
+    assert len(cp.stdout) == 1000 and "truncated" in cp.stderr
+
+def test_output_that_exactly_fills_the_cap_is_not_truncated():
+    cp = executor.Executor(max_output=1000).run([sys.executable, "-c", "print('x' * 999)"])
+    assert len(cp.stdout) == 1000 and cp.stderr == ""
+
+def test_check_raises_on_failure():
+    with pytest.raises(subprocess.CalledProcessError):
+        executor.Executor().run([sys.executable, "-c", "raise SystemExit(3)"], check=True)
@@ -0,0 +1,57 @@
+import pytest
+from modules import filetx
+from modules.filetx import FileTransaction
+
+@pytest.fixture
+def writes(monkeypatch):
+    calls = []
+    real = filetx.atomic_write
+    def counting(path, content, mode=None):
+        calls.append(path)
+        real(path, content, mode)
+    monkeypatch.setattr(filetx, "atomic_write", counting)
+    return calls
+
+def test_edits_to_one_file_are_written_once(root, writes):
+    (root / "etc/systemd").mkdir(parents=True)
+    conf = root / "etc/systemd/journald.conf"
+    conf.write_text("[Journal]\n#Storage=auto\n")
+    with FileTransaction() as tx:
+        assert tx.set_kv("/etc/systemd/journald.conf", "Storage", "persistent", sep="=")[0]
+        assert tx.set_kv("/etc/systemd/journald.conf", "Compress", "yes", sep="=")[0]
+        assert not tx.set_kv("/etc/systemd/journald.conf", "Storage", "persistent", sep="=")[0]
+        assert writes == []
+    assert writes == [str(conf)]
+    assert conf.read_text().splitlines() == ["[Journal]", "#Storage=auto", "Storage=persistent", "Compress=yes"]
+
+def test_unchanged_files_are_not_written(root, writes):
+    (root / "etc").mkdir()
+    (root / "etc/motd").write_text("hello\n")
+    with FileTransaction() as tx:
+        tx.write("/etc/motd", "changed\n")
+        tx.write("/etc/motd", "hello\n")
+    assert writes == []
+
+def test_dry_run_writes_nothing(root, writes):
+    (root / "etc").mkdir()
+    with FileTransaction(dry_run=True) as tx:
+        changed, note = tx.write("/etc/issue", "Authorized uses only\n")
+        assert changed and note.startswith("DRY-RUN")
+    assert tx.flush() == {"/etc/issue": (True, "DRY-RUN: would write /etc/issue")}
+    assert writes == [] and not (root / "etc/issue").exists()
+
+def test_exception_discards_the_transaction(root, writes):
+    (root / "etc").mkdir()
+    with pytest.raises(RuntimeError):
+        with FileTransaction() as tx:
+            tx.write("/etc/issue", "x\n")
+            raise RuntimeError
+    assert writes == []
+
+def test_reads_are_cached_until_the_file_changes(root):
+    (root / "etc").mkdir()
+    f = root / "etc/login.defs"
+    f.write_text("PASS_MAX_DAYS 99999\n")
+    assert filetx.read_cached("/etc/login.defs") == "PASS_MAX_DAYS 99999\n"
+    f.write_text("PASS_MAX_DAYS 365\n")
+    assert filetx.read_cached("/etc/login.defs") == "PASS_MAX_DAYS 365\n"
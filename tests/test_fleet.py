@@ -0,0 +1,57 @@
+import json, sys
+import pytest
+from modules import fleet
+
+class ScriptTransport(fleet.Transport):
+    """Runs a small Python script per host instead of the runner"""
+    name = "script"
+
+    def __init__(self, scripts):
+        self.scripts = scripts
+
+    def command(self, host, args):
+        return [sys.executable, "-c", self.scripts[host.name]]
+
+def report(ok):
+    return f"import json; print(json.dumps({{'ok': {ok}, 'execution': {{'total_controls': 2, 'passed': 1}}}}))"
+
+def test_transport_must_implement_command():
+    class Incomplete(fleet.Transport):
+        pass
+    with pytest.raises(TypeError):
+        Incomplete()
+
+def test_load_inventory_formats(tmp_path):
+    yml = tmp_path / "inv.yaml"
+    yml.write_text("hosts:\n  - web1\n  - {name: db1, address: 10.0.0.5, user: admin, rack: 4}\n")
+    hosts = fleet.load_inventory(str(yml))
+    assert [h.target() for h in hosts] == ["web1", "admin@10.0.0.5"]
+    assert hosts[1].vars == {"rack": 4}
+    txt = tmp_path / "hosts.txt"
+    txt.write_text("web1  # frontend\n\nweb2\n")
+    assert [h.name for h in fleet.load_inventory(str(txt))] == ["web1", "web2"]
+    txt.write_text("web1\nweb1\n")
+    with pytest.raises(ValueError):
+        fleet.load_inventory(str(txt))
+
+def test_run_fleet_reports_every_host():
+    scripts = {"good": report(True), "bad": report(False), "broken": "print('not json')",
+               "slow": "import time; time.sleep(30)"}
+    hosts = [fleet.Host(name=n) for n in scripts]
+    entries = {e["host"]: e for e in fleet.run_fleet(hosts, ScriptTransport(scripts), [], jobs=4, timeout=1)}
+    assert {h: e["status"] for h, e in entries.items()} == {"good": "ok", "bad": "failed", "broken": "error",
+                                                             "slow": "timeout"}
+    assert entries["good"]["summary"] == {"mode": None, "total_controls": 2, "passed": 1}
+
+def test_tally_keeps_bounded_samples(monkeypatch):
+    monkeypatch.setattr(fleet, "FAILED_SAMPLE", 3)
+    tally = fleet.Tally()
+    for i in range(50):
+        tally.add({"host": f"h{i:02}", "status": "ok" if i % 2 else "failed", "ok": bool(i % 2),
+                   "duration": float(i), "summary": {"total_controls": 2, "passed": 1, "failed": 1}})
+    d = tally.to_dict(1.0)
+    assert d["hosts"] == 50 and d["statuses"] == {"failed": 25, "ok": 25}
+    assert d["failed_host_count"] == 25 and d["failed_hosts"] == ["h00", "h02", "h04"]
+    assert [s["host"] for s in d["slowest_hosts"]] == [f"h{i}" for i in range(49, 39, -1)]
+    assert d["controls"] == {"total": 100, "passed": 50, "failed": 50, "compliance_percentage": 50.0}
+    json.dumps(d)
@@ -0,0 +1,83 @@
+import os, stat
+import pytest
+from modules import fsscan, utils
+
+@pytest.fixture
+def image(root):
+    (root / "etc").mkdir()
+    (root / "etc/passwd").write_text("root:x:0:0:root:/root:/bin/bash\n")
+    (root / "etc/group").write_text("root:x:0:\n")
+    (root / "usr/bin").mkdir(parents=True)
+    (root / "usr/bin/su").write_text("")
+    os.chmod(root / "usr/bin/su", 0o4755)
+    (root / "tmp").mkdir()
+    os.chmod(root / "tmp", 0o1777)
+    (root / "pub").mkdir()
+    os.chmod(root / "pub", 0o777)
+    (root / "pub/notes").write_text("")
+    os.chmod(root / "pub/notes", 0o666)
+    return root
+
+def paths(entries):
+    return [e.path for e in entries]
+
+@pytest.mark.skipif(os.geteuid() != 0, reason="ownership is checked against uid 0")
+def test_scan_finds_each_kind(image):
+    inv = fsscan.scan()
+    assert paths(inv.privileged) == ["/usr/bin/su"]
+    assert paths(inv.unsticky) == ["/pub"]
+    assert paths(inv.world_writable) == ["/pub/notes"]
+    assert inv.unowned == [] and inv.ungrouped == []
+
+def test_exclude_skips_a_subtree(image):
+    inv = fsscan.scan(exclude=["/pub"])
+    assert paths(inv.unsticky) == [] and paths(inv.world_writable) == []
+
+def test_dry_run_scan_leaves_no_cache(image):
+    fsscan.scan(dry_run=True)
+    assert not os.path.exists(utils.rooted(fsscan.CACHE))
+    fsscan.scan()
+    assert os.path.exists(utils.rooted(fsscan.CACHE))
+
+def test_warm_scan_sees_new_files(image):
+    fsscan.scan()
+    (image / "usr/bin/newgrp").write_text("")
+    os.chmod(image / "usr/bin/newgrp", 0o4755)
+    inv = fsscan.scan()
+    assert not inv.full
+    assert paths(inv.privileged) == ["/usr/bin/newgrp", "/usr/bin/su"]
+
+def test_secure_refuses_a_replaced_file(image):
+    inv = fsscan.scan()
+    entry = next(e for e in inv.world_writable if e.path == "/pub/notes")
+    os.rename(image / "pub/notes", image / "pub/old")
+    (image / "pub/notes").write_text("")
+    os.chmod(image / "pub/notes", 0o666)
+    with pytest.raises(OSError):
+        fsscan._secure(entry)
+    assert stat.S_IMODE(os.stat(image / "pub/notes").st_mode) == 0o666
+
+def test_deep_tree_is_reported_not_fatal(image, deep_tree):
+    deep_tree(str(image / "tmp"), 1200)
+    inv = fsscan.scan(use_cache=False, dry_run=True)
+    assert paths(inv.privileged) == ["/usr/bin/su"]
+    assert len(inv.errors) == 1 and "levels deep, not walked" in inv.errors[0]
+
+def test_findings_are_non_compliant_not_failed(image):
+    res = {r.id: r for r in fsscan.apply({}, dry_run=False, profile="l1-server")}
+    assert (res["FS-1"].changed, res["FS-1"].ok) == (True, True)
+    assert "/pub/notes" in res["FS-1"].notes and "Not changed" in res["FS-1"].notes
+    assert stat.S_IMODE(os.stat(image / "pub/notes").st_mode) == 0o666
+
+    res = {r.id: r for r in fsscan.apply({"fix_world_writable": True}, dry_run=False, profile="l1-server")}
+    assert (res["FS-1"].changed, res["FS-1"].ok) == (True, True)
+    assert stat.S_IMODE(os.stat(image / "pub/notes").st_mode) == 0o664
+    res = {r.id: r for r in fsscan.apply({}, dry_run=False, profile="l1-server")}
+    assert (res["FS-1"].changed, res["FS-1"].ok) == (False, True)
+
+@pytest.mark.skipif(os.geteuid() != 0, reason="needs chown")
+def test_unowned_files_are_reported_not_failed(image):
+    os.chown(image / "pub/notes", 4242, 4242)
+    fs2 = next(r for r in fsscan.apply({}, dry_run=True, profile="l1-server") if r.id == "FS-2")
+    assert (fs2.changed, fs2.ok) == (True, True)
+    assert "unowned: /pub/notes" in fs2.notes
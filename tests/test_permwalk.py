@@ -0,0 +1,66 @@
+import os, stat
+from modules import permwalk
+from modules.permwalk import Rule
+
+def tree(top, paths):
+    for p in paths:
+        full = top / p
+        if p.endswith("/"):
+            full.mkdir(parents=True, exist_ok=True)
+        else:
+            full.parent.mkdir(parents=True, exist_ok=True)
+            full.write_text("")
+
+def walked(top, **kw):
+    seen, errors = [], []
+    fd = os.open(top, permwalk.DIR_FLAGS)
+    try:
+        def visit(dfd, rel):
+            seen.append(rel)
+            return sorted(e.name for e in os.scandir(dfd) if e.is_dir(follow_symlinks=False))
+        permwalk.walk(fd, visit, errors, **kw)
+    finally:
+        os.close(fd)
+    return seen, errors
+
+def open_fds():
+    return len(os.listdir("/proc/self/fd"))
+
+def test_walk_is_depth_first_in_listing_order(tmp_path):
+    tree(tmp_path, ["a/x/", "a/y/1/", "b/", "c/z/"])
+    os.symlink("a", tmp_path / "link")
+    assert walked(tmp_path) == (["", "a/", "a/x/", "a/y/", "a/y/1/", "b/", "c/", "c/z/"], [])
+
+def test_walk_reopens_closed_ancestors(tmp_path):
+    tree(tmp_path, ["a/b/c/d/e/", "a/b/c/d/f/", "a/b/g/", "h/"])
+    before = open_fds()
+    seen, errors = walked(tmp_path, max_open=2)
+    assert seen == ["", "a/", "a/b/", "a/b/c/", "a/b/c/d/", "a/b/c/d/e/", "a/b/c/d/f/", "a/b/g/", "h/"]
+    assert errors == [] and open_fds() == before
+
+def test_deep_trees_are_cut_off_not_recursed(tmp_path, deep_tree):
+    deep_tree(str(tmp_path), 1200)
+    before = open_fds()
+    seen, errors = walked(tmp_path, max_depth=100, max_open=8)
+    assert len(seen) == 101 and len(errors) == 1
+    assert errors[0].endswith(": more than 100 levels deep, not walked")
+    assert open_fds() == before
+
+def test_enforce_removes_extra_bits_by_first_matching_rule(root):
+    (root / "etc").mkdir()
+    (root / "etc/passwd").write_text("root:x:0:0::/root:/bin/bash\n")
+    (root / "etc/group").write_text("root:x:0:\nutmp:x:22:\n")
+    tree(root / "var/log", ["wtmp", "audit/audit.log", "messages"])
+    for name, mode in [("wtmp", 0o666), ("audit/audit.log", 0o644), ("messages", 0o600)]:
+        os.chmod(root / "var/log" / name, mode)
+    rules = [Rule("LOG-6", "Login records", ("wtmp",), 0o664), Rule("LOG-7", "Log files", ("*",), 0o640)]
+
+    dry = permwalk.enforce("/var/log", rules, dry_run=True)
+    assert [(r.id, r.changed, r.ok) for r in dry] == [("LOG-6", True, True), ("LOG-7", True, True)]
+    assert stat.S_IMODE(os.stat(root / "var/log/wtmp").st_mode) == 0o666
+
+    res = permwalk.enforce("/var/log", rules, dry_run=False)
+    assert all(r.ok for r in res)
+    modes = {n: stat.S_IMODE(os.stat(root / "var/log" / n).st_mode) for n in ("wtmp", "audit/audit.log", "messages")}
+    assert modes == {"wtmp": 0o664, "audit/audit.log": 0o640, "messages": 0o600}
+    assert [r.changed for r in permwalk.enforce("/var/log", rules, dry_run=False)] == [False, False]
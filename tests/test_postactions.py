@@ -0,0 +1,42 @@
+from modules import postactions
+from modules.utils import ActionResult
+
+def result(rid, changed=True):
+    return ActionResult(rid, rid, changed, True)
+
+def test_unchanged_results_queue_nothing():
+    assert not postactions.request("reload:sshd.service", result("SSH-1", changed=False))
+    assert postactions.pending() == []
+
+def test_plan_dedupes_and_folds_weaker_unit_verbs():
+    a, b, c, d = result("A"), result("B"), result("C"), result("D")
+    for name, r in [("reload:sshd.service", a), ("restart:sshd.service", b), ("reload:sshd.service", a),
+                    ("reload-firewalld", c), ("daemon-reload", d)]:
+        postactions.request(name, r)
+    with postactions._LOCK:
+        queue = dict(postactions._QUEUE)
+    plan = postactions.plan(queue)
+    assert [(action, cmd) for action, cmd, _ in plan] == [
+        ("daemon-reload", ["systemctl", "daemon-reload"]),
+        ("restart:sshd.service", ["systemctl", "restart", "sshd.service"]),
+        ("reload-firewalld", ["firewall-cmd", "--reload"]),
+    ]
+    assert plan[1][2] == [b, a]
+
+def test_flush_runs_each_action_once_and_fails_its_triggers(monkeypatch):
+    monkeypatch.setitem(postactions.ACTIONS, "load-audit-rules", (["/nonexistent/augenrules"], "Load audit rules"))
+    a, b = result("AUD-3"), result("AUD-4")
+    postactions.request("load-audit-rules", a)
+    postactions.request("load-audit-rules", b)
+    assert postactions.holds(a)
+    out = postactions.flush(dry_run=False)
+    assert [(r.id, r.ok) for r in out] == [("POST-LOAD-AUDIT-RULES", False)]
+    assert not a.ok and not b.ok
+    assert postactions.pending() == [] and not postactions.holds(a)
+
+def test_dry_run_flush_starts_nothing():
+    r = result("SSH-1")
+    postactions.request("restart:sshd.service", r)
+    out = postactions.flush(dry_run=True)
+    assert [(p.id, p.ok) for p in out] == [("POST-RESTART-SSHD.SERVICE", True)]
+    assert "DRY-RUN" in out[0].notes and r.ok
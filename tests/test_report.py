@@ -0,0 +1,45 @@
+import json
+import cis_apply_enhanced as runner
+from modules.utils import ActionResult
+
+def result(rid, changed, ok, duration):
+    return ActionResult(rid, rid, changed, ok, started=0.0, duration=duration)
+
+RESULTS = [result("A-1", True, True, 0.5), result("A-2", False, True, 2.0), result("B-1", True, False, 2.0),
+           result("B-2", False, True, 0.1)]
+
+def test_counts_match_the_full_report():
+    full = runner.generate_report("l1-server", False, RESULTS, False, {})
+    counts = runner.ResultCounts()
+    counts.add(RESULTS[:2])
+    counts.add(RESULTS[2:])
+    trailer = runner.generate_report("l1-server", False, [], False, {}, timings={}, include_results=False,
+                                     counts=counts)
+    assert trailer["execution"] == full["execution"] == {"total_controls": 4, "passed": 3, "failed": 1,
+                                                          "compliance_percentage": 75.0}
+    assert trailer["remediation"] == full["remediation"]
+    assert [c["id"] for c in trailer["timing"]["slowest_controls"]] == ["A-2", "B-1", "A-1", "B-2"]
+
+def test_verify_counts_only_compliant_controls():
+    counts = runner.ResultCounts(verify=True)
+    counts.add(RESULTS)
+    assert (counts.total, counts.passed, counts.remediated) == (4, 2, 0)
+
+def test_slowest_keeps_the_top_n():
+    counts = runner.ResultCounts(n=2, timing_rows=True)
+    counts.add(RESULTS)
+    assert [c["id"] for c in counts.slowest()] == ["A-2", "B-1"]
+    assert [row["id"] for row in counts.timing_rows] == ["A-1", "A-2", "B-1", "B-2"]
+
+def test_jsonl_report_streams_results_then_the_trailer(tmp_path):
+    path = tmp_path / "report.jsonl"
+    stream = runner.JsonlReport(str(path))
+    stream.write("a", RESULTS[:2])
+    stream.write("b", RESULTS[2:])
+    stream.close(runner.generate_report("l1-server", False, [], False, {}, include_results=False,
+                                        counts=stream.counts))
+    lines = [json.loads(ln) for ln in path.read_text().splitlines()]
+    assert [(ln["type"], ln.get("module"), ln.get("id")) for ln in lines] == [
+        ("result", "a", "A-1"), ("result", "a", "A-2"), ("result", "b", "B-1"), ("result", "b", "B-2"),
+        ("summary", None, None)]
+    assert lines[-1]["execution"]["total_controls"] == 4 and stream.count == 4
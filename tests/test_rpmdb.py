@@ -0,0 +1,36 @@
+import os, shutil
+from conftest import FIXTURES
+from modules import rpmdb
+
+DB = os.path.join(FIXTURES, "rpmdb.sqlite")
+
+def test_all_installed_names():
+    assert rpmdb.installed(dbpath=DB) == {"bash", "audit", "aide", "kernel", "sudo", "rsyslog"}
+
+def test_subset_of_names():
+    assert rpmdb.installed(["aide", "telnet", "sudo", "rsyslog", "kernel"], dbpath=DB) == {"aide", "sudo", "rsyslog",
+                                                                                          "kernel"}
+    assert rpmdb.installed([], dbpath=DB) == set()
+
+def test_provides_are_not_package_names():
+    assert rpmdb.installed(["syslog", "/bin/sh"], dbpath=DB) == set()
+
+def test_the_fixture_is_opened_read_only(tmp_path):
+    db = tmp_path / "rpmdb.sqlite"
+    shutil.copy(DB, db)
+    os.chmod(db, 0o444)
+    before = db.read_bytes()
+    assert "bash" in rpmdb.query_sqlite(str(db), ["bash"])
+    assert db.read_bytes() == before
+
+def test_found_under_the_target_root(root):
+    (root / "usr/lib/sysimage/rpm").mkdir(parents=True)
+    shutil.copy(DB, root / "usr/lib/sysimage/rpm/rpmdb.sqlite")
+    assert rpmdb.find_rpmdb() == str(root / "usr/lib/sysimage/rpm/rpmdb.sqlite")
+    assert rpmdb.installed(["audit", "telnet"]) == {"audit"}
+
+def test_unreadable_database_falls_back_to_rpm(tmp_path, monkeypatch):
+    bad = tmp_path / "rpmdb.sqlite"
+    bad.write_bytes(b"not a database")
+    monkeypatch.setattr(rpmdb, "query_rpm", lambda names=None: {"from-rpm"})
+    assert rpmdb.installed(["bash"], dbpath=str(bad)) == {"from-rpm"}
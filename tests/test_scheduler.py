@@ -0,0 +1,66 @@
+import threading, time
+from types import SimpleNamespace
+import pytest
+from modules import scheduler
+
+def mod(reads=(), writes=(), depends=()):
+    return SimpleNamespace(READS=list(reads), WRITES=list(writes), DEPENDS=list(depends))
+
+def test_depends_reorders_and_keeps_profile_order_otherwise():
+    mods = {"a": mod(depends=["c"]), "b": mod(), "c": mod()}
+    assert scheduler.order(["a", "b", "c"], mods) == ["b", "c", "a"]
+
+def test_circular_depends_are_rejected():
+    mods = {"a": mod(depends=["b"]), "b": mod(depends=["a"])}
+    with pytest.raises(ValueError):
+        scheduler.order(["a", "b"], mods)
+
+def test_writers_wait_for_earlier_readers_and_writers():
+    mods = {
+        "ssh": mod(writes=["file:/etc/ssh/sshd_config"]),
+        "crypto": mod(reads=["file:/etc/ssh/"]),
+        "banners": mod(writes=["file:/etc/issue"]),
+        "sysctl": mod(writes=["sysctl"]),
+        "network": mod(reads=["sysctl"]),
+    }
+    preds = scheduler.plan(list(mods), mods)
+    assert preds == {"ssh": set(), "crypto": {"ssh"}, "banners": set(), "sysctl": set(), "network": {"sysctl"}}
+
+def test_modules_without_declarations_touch_everything():
+    mods = {"a": mod(writes=["pkg:aide"]), "legacy": SimpleNamespace(), "b": mod(reads=["unit:x"])}
+    assert scheduler.plan(list(mods), mods) == {"a": set(), "legacy": {"a"}, "b": {"legacy"}}
+
+def test_run_respects_the_plan():
+    mods = {
+        "w1": mod(writes=["file:/etc/a"]),
+        "w2": mod(writes=["file:/etc/a"]),
+        "r": mod(reads=["file:/etc/"], depends=["other"]),
+        "other": mod(writes=["unit:x"]),
+        "free": mod(reads=["pkg:y"]),
+    }
+    spans, lock = {}, threading.Lock()
+
+    def fn(name, m):
+        start = time.monotonic()
+        time.sleep(0.02)
+        with lock:
+            spans[name] = (start, time.monotonic())
+        return name.upper()
+
+    outcome = scheduler.run(list(mods), mods, fn, jobs=4)
+    assert outcome == {m: (m.upper(), None) for m in mods}
+    for m, preds in scheduler.plan(list(mods), mods).items():
+        for p in preds:
+            assert spans[p][1] <= spans[m][0], f"{m} started before {p} finished"
+    # independent modules did overlap
+    assert spans["free"][0] < spans["w1"][1]
+
+def test_run_reports_errors_per_module():
+    mods = {"bad": mod(), "good": mod()}
+    def fn(name, m):
+        if name == "bad":
+            raise RuntimeError("boom")
+        return 1
+    outcome = scheduler.run(list(mods), mods, fn, jobs=2)
+    assert outcome["good"] == (1, None)
+    assert isinstance(outcome["bad"][1], RuntimeError)
@@ -0,0 +1,69 @@
+import importlib, sys
+import pytest
+from modules import state
+from modules.facts import HostFacts
+from modules.utils import ActionResult
+
+@pytest.fixture
+def package(tmp_path, monkeypatch):
+    """A throwaway modules-style package: mod imports helper, helper imports base"""
+    pkg = tmp_path / "fakemods"
+    pkg.mkdir()
+    (pkg / "base.py").write_text("X = 1\n")
+    (pkg / "helper.py").write_text("from .base import X\n")
+    (pkg / "mod.py").write_text("from . import helper\nREADS = []\nWRITES = []\n")
+    (pkg / "other.py").write_text("Y = 2\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setattr(state, "_SOURCES", {})
+    yield pkg
+    for name in [m for m in sys.modules if m.startswith("fakemods")]:
+        del sys.modules[name]
+
+def test_source_hash_follows_imports(package, monkeypatch):
+    mod = importlib.import_module("fakemods.mod")
+    before = state.source_hash(mod)
+    assert before
+    (package / "other.py").write_text("Y = 3\n")
+    monkeypatch.setattr(state, "_SOURCES", {})
+    assert state.source_hash(mod) == before
+    (package / "base.py").write_text("X = 2\n")
+    monkeypatch.setattr(state, "_SOURCES", {})
+    assert state.source_hash(mod) != before
+
+def test_unchanged_module_reuses_its_results(root, package):
+    mod = importlib.import_module("fakemods.mod")
+    (root / "etc").mkdir()
+    (root / "etc/issue").write_text("banner\n")
+    facts = HostFacts()
+    res = [ActionResult("BAN-1", "Banner", False, True, files=["/etc/issue"])]
+    store = state.StateStore()
+    store.record("mod", mod, {"a": 1}, "l1", False, res, [state.to_dict(r) for r in res], {}, facts)
+    store.save()
+
+    again = state.StateStore().load()
+    cached, _ = again.lookup("mod", mod, {"a": 1}, "l1", False, facts)
+    assert [r.id for r in cached] == ["BAN-1"] and again.reused == ["mod"]
+    assert again.lookup("mod", mod, {"a": 2}, "l1", False, facts)[0] is None
+    (root / "etc/issue").write_text("changed banner\n")
+    assert again.lookup("mod", mod, {"a": 1}, "l1", False, facts)[0] is None
+
+def test_changed_or_failed_results_are_not_cached(root, package):
+    mod = importlib.import_module("fakemods.mod")
+    facts = HostFacts()
+    store = state.StateStore()
+    for res in ([ActionResult("X-1", "x", True, True)], [ActionResult("X-1", "x", False, False)]):
+        store.record("mod", mod, {}, "l1", False, res, [state.to_dict(r) for r in res], {}, facts)
+        assert store.lookup("mod", mod, {}, "l1", False, facts)[0] is None
+
+def test_declared_directories_are_fingerprinted(root, package):
+    (package / "kmods.py").write_text('READS = ["file:/etc/modprobe.d/", "file:/proc/cmdline"]\nWRITES = []\n')
+    mod = importlib.import_module("fakemods.kmods")
+    (root / "etc/modprobe.d").mkdir(parents=True)
+    (root / "etc/modprobe.d/cis-disable-usb-storage.conf").write_text("install usb-storage /bin/false\n")
+    facts = HostFacts()
+    res = [ActionResult("KERN-1", "Disable modules", False, True)]
+    store = state.StateStore()
+    store.record("kmods", mod, {}, "l1", False, res, [state.to_dict(r) for r in res], {}, facts)
+    assert store.lookup("kmods", mod, {}, "l1", False, facts)[0] is not None
+    (root / "etc/modprobe.d/cis-disable-usb-storage.conf").unlink()
+    assert store.lookup("kmods", mod, {}, "l1", False, facts)[0] is None
@@ -0,0 +1,66 @@
+import errno, os, stat
+import pytest
+from modules.utils import ActionResult, atomic_write, rooted, set_kv, write_file
+
+def test_rooted_is_identity_on_the_live_host():
+    assert rooted("/etc/../etc/passwd") == "/etc/../etc/passwd"
+
+def test_rooted_resolves_absolute_links_inside_the_root(root):
+    (root / "etc/authselect").mkdir(parents=True)
+    (root / "etc/pam.d").mkdir()
+    os.symlink("/etc/authselect/system-auth", root / "etc/pam.d/system-auth")
+    assert rooted("/etc/pam.d/system-auth") == str(root / "etc/authselect/system-auth")
+
+def test_rooted_stops_dotdot_at_the_root(root):
+    (root / "etc").mkdir()
+    os.symlink("../../../../etc/shadow", root / "etc/escape")
+    assert rooted("/etc/escape") == str(root / "etc/shadow")
+    assert rooted("/../../etc/passwd") == str(root / "etc/passwd")
+
+def test_rooted_resolves_directory_links_mid_path(root):
+    (root / "usr/lib").mkdir(parents=True)
+    os.symlink("usr/lib", root / "lib")
+    assert rooted("/lib/modprobe.d/") == str(root / "usr/lib/modprobe.d") + "/"
+
+def test_rooted_keeps_the_last_link_without_follow(root):
+    os.symlink("/etc/shadow", root / "link")
+    assert rooted("/link", follow=False) == str(root / "link")
+
+def test_rooted_refuses_link_loops(root):
+    os.symlink("/b", root / "a")
+    os.symlink("/a", root / "b")
+    with pytest.raises(OSError) as e:
+        rooted("/a")
+    assert e.value.errno == errno.ELOOP
+
+def test_atomic_write_replaces_the_link_target(tmp_path):
+    target = tmp_path / "real.conf"
+    target.write_text("old\n")
+    os.chmod(target, 0o640)
+    link = tmp_path / "link.conf"
+    os.symlink("real.conf", link)
+    atomic_write(str(link), "new\n")
+    assert os.path.islink(link)
+    assert target.read_text() == "new\n"
+    assert stat.S_IMODE(os.stat(target).st_mode) == 0o640
+
+def test_write_file_dry_run_leaves_the_file(root):
+    changed, note = write_file("/etc/issue", "Authorized uses only\n", dry_run=True)
+    assert changed and note.startswith("DRY-RUN")
+    assert not (root / "etc/issue").exists()
+    changed, _ = write_file("/etc/issue", "Authorized uses only\n")
+    assert changed and (root / "etc/issue").read_text() == "Authorized uses only\n"
+    assert write_file("/etc/issue", "Authorized uses only\n")[0] is False
+
+def test_set_kv_is_idempotent_and_appends_missing():
+    new, changed = set_kv("#Storage=auto\nCompress=no\n", "Storage", "persistent", sep="=")
+    assert changed and "Storage=persistent" in new.splitlines()
+    new, changed = set_kv(new, "Storage", "persistent", sep="=")
+    assert not changed
+    new, changed = set_kv(new, "Seal", "yes", sep="=")
+    assert changed and new.splitlines()[-1] == "Seal=yes"
+
+def test_long_notes_keep_head_and_tail():
+    r = ActionResult("X-1", "x", False, True, notes="a" * 5000 + "END")
+    assert len(r.notes) < 5000 and r.notes.startswith("a") and r.notes.endswith("END")
+    assert r.to_dict()["notes"] == r.notes